@@ -1,10 +1,31 @@
 import json
+from urllib.parse import parse_qs
 
+from asgiref.sync import sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
 
+from msg.constants import REPLAY_BATCH_SIZE
+from msg.models import Email, MessageData
+from msg.services import build_email_data
+
 
 class MyConsumer(AsyncWebsocketConsumer):
+    """
+    Консьюмер уведомлений о новых письмах.
+
+    Клиент может передать в строке запроса `email` (почтовый ящик) и
+    `since` (идентификатор последнего полученного письма). Тогда после
+    подключения из базы данных пачками досылаются пропущенные письма,
+    а затем консьюмер переходит к событиям в реальном времени, пропуская
+    уже отправленные письма.
+    """
+
     async def connect(self):
+        query = parse_qs(self.scope.get('query_string', b'').decode())
+        self.account_id = None
+        self.since = None
+        self.replayed_ids = set()
+
         await self.channel_layer.group_add(
             "new_mail_goup",
             self.channel_name
@@ -15,6 +36,42 @@ class MyConsumer(AsyncWebsocketConsumer):
             'message': 'Подключение установлено!'
         }))
 
+        email = query.get('email', [None])[0]
+        since = query.get('since', [''])[0]
+        if email:
+            account = await Email.objects.filter(email=email).afirst()
+            self.account_id = account.id if account else None
+        if self.account_id and since.isdigit():
+            self.since = int(since)
+            await self.replay_missed()
+
+    async def replay_missed(self):
+        """
+        Досылает письма ящика с идентификатором больше курсора.
+
+        Данные писем пачки собираются в синхронном потоке: для сжатых
+        текстов может понадобиться запрос словаря к базе данных.
+        """
+        last_id = self.since
+        while True:
+            batch = [
+                message async for message in MessageData.objects.filter(
+                    email_id=self.account_id, id__gt=last_id
+                ).select_related('body').order_by('id')[:REPLAY_BATCH_SIZE]
+            ]
+            emails = await sync_to_async(
+                lambda: [build_email_data(message) for message in batch]
+            )()
+            for message, email_data in zip(batch, emails):
+                self.replayed_ids.add(message.id)
+                await self.send(text_data=json.dumps({
+                    'type': 'email',
+                    'email_data': email_data
+                }))
+            if len(batch) < REPLAY_BATCH_SIZE:
+                return
+            last_id = batch[-1].id
+
     async def disconnect(self, close_code):
         await self.channel_layer.group_discard(
             "new_mail_goup",
@@ -30,6 +87,12 @@ class MyConsumer(AsyncWebsocketConsumer):
 
     async def send_email(self, event):
         email_data = event['email_data']
+        if self.account_id and email_data.get('account') != self.account_id:
+            return
+        if email_data.get('id') in self.replayed_ids:
+            return
+        if self.since is not None and email_data.get('id', 0) <= self.since:
+            return
         await self.send(text_data=json.dumps({
             'type': 'email',
             'email_data': email_data
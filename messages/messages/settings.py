@@ -32,7 +32,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'msg.middleware.AsyncWhiteNoiseMiddleware',
+    'msg.middleware.ReplicaRoutingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -75,6 +76,21 @@ CHANNEL_LAYERS = {
     },
 }
 
+# Кеш страниц: Redis, если задан CACHE_URL, иначе память процесса
+CACHE_URL = os.getenv("CACHE_URL")
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': CACHE_URL,
+    } if CACHE_URL else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
+LIST_CACHE_TIMEOUT = int(os.getenv("LIST_CACHE_TIMEOUT", 300))
+# Версии списков писем меняет процесс синхронизации, поэтому кеш страниц
+# и ответы 304 включаются только с общим кешем: в памяти процесса
+# веб-сервер не увидел бы новых версий
+LIST_CACHE = bool(CACHE_URL)
 
 DATABASES = {
     "default": {
@@ -87,6 +103,26 @@ DATABASES = {
     }
 }
 
+# Реплики только для чтения: хосты через запятую, например
+# "replica1:5432,replica2". Чтение GET-запросов идет на реплики,
+# запись и задачи синхронизации — в основную базу
+for number, replica in enumerate(
+        filter(None, os.getenv("DB_REPLICA_HOSTS", "").split(",")), 1):
+    replica_host, _, replica_port = replica.strip().partition(":")
+    DATABASES[f"replica_{number}"] = {
+        **DATABASES["default"],
+        "HOST": replica_host,
+        "PORT": replica_port or DATABASES["default"]["PORT"],
+        "TEST": {"MIRROR": "default"},
+    }
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != "default"]
+DATABASE_ROUTERS = ['msg.routers.ReplicaRouter']
+# Допустимое отставание реплики и период его проверки, с
+REPLICA_MAX_LAG = float(os.getenv("REPLICA_MAX_LAG", 5))
+REPLICA_LAG_CHECK_INTERVAL = 5
+# Сколько секунд клиент читает из основной базы после записи
+REPLICA_PIN_SECONDS = 15
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -116,6 +152,15 @@ MEDIA_ROOT = BASE_DIR / "media"
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Режим админки для больших таблиц писем
+ADMIN_HIGH_VOLUME = os.getenv("ADMIN_HIGH_VOLUME") == "True"
+
+# Сжатие текстов новых писем словарями ящика и отправителя
+# (словари обучает `manage.py recompress_bodies`)
+BODY_COMPRESSION = os.getenv("BODY_COMPRESSION") == "True"
+# Более короткие тексты хранятся без сжатия, символов
+BODY_COMPRESSION_MIN_SIZE = 256
+
 # Настройки Celery
 CELERY_BROKER_URL = 'redis://localhost:6379/0'  # URL брокера сообщений
 CELERY_RESULT_BACKEND = 'redis://localhost:6379/0'  # Хранение результатов
@@ -123,3 +168,24 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'Europe/Moscow'
+# Интерактивная синхронизация и фоновая догрузка писем обрабатываются
+# разными очередями, чтобы догрузка не задерживала открытие страниц
+CELERY_TASK_ROUTES = {
+    'msg.services.get_data_and_send_to_ws': {'queue': 'interactive'},
+    'msg.services.backfill_messages': {'queue': 'backfill'},
+}
+
+# Обработчик синхронизации почты: celery, embedded (пул потоков
+# в процессе приложения, для небольших установок и тестов) или leases
+# (узлы `manage.py sync_node` делят ящики между собой по арендам)
+SYNC_BACKEND = os.getenv("SYNC_BACKEND", "celery")
+EMBEDDED_WORKER_THREADS = int(os.getenv("EMBEDDED_WORKER_THREADS", 4))
+EMBEDDED_WORKER_QUEUE_SIZE = int(os.getenv("EMBEDDED_WORKER_QUEUE_SIZE", 100))
+EMBEDDED_WORKER_SHUTDOWN_TIMEOUT = 30
+# Сколько секунд фоновая догрузка ждет интерактивную синхронизацию
+SYNC_PREEMPT_TIMEOUT = 300
+# Аренда ящиков узлами синхронизации, с
+SYNC_NODE_NAME = os.getenv("SYNC_NODE_NAME", "")
+SYNC_LEASE_TIMEOUT = 60
+SYNC_HEARTBEAT_INTERVAL = 15
+SYNC_INTERVAL = 300
@@ -1,6 +1,95 @@
+from django.conf import settings
 from django.contrib import admin
+from django.db.models import Q
+from django.db.models.functions import Substr
 
-from .models import Email, MessageData, MessageFile
+from .constants import PREVIEW_LEGTH
+from .models import (CompressionDictionary, DailyStat, Email, IngestRule,
+                     MessageBody, MessageData, MessageFile, MessageThread,
+                     SenderStat, SyncNode, SyncRun, SyncState)
+from .paginators import EstimatedCountPaginator
+
+
+class EmailAccountFilter(admin.SimpleListFilter):
+    """
+    Фильтр по почтовому ящику.
+
+    Варианты берутся из таблицы почт, а не через SELECT DISTINCT
+    по таблице писем.
+    """
+
+    title = 'Почта'
+    parameter_name = 'account'
+    field_path = 'email_id'
+
+    def lookups(self, request, model_admin):
+        return Email.objects.values_list('id', 'email')
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(**{self.field_path: self.value()})
+        return queryset
+
+
+class MessageFileAccountFilter(EmailAccountFilter):
+    """Фильтр файлов по почтовому ящику письма."""
+
+    field_path = 'message__email_id'
+
+
+class HighVolumeAdminMixin:
+    """
+    Режим админки для больших таблиц.
+
+    Включается настройкой `ADMIN_HIGH_VOLUME`: вместо `COUNT(*)`
+    используется приблизительный подсчет, поиск выполняется только
+    точным совпадением по индексированным полям, а фильтры и сортировка
+    не требуют обхода всей таблицы.
+    """
+
+    high_volume_list_filter = ()
+    high_volume_search_fields = ()
+
+    @property
+    def show_full_result_count(self):
+        return not settings.ADMIN_HIGH_VOLUME
+
+    def get_paginator(self, request, queryset, per_page, orphans=0,
+                      allow_empty_first_page=True):
+        if settings.ADMIN_HIGH_VOLUME:
+            return EstimatedCountPaginator(
+                queryset, per_page, orphans, allow_empty_first_page
+            )
+        return super().get_paginator(
+            request, queryset, per_page, orphans, allow_empty_first_page
+        )
+
+    def get_list_filter(self, request):
+        if settings.ADMIN_HIGH_VOLUME:
+            return self.high_volume_list_filter
+        return super().get_list_filter(request)
+
+    def get_ordering(self, request):
+        if settings.ADMIN_HIGH_VOLUME:
+            return ('-id',)
+        return super().get_ordering(request)
+
+    def get_search_results(self, request, queryset, search_term):
+        if not settings.ADMIN_HIGH_VOLUME:
+            return super().get_search_results(request, queryset, search_term)
+        search_term = search_term.strip()
+        if not search_term or not self.high_volume_search_fields:
+            return queryset, False
+        query = Q()
+        for field in self.high_volume_search_fields:
+            query |= Q(**{field: search_term})
+        return queryset.filter(query), False
+
+
+class IngestRuleInline(admin.TabularInline):
+    model = IngestRule
+    extra = 0
+    fields = ("kind", "action", "value", "is_regex", "is_active",)
 
 
 @admin.register(Email)
@@ -13,31 +102,211 @@ class EmailAdmin(admin.ModelAdmin):
     )
     search_fields = ("email",)
     list_filter = ("email",)
+    inlines = (IngestRuleInline,)
 
 
 @admin.register(MessageData)
-class MessageDataAdmin(admin.ModelAdmin):
+class MessageDataAdmin(HighVolumeAdminMixin, admin.ModelAdmin):
     list_display = (
         "id",
         "email",
         "email_from",
-        "title",
+        "short_title",
         "dispatch_date",
         "receipt_date",
-        "text",
+        "short_text",
         "msg_read",
         "files",
     )
-    search_fields = ("email",)
-    list_filter = ("email",)
+    list_select_related = ("email",)
+    search_fields = ("email__email", "email_from", "title",)
+    list_filter = (EmailAccountFilter,)
+    autocomplete_fields = ("email",)
+    high_volume_list_filter = (EmailAccountFilter,)
+    high_volume_search_fields = ("uid", "email__email", "body__message_id",)
+
+    def get_queryset(self, request):
+        # Несжатый текст обрезается в базе данных, сжатые тела
+        # распаковываются при выводе
+        return super().get_queryset(request).annotate(
+            text_preview=Substr('body__plain_text', 1, PREVIEW_LEGTH),
+        ).select_related('body').defer('body__plain_text')
+
+    @admin.display(description='Тема сообщения')
+    def short_title(self, obj):
+        return (obj.title or '')[:PREVIEW_LEGTH]
+
+    @admin.display(description='Текст сообщения')
+    def short_text(self, obj):
+        if obj.body and obj.body.compressed_text is not None:
+            return (obj.text or '')[:PREVIEW_LEGTH]
+        return obj.text_preview
+
+
+@admin.register(MessageBody)
+class MessageBodyAdmin(HighVolumeAdminMixin, admin.ModelAdmin):
+    list_display = (
+        "id",
+        "message_id",
+        "content_hash",
+        "codec",
+        "dictionary",
+        "created_at",
+    )
+    search_fields = ("message_id", "content_hash",)
+    high_volume_search_fields = ("message_id",)
+    readonly_fields = ("body_text", "codec", "dictionary",)
+    fields = (
+        "message_id",
+        "content_hash",
+        "body_text",
+        "codec",
+        "dictionary",
+    )
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).defer(
+            'plain_text', 'compressed_text'
+        )
+
+    @admin.display(description='Текст сообщения')
+    def body_text(self, obj):
+        return obj.text
 
 
 @admin.register(MessageFile)
-class MessageFileAdmin(admin.ModelAdmin):
+class MessageFileAdmin(HighVolumeAdminMixin, admin.ModelAdmin):
     list_display = (
         "id",
         "message",
         "file",
     )
-    search_fields = ("message",)
-    list_filter = ("message",)
+    list_select_related = ("message",)
+    search_fields = ("message__title",)
+    list_filter = (MessageFileAccountFilter,)
+    autocomplete_fields = ("message",)
+    high_volume_list_filter = (MessageFileAccountFilter,)
+    high_volume_search_fields = ("message__uid",)
+
+
+@admin.register(SyncNode)
+class SyncNodeAdmin(admin.ModelAdmin):
+    list_display = (
+        "name",
+        "heartbeat_at",
+        "created_at",
+    )
+
+
+@admin.register(SyncState)
+class SyncStateAdmin(admin.ModelAdmin):
+    list_display = (
+        "email",
+        "owner",
+        "lease_expires_at",
+        "requested_at",
+        "last_synced_at",
+    )
+    list_select_related = ("email",)
+    search_fields = ("email__email", "owner",)
+    list_filter = ("owner",)
+
+
+@admin.register(SyncRun)
+class SyncRunAdmin(admin.ModelAdmin):
+    list_display = (
+        "email",
+        "kind",
+        "started_at",
+        "duration",
+        "messages_seen",
+        "messages_new",
+        "messages_skipped",
+        "bytes_transferred",
+        "throughput",
+        "baseline",
+        "is_slow",
+        "error_class",
+    )
+    list_select_related = ("email",)
+    search_fields = ("email__email", "error_class",)
+    list_filter = ("is_slow", "kind", "email__provider", "error_class",)
+    date_hierarchy = "started_at"
+    ordering = ("-started_at",)
+
+
+@admin.register(MessageThread)
+class MessageThreadAdmin(HighVolumeAdminMixin, admin.ModelAdmin):
+    list_display = (
+        "id",
+        "email",
+        "subject",
+        "message_count",
+        "last_receipt_date",
+    )
+    list_select_related = ("email",)
+    search_fields = ("subject",)
+    list_filter = (EmailAccountFilter,)
+    high_volume_list_filter = (EmailAccountFilter,)
+    high_volume_search_fields = ("subject",)
+    raw_id_fields = ("last_message",)
+
+
+@admin.register(SenderStat)
+class SenderStatAdmin(admin.ModelAdmin):
+    list_display = (
+        "email",
+        "sender",
+        "message_count",
+        "last_receipt_date",
+    )
+    list_select_related = ("email",)
+    search_fields = ("sender",)
+    list_filter = (EmailAccountFilter,)
+
+
+@admin.register(DailyStat)
+class DailyStatAdmin(admin.ModelAdmin):
+    list_display = (
+        "email",
+        "day",
+        "message_count",
+    )
+    list_select_related = ("email",)
+    list_filter = (EmailAccountFilter,)
+    date_hierarchy = "day"
+
+
+@admin.register(CompressionDictionary)
+class CompressionDictionaryAdmin(admin.ModelAdmin):
+    list_display = (
+        "email",
+        "sender",
+        "codec",
+        "sample_count",
+        "ratio",
+        "created_at",
+    )
+    list_select_related = ("email",)
+    search_fields = ("sender",)
+    list_filter = ("codec", EmailAccountFilter,)
+    exclude = ("data",)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).defer('data')
+
+
+@admin.register(IngestRule)
+class IngestRuleAdmin(admin.ModelAdmin):
+    list_display = (
+        "email",
+        "kind",
+        "action",
+        "value",
+        "is_regex",
+        "is_active",
+    )
+    list_select_related = ("email",)
+    search_fields = ("value",)
+    list_filter = ("kind", "action", "is_active", EmailAccountFilter,)
+    autocomplete_fields = ("email",)
@@ -0,0 +1,348 @@
+import time
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+
+from .compression import (compress, get_default_codec, train_dictionary,
+                          zstandard)
+from .constants import (BODY_DICT_MAX_SAMPLES, BODY_DICT_MIN_SAMPLES,
+                        BODY_DICT_SCAN_LIMIT, BODY_DICT_SIZE,
+                        COMPRESS_BATCH_SIZE, ZSTD)
+from .models import (CompressionDictionary, Email, MessageBody, MessageData,
+                     get_dictionary_data)
+from .stats import normalize_sender
+
+BODY_STORAGE_FIELDS = ('plain_text', 'compressed_text', 'codec', 'dictionary')
+
+
+def get_dictionaries(
+        account_ids: Iterable[int]
+        ) -> Dict[Tuple[int, str], 'CompressionDictionary']:
+    """
+    Возвращает текущие словари сжатия почтовых ящиков.
+
+    Текущий словарь — последний обученный для пары (ящик, отправитель).
+    Данные словарей не загружаются: они берутся из кеша процесса при
+    сжатии.
+
+    Args:
+        account_ids (Iterable[int]): Идентификаторы почтовых ящиков.
+
+    Returns:
+        dict: Словари по ключу (ящик, отправитель); пустой отправитель —
+          общий словарь ящика.
+    """
+    dictionaries = CompressionDictionary.objects.filter(
+        email_id__in=set(account_ids)
+    ).defer('data').order_by('id')
+    if zstandard is None:
+        dictionaries = dictionaries.exclude(codec=ZSTD)
+    return {
+        (dictionary.email_id, dictionary.sender): dictionary
+        for dictionary in dictionaries
+    }
+
+
+def pick_dictionary(
+        dictionaries: Dict[Tuple[int, str], 'CompressionDictionary'],
+        account_id: int,
+        email_from: Optional[str]
+        ) -> Optional['CompressionDictionary']:
+    """Выбирает словарь отправителя, а если его нет — общий словарь ящика."""
+    return dictionaries.get(
+        (account_id, normalize_sender(email_from))
+    ) or dictionaries.get((account_id, ''))
+
+
+def pack_text(
+        text: Optional[str],
+        dictionary: Optional['CompressionDictionary'] = None
+        ) -> Dict[str, Any]:
+    """
+    Возвращает поля хранения текста тела письма.
+
+    Текст сжимается, если он не короче `BODY_COMPRESSION_MIN_SIZE`
+    и сжатие уменьшает его размер; иначе хранится как есть.
+
+    Args:
+        text (Optional[str]): Текст письма.
+        dictionary (Optional[CompressionDictionary]): Словарь сжатия или
+          None для сжатия без словаря.
+
+    Returns:
+        dict: Значения полей plain_text, compressed_text, codec и
+          dictionary модели `MessageBody`.
+    """
+    fields = {
+        'plain_text': text,
+        'compressed_text': None,
+        'codec': '',
+        'dictionary': None,
+    }
+    if not text or len(text) < settings.BODY_COMPRESSION_MIN_SIZE:
+        return fields
+    raw = text.encode('utf-8')
+    if dictionary:
+        codec, zdict = dictionary.codec, get_dictionary_data(dictionary.id)
+    else:
+        codec, zdict = get_default_codec(), None
+    data = compress(raw, codec, zdict)
+    if len(data) < len(raw):
+        fields.update({
+            'plain_text': None,
+            'compressed_text': data,
+            'codec': codec,
+            'dictionary': dictionary,
+        })
+    return fields
+
+
+def get_body_fields(
+        text: Optional[str],
+        account_id: int,
+        email_from: Optional[str],
+        dictionaries: Optional[Dict] = None
+        ) -> Dict[str, Any]:
+    """
+    Возвращает поля хранения текста для нового тела письма.
+
+    Тексты сжимаются только при включенной настройке `BODY_COMPRESSION`.
+
+    Args:
+        text (Optional[str]): Текст письма.
+        account_id (int): Идентификатор почтового ящика.
+        email_from (Optional[str]): Отправитель письма.
+        dictionaries (Optional[Dict]): Словари из `get_dictionaries` или
+          None, чтобы загрузить словари ящика.
+
+    Returns:
+        dict: Значения полей хранения текста модели `MessageBody`.
+    """
+    if not settings.BODY_COMPRESSION:
+        return {'plain_text': text}
+    if dictionaries is None:
+        dictionaries = get_dictionaries([account_id])
+    return pack_text(
+        text, pick_dictionary(dictionaries, account_id, email_from)
+    )
+
+
+def get_body_size(body: 'MessageBody') -> int:
+    """Возвращает размер хранимого текста тела письма в байтах."""
+    if body.compressed_text is not None:
+        return len(body.compressed_text)
+    return len((body.plain_text or '').encode('utf-8'))
+
+
+def load_texts(body_ids: List[int]) -> Dict[int, bytes]:
+    """Загружает тексты тел писем в UTF-8 пачками."""
+    texts = {}
+    for start in range(0, len(body_ids), COMPRESS_BATCH_SIZE):
+        for body in MessageBody.objects.filter(
+                id__in=body_ids[start:start + COMPRESS_BATCH_SIZE]):
+            if body.text:
+                texts[body.id] = body.text.encode('utf-8')
+    return texts
+
+
+def train_account_dictionaries(
+        email_account: 'Email',
+        per_sender: bool = True,
+        min_samples: int = BODY_DICT_MIN_SAMPLES,
+        max_samples: int = BODY_DICT_MAX_SAMPLES,
+        size: int = BODY_DICT_SIZE
+        ) -> List['CompressionDictionary']:
+    """
+    Обучает словари сжатия почтового ящика.
+
+    Образцы — тела последних `BODY_DICT_SCAN_LIMIT` писем ящика. Общий
+    словарь обучается на всех образцах, словари отправителей — на письмах
+    отправителей, от которых не меньше `min_samples` разных тел.
+
+    Args:
+        email_account (Email): Почтовый ящик.
+        per_sender (bool): Обучать ли словари отправителей.
+        min_samples (int): Минимальное число образцов для словаря.
+        max_samples (int): Максимальное число образцов для словаря.
+        size (int): Максимальный размер словаря в байтах.
+
+    Returns:
+        List[CompressionDictionary]: Созданные словари.
+    """
+    rows = MessageData.objects.filter(
+        email=email_account, body__isnull=False
+    ).order_by('-id').values_list(
+        'email_from', 'body_id'
+    )[:BODY_DICT_SCAN_LIMIT]
+    groups = defaultdict(dict)
+    for email_from, body_id in rows:
+        groups[''].setdefault(body_id)
+        if per_sender:
+            groups[normalize_sender(email_from)].setdefault(body_id)
+    groups = {
+        sender: list(body_ids)[:max_samples]
+        for sender, body_ids in groups.items()
+        if len(body_ids) >= min_samples
+    }
+    texts = load_texts(list({
+        body_id for body_ids in groups.values() for body_id in body_ids
+    }))
+
+    codec = get_default_codec()
+    dictionaries = []
+    for sender, body_ids in groups.items():
+        samples = [texts[body_id] for body_id in body_ids if body_id in texts]
+        data = train_dictionary(samples, size, codec)
+        if not data:
+            continue
+        dictionaries.append(CompressionDictionary.objects.create(
+            email=email_account, sender=sender, codec=codec, data=data,
+            sample_count=len(samples),
+            sample_bytes=sum(len(sample) for sample in samples),
+            compressed_bytes=sum(
+                len(compress(sample, codec, data)) for sample in samples
+            ),
+        ))
+    return dictionaries
+
+
+def iterate_account_bodies(
+        email_account: 'Email',
+        batch_size: int
+        ) -> Iterable[List[Tuple[int, Optional[str]]]]:
+    """
+    Перебирает тела писем почтового ящика пачками.
+
+    Тело, общее для нескольких писем ящика, возвращается один раз.
+
+    Args:
+        email_account (Email): Почтовый ящик.
+        batch_size (int): Размер пачки писем.
+
+    Yields:
+        List[Tuple]: Пары (идентификатор тела, отправитель письма).
+    """
+    messages = MessageData.objects.filter(
+        email=email_account, body__isnull=False
+    ).order_by('id').values_list('id', 'email_from', 'body_id')
+    seen, last_id = set(), 0
+    while True:
+        batch = list(messages.filter(id__gt=last_id)[:batch_size])
+        if not batch:
+            return
+        last_id = batch[-1][0]
+        bodies = []
+        for _, email_from, body_id in batch:
+            if body_id not in seen:
+                seen.add(body_id)
+                bodies.append((body_id, email_from))
+        yield bodies
+
+
+def recompress_account(
+        email_account: 'Email',
+        batch_size: int = COMPRESS_BATCH_SIZE
+        ) -> Dict[str, float]:
+    """
+    Сжимает тела писем почтового ящика его текущими словарями.
+
+    Тело, уже сжатое нужным словарем, не пересжимается. Тела, общие
+    с письмами других ящиков, сжимаются без словаря: иначе каждый проход
+    переписывал бы их словарем последнего ящика, а другие ящики зависели
+    бы от чужого словаря, который нельзя удалить. Для сжатых тел
+    измеряется время распаковки.
+
+    Args:
+        email_account (Email): Почтовый ящик.
+        batch_size (int): Размер пачки писем.
+
+    Returns:
+        dict: Количество тел, пересжатых, сжатых и общих с другими
+          ящиками тел, объем текстов до и после сжатия в байтах
+          и суммарное время распаковки, с.
+    """
+    dictionaries = get_dictionaries([email_account.id])
+    stats = defaultdict(float)
+    for batch in iterate_account_bodies(email_account, batch_size):
+        senders = dict(batch)
+        shared = set(MessageData.objects.filter(
+            body_id__in=senders
+        ).exclude(email=email_account).values_list('body_id', flat=True))
+        changed = []
+        for body in MessageBody.objects.filter(id__in=senders):
+            dictionary = None if body.id in shared else pick_dictionary(
+                dictionaries, email_account.id, senders[body.id]
+            )
+            text = body.text
+            if (body.compressed_text is None
+                    or body.dictionary_id != getattr(dictionary, 'id', None)):
+                fields = pack_text(text, dictionary)
+                if (fields['compressed_text'] is not None
+                        or body.compressed_text is not None):
+                    for field, value in fields.items():
+                        setattr(body, field, value)
+                    changed.append(body)
+            stats['bodies'] += 1
+            stats['shared'] += body.id in shared
+            stats['raw_bytes'] += len((text or '').encode('utf-8'))
+            stats['stored_bytes'] += get_body_size(body)
+            if body.compressed_text is not None:
+                started = time.perf_counter()
+                body.text
+                stats['decode_seconds'] += time.perf_counter() - started
+                stats['compressed'] += 1
+        MessageBody.objects.bulk_update(changed, BODY_STORAGE_FIELDS)
+        stats['changed'] += len(changed)
+    return stats
+
+
+def decompress_account(
+        email_account: 'Email',
+        batch_size: int = COMPRESS_BATCH_SIZE
+        ) -> int:
+    """
+    Возвращает тела писем почтового ящика к хранению без сжатия.
+
+    Args:
+        email_account (Email): Почтовый ящик.
+        batch_size (int): Размер пачки писем.
+
+    Returns:
+        int: Количество распакованных тел.
+    """
+    total = 0
+    for batch in iterate_account_bodies(email_account, batch_size):
+        bodies = list(MessageBody.objects.filter(
+            id__in=[body_id for body_id, _ in batch],
+            compressed_text__isnull=False,
+        ))
+        for body in bodies:
+            body.text = body.text
+        MessageBody.objects.bulk_update(bodies, BODY_STORAGE_FIELDS)
+        total += len(bodies)
+    return total
+
+
+def delete_unused_dictionaries(
+        email_account: 'Email',
+        keep_current: bool = True
+        ) -> int:
+    """
+    Удаляет словари почтового ящика, на которые не ссылаются тела писем.
+
+    Args:
+        email_account (Email): Почтовый ящик.
+        keep_current (bool): Оставлять ли текущие словари ящика.
+
+    Returns:
+        int: Количество удаленных словарей.
+    """
+    keep = [
+        dictionary.id
+        for dictionary in get_dictionaries([email_account.id]).values()
+    ] if keep_current else []
+    deleted, _ = CompressionDictionary.objects.filter(
+        email=email_account, bodies__isnull=True,
+    ).exclude(id__in=keep).delete()
+    return deleted
@@ -0,0 +1,184 @@
+import time
+from typing import Any, Dict, Iterable, List
+
+from django.conf import settings
+from django.core.cache import cache
+
+LIST_VERSION_KEY = 'msg:list-version:{}'
+ALL_LISTS_VERSION_KEY = 'msg:list-version:all'
+LIST_PAGE_KEY = 'msg:list-page:{}:{}'
+ACCOUNTS_VERSION_KEY = 'msg:accounts-version'
+ACCOUNTS_KEY = 'msg:accounts:{}'
+
+
+def get_version(key: str) -> float:
+    """
+    Возвращает версию кешированных данных, создавая ее при отсутствии.
+
+    Версия — время последнего изменения данных (timestamp), поэтому она
+    же служит значением Last-Modified.
+
+    Args:
+        key (str): Ключ версии в кеше.
+
+    Returns:
+        float: Версия данных.
+    """
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time(), None)
+        version = cache.get(key, time.time())
+    return version
+
+
+def get_list_version(account_id: int) -> float:
+    """
+    Возвращает версию списка писем почтового ящика.
+
+    Учитывает и общую версию, которая меняется при массовом удалении
+    писем всех ящиков.
+
+    Args:
+        account_id (int): Идентификатор почтового ящика.
+
+    Returns:
+        float: Версия списка писем.
+    """
+    return max(
+        get_version(LIST_VERSION_KEY.format(account_id)),
+        get_version(ALL_LISTS_VERSION_KEY),
+    )
+
+
+def invalidate_account_list(account_id: int) -> None:
+    """
+    Сбрасывает кеш списка писем почтового ящика.
+
+    Вызывается после записи новых писем: у списка появляется новая версия,
+    а старые страницы в кеше больше не используются.
+
+    Args:
+        account_id (int): Идентификатор почтового ящика.
+    """
+    cache.set(LIST_VERSION_KEY.format(account_id), time.time(), None)
+
+
+def invalidate_account_lists(account_ids: Iterable[int]) -> None:
+    """Сбрасывает кеш списков писем нескольких почтовых ящиков."""
+    for account_id in set(account_ids):
+        invalidate_account_list(account_id)
+
+
+def invalidate_all_lists() -> None:
+    """Сбрасывает кеш списков писем всех почтовых ящиков."""
+    cache.set(ALL_LISTS_VERSION_KEY, time.time(), None)
+
+
+def get_list_etag(account_id: int, version: float) -> str:
+    """Возвращает ETag списка писем почтового ящика для версии."""
+    return f'"{account_id}-{version:.6f}"'
+
+
+def get_list_page(account_id: int, version: float) -> str | None:
+    """
+    Возвращает закешированную страницу списка писем.
+
+    Args:
+        account_id (int): Идентификатор почтового ящика.
+        version (float): Версия списка писем.
+
+    Returns:
+        str or None: HTML страницы или None, если страницы этой версии
+          в кеше нет.
+    """
+    return cache.get(LIST_PAGE_KEY.format(account_id, version))
+
+
+def set_list_page(account_id: int, version: float, content: str) -> None:
+    """
+    Сохраняет страницу списка писем в кеш.
+
+    Args:
+        account_id (int): Идентификатор почтового ящика.
+        version (float): Версия списка, по которой страница построена.
+        content (str): HTML страницы.
+    """
+    cache.set(
+        LIST_PAGE_KEY.format(account_id, version), content,
+        settings.LIST_CACHE_TIMEOUT,
+    )
+
+
+def invalidate_accounts() -> None:
+    """Сбрасывает кеш списка почтовых ящиков."""
+    cache.set(ACCOUNTS_VERSION_KEY, time.time(), None)
+
+
+def get_accounts(queryset) -> List[Dict[str, Any]]:
+    """
+    Возвращает список почтовых ящиков из кеша.
+
+    Без общего кеша (`LIST_CACHE` выключен) список читается из базы
+    данных: ящики могут добавляться из других процессов.
+
+    Args:
+        queryset (QuerySet): Набор почтовых ящиков, используемый
+          при отсутствии данных в кеше.
+
+    Returns:
+        list: Список словарей с идентификатором и адресом ящика.
+    """
+    if not settings.LIST_CACHE:
+        return list(queryset.values('id', 'email'))
+    key = ACCOUNTS_KEY.format(get_version(ACCOUNTS_VERSION_KEY))
+    accounts = cache.get(key)
+    if accounts is None:
+        accounts = list(queryset.values('id', 'email'))
+        cache.set(key, accounts, settings.LIST_CACHE_TIMEOUT)
+    return accounts
+
+
+async def aget_version(key: str) -> float:
+    """Асинхронный вариант `get_version`."""
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key, time.time(), None)
+        version = await cache.aget(key, time.time())
+    return version
+
+
+async def aget_list_version(account_id: int) -> float:
+    """Асинхронный вариант `get_list_version`."""
+    return max(
+        await aget_version(LIST_VERSION_KEY.format(account_id)),
+        await aget_version(ALL_LISTS_VERSION_KEY),
+    )
+
+
+async def aget_list_page(account_id: int, version: float) -> str | None:
+    """Асинхронный вариант `get_list_page`."""
+    return await cache.aget(LIST_PAGE_KEY.format(account_id, version))
+
+
+async def aset_list_page(
+        account_id: int, version: float, content: str
+        ) -> None:
+    """Асинхронный вариант `set_list_page`."""
+    await cache.aset(
+        LIST_PAGE_KEY.format(account_id, version), content,
+        settings.LIST_CACHE_TIMEOUT,
+    )
+
+
+async def aget_accounts(queryset) -> List[Dict[str, Any]]:
+    """Асинхронный вариант `get_accounts`."""
+    if not settings.LIST_CACHE:
+        return [account async for account in queryset.values('id', 'email')]
+    key = ACCOUNTS_KEY.format(await aget_version(ACCOUNTS_VERSION_KEY))
+    accounts = await cache.aget(key)
+    if accounts is None:
+        accounts = [
+            account async for account in queryset.values('id', 'email')
+        ]
+        await cache.aset(key, accounts, settings.LIST_CACHE_TIMEOUT)
+    return accounts
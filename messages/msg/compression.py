@@ -0,0 +1,126 @@
+import zlib
+from collections import Counter
+from typing import List, Optional
+
+from .constants import BODY_COMPRESSION_LEVEL, ZLIB, ZSTD
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Строки короче этой длины почти не сокращают сжатый текст, а место
+# в словаре занимают
+ZDICT_MIN_LINE = 8
+
+
+def get_default_codec() -> str:
+    """Возвращает Zstandard, если он установлен, иначе zlib."""
+    return ZSTD if zstandard else ZLIB
+
+
+def build_zdict(samples: List[bytes], size: int) -> bytes:
+    """
+    Составляет словарь zlib из строк, повторяющихся в образцах.
+
+    zlib использует словарь как уже сжатый текст перед данными, поэтому
+    в словарь попадают строки, встречающиеся хотя бы в двух образцах,
+    в порядке ценности (число образцов × длина), а самые ценные ставятся
+    в конец, ближе к сжимаемым данным.
+
+    Args:
+        samples (List[bytes]): Образцы текстов в UTF-8.
+        size (int): Максимальный размер словаря в байтах.
+
+    Returns:
+        bytes: Словарь (пустой, если повторов нет).
+    """
+    counts = Counter()
+    for sample in samples:
+        counts.update({
+            line for line in sample.splitlines(keepends=True)
+            if len(line) >= ZDICT_MIN_LINE
+        })
+    common = sorted(
+        (count * len(line), line)
+        for line, count in counts.items() if count > 1
+    )
+    chosen, total = [], 0
+    for _, line in reversed(common):
+        if total + len(line) <= size:
+            chosen.append(line)
+            total += len(line)
+    return b''.join(reversed(chosen))
+
+
+def train_dictionary(
+        samples: List[bytes],
+        size: int,
+        codec: str
+        ) -> Optional[bytes]:
+    """
+    Обучает словарь сжатия на образцах текстов.
+
+    Args:
+        samples (List[bytes]): Образцы текстов в UTF-8.
+        size (int): Максимальный размер словаря в байтах.
+        codec (str): Алгоритм сжатия (zlib или zstd).
+
+    Returns:
+        bytes or None: Словарь или None, если образцы не дают словаря.
+    """
+    if codec == ZSTD:
+        try:
+            return zstandard.train_dictionary(size, samples).as_bytes()
+        except zstandard.ZstdError as err:
+            print(f'Ошибка обучения словаря: {err}')
+            return None
+    return build_zdict(samples, size) or None
+
+
+def compress(data: bytes, codec: str, zdict: Optional[bytes]) -> bytes:
+    """
+    Сжимает данные со словарем или без него.
+
+    Args:
+        data (bytes): Данные.
+        codec (str): Алгоритм сжатия (zlib или zstd).
+        zdict (Optional[bytes]): Словарь или None.
+
+    Returns:
+        bytes: Сжатые данные.
+    """
+    if codec == ZSTD:
+        dict_data = zstandard.ZstdCompressionDict(zdict) if zdict else None
+        return zstandard.ZstdCompressor(
+            level=BODY_COMPRESSION_LEVEL, dict_data=dict_data,
+        ).compress(data)
+    if zdict:
+        compressor = zlib.compressobj(BODY_COMPRESSION_LEVEL, zdict=zdict)
+    else:
+        compressor = zlib.compressobj(BODY_COMPRESSION_LEVEL)
+    return compressor.compress(data) + compressor.flush()
+
+
+def decompress(data: bytes, codec: str, zdict: Optional[bytes]) -> bytes:
+    """
+    Распаковывает данные, сжатые `compress`.
+
+    Args:
+        data (bytes): Сжатые данные.
+        codec (str): Алгоритм сжатия (zlib или zstd).
+        zdict (Optional[bytes]): Словарь, с которым данные были сжаты.
+
+    Returns:
+        bytes: Исходные данные.
+    """
+    if codec == ZSTD:
+        dict_data = zstandard.ZstdCompressionDict(zdict) if zdict else None
+        return zstandard.ZstdDecompressor(dict_data=dict_data).decompress(
+            data
+        )
+    if zdict:
+        decompressor = zlib.decompressobj(zdict=zdict)
+    else:
+        decompressor = zlib.decompressobj()
+    return decompressor.decompress(data) + decompressor.flush()
@@ -12,6 +12,79 @@ EMAIL_DICKT = {
     'GMAIL': 'gmail.com',
 }
 ALLOWED_DOMAINS = ('yandex.ru', 'gmail.com', 'mail.ru',)
+IMAP_SERVERS = {
+    'YANDEX': 'imap.yandex.ru',
+    'GMAIL': 'imap.gmail.com',
+    'MAILRU': 'imap.mail.ru',
+}
+INTERACTIVE = 'INTERACTIVE'
+BACKFILL = 'BACKFILL'
+SYNC_RUN_CHOICES = (
+    (INTERACTIVE, 'Интерактивная'),
+    (BACKFILL, 'Догрузка'),
+)
+SENDER = 'SENDER'
+SUBJECT = 'SUBJECT'
+LARGER = 'LARGER'
+SMALLER = 'SMALLER'
+SINCE = 'SINCE'
+BEFORE = 'BEFORE'
+RULE_KIND_CHOICES = (
+    (SENDER, 'Отправитель или домен'),
+    (SUBJECT, 'Тема'),
+    (LARGER, 'Размер больше, байт'),
+    (SMALLER, 'Размер меньше, байт'),
+    (SINCE, 'Получено не раньше (дата или число дней назад)'),
+    (BEFORE, 'Получено раньше (дата)'),
+)
+INCLUDE = 'INCLUDE'
+EXCLUDE = 'EXCLUDE'
+RULE_ACTION_CHOICES = (
+    (INCLUDE, 'Загружать'),
+    (EXCLUDE, 'Не загружать'),
+)
+ZLIB = 'zlib'
+ZSTD = 'zstd'
+CODEC_CHOICES = (
+    (ZLIB, 'zlib'),
+    (ZSTD, 'Zstandard'),
+)
 MAX_PASSWORD_LEGTH = 128
 MAX_TITLE_LEGTH = 256
 MAX_EMAIL_LEGTH = 256
+MAX_MESSAGE_ID_LEGTH = 998
+MAX_NODE_NAME_LEGTH = 255
+MAX_ERROR_CLASS_LEGTH = 255
+CONTENT_HASH_LEGTH = 64
+MAX_CODEC_LEGTH = 16
+MAX_RULE_VALUE_LEGTH = 255
+PREVIEW_LEGTH = 50
+ESTIMATED_COUNT_THRESHOLD = 10000
+EXPORT_CHUNK_SIZE = 2000
+REPLAY_BATCH_SIZE = 100
+INTERACTIVE_SYNC_LIMIT = 20
+BACKFILL_CHUNK_SIZE = 100
+# UIDVALIDITY писем из архивов: у папок IMAP она не бывает нулевой
+IMPORT_UID_VALIDITY = 0
+SYNC_BASELINE_RUNS = 20
+SLOW_RUN_FACTOR = 3
+SYNC_STATS_DAYS = 14
+SLOW_RUNS_LIMIT = 50
+THREAD_REFERENCES_LIMIT = 50
+THREADS_PAGE_SIZE = 50
+STATS_CHUNK_SIZE = 2000
+STATS_TOP_SENDERS = 10
+STATS_DAYS = 30
+STATS_MAX_DAYS = 366
+STATS_MAX_TOP_SENDERS = 100
+BODY_DICT_SIZE = 32768
+BODY_DICT_MIN_SAMPLES = 20
+BODY_DICT_MAX_SAMPLES = 1000
+BODY_DICT_SCAN_LIMIT = 20000
+BODY_DICT_CACHE_SIZE = 64
+BODY_COMPRESSION_LEVEL = 9
+COMPRESS_BATCH_SIZE = 500
+RULES_HEADER_CHUNK_SIZE = 200
+ONBOARD_WORKERS = 8
+ONBOARD_MAX_ACCOUNTS = 20
+ONBOARD_LOGIN_TIMEOUT = 15
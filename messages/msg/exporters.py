@@ -0,0 +1,254 @@
+import base64
+import csv
+import json
+from email.generator import BytesGenerator
+from email.message import EmailMessage
+from email.utils import format_datetime
+from io import BytesIO
+from itertools import islice
+from pathlib import Path
+from typing import AsyncIterator, Iterator, Optional, TypeVar
+
+from asgiref.sync import sync_to_async
+from django.db.models import QuerySet
+
+from .constants import EXPORT_CHUNK_SIZE
+from .models import Email, MessageData
+from .serializers import serialize_message
+
+Chunk = TypeVar('Chunk', str, bytes)
+
+CSV_FIELDS = (
+    'id', 'email', 'email_from', 'title', 'dispatch_date', 'receipt_date',
+    'text', 'msg_read', 'files', 'uid', 'message_id',
+)
+
+
+class Echo:
+    """Псевдо-буфер для csv.writer, возвращающий записанную строку."""
+
+    def write(self, value: str) -> str:
+        return value
+
+
+def get_export_queryset(
+        account: 'Email',
+        with_files: bool = False
+        ) -> QuerySet:
+    """
+    Возвращает набор писем почтового ящика для выгрузки.
+
+    Args:
+        account (Email): Почтовый ящик.
+        with_files (bool): Подгружать ли вложения писем.
+
+    Returns:
+        QuerySet: Письма ящика по возрастанию идентификатора.
+    """
+    queryset = MessageData.objects.filter(
+        email=account
+    ).select_related('email', 'body').order_by('id')
+    if with_files:
+        queryset = queryset.prefetch_related('email_files')
+    return queryset
+
+
+def iterate_messages(
+        queryset: QuerySet,
+        chunk_size: int = EXPORT_CHUNK_SIZE
+        ) -> Iterator['MessageData']:
+    """
+    Перебирает письма курсором на стороне сервера.
+
+    В PostgreSQL `.iterator()` читает строки серверным курсором пачками
+    по `chunk_size`, поэтому память не зависит от количества писем.
+
+    Args:
+        queryset (QuerySet): Набор писем.
+        chunk_size (int): Размер пачки.
+
+    Yields:
+        MessageData: Очередное письмо.
+    """
+    yield from queryset.iterator(chunk_size=chunk_size)
+
+
+async def aiterate_export(
+        chunks: Iterator[Chunk],
+        chunk_size: int = EXPORT_CHUNK_SIZE
+        ) -> AsyncIterator[Chunk]:
+    """
+    Отдает выгрузку асинхронно, забирая ее пачками в потоке.
+
+    ASGI-сервер читает синхронный итератор `StreamingHttpResponse`
+    целиком в памяти до отправки первого байта, поэтому для ASGI
+    выгрузка читается пачками по `chunk_size` строк за один вызов
+    `sync_to_async`. Вызовы выполняются в одном потоке, поэтому курсор
+    базы данных сохраняется между пачками.
+
+    Args:
+        chunks (Iterator): Синхронная выгрузка (`export_ndjson` и др.).
+        chunk_size (int): Количество строк выгрузки в одной пачке.
+
+    Yields:
+        str | bytes: Очередная строка выгрузки.
+    """
+    chunks = iter(chunks)
+    next_batch = sync_to_async(lambda: list(islice(chunks, chunk_size)))
+    try:
+        while True:
+            batch = await next_batch()
+            if not batch:
+                return
+            for chunk in batch:
+                yield chunk
+    finally:
+        close = getattr(chunks, 'close', None)
+        if close:
+            await sync_to_async(close)()
+
+
+def read_attachment(message_file) -> bytes:
+    """Читает содержимое вложения из хранилища."""
+    with message_file.file.open('rb') as attachment:
+        return attachment.read()
+
+
+def export_ndjson(
+        queryset: QuerySet,
+        with_files: bool = False
+        ) -> Iterator[str]:
+    """
+    Выгружает письма построчно в формате NDJSON.
+
+    Args:
+        queryset (QuerySet): Набор писем.
+        with_files (bool): Добавлять ли содержимое вложений в base64.
+
+    Yields:
+        str: Строка JSON с данными одного письма.
+    """
+    for message in iterate_messages(queryset):
+        data = serialize_message(message)
+        if with_files:
+            data['attachments'] = [
+                {
+                    'filename': Path(message_file.file.name).name,
+                    'content': base64.b64encode(
+                        read_attachment(message_file)
+                    ).decode(),
+                }
+                for message_file in message.email_files.all()
+            ]
+        yield json.dumps(data, ensure_ascii=False) + '\n'
+
+
+def export_csv(
+        queryset: QuerySet,
+        with_files: bool = False
+        ) -> Iterator[str]:
+    """
+    Выгружает письма построчно в формате CSV.
+
+    Вложения в CSV не встраиваются: при `with_files` добавляется столбец
+    с путями файлов в хранилище.
+
+    Args:
+        queryset (QuerySet): Набор писем.
+        with_files (bool): Добавлять ли столбец с путями вложений.
+
+    Yields:
+        str: Строка CSV.
+    """
+    writer = csv.writer(Echo())
+    fields = CSV_FIELDS + (('attachments',) if with_files else ())
+    yield writer.writerow(fields)
+    for message in iterate_messages(queryset):
+        data = serialize_message(message)
+        data['files'] = json.dumps(data['files'], ensure_ascii=False)
+        row = [data[field] for field in CSV_FIELDS]
+        if with_files:
+            row.append(';'.join(
+                message_file.file.name
+                for message_file in message.email_files.all()
+            ))
+        yield writer.writerow(row)
+
+
+def unfold_header(value: Optional[str]) -> str:
+    """
+    Разворачивает сохраненное значение заголовка в одну строку.
+
+    Длинные заголовки хранятся с переносами строк, как пришли
+    в письме, а `EmailMessage` не принимает значения с CR и LF.
+    """
+    return ' '.join((value or '').split())
+
+
+def build_mime_message(
+        message: 'MessageData',
+        with_files: bool = False
+        ) -> EmailMessage:
+    """
+    Собирает MIME-сообщение из сохраненного письма.
+
+    Args:
+        message (MessageData): Письмо с подгруженными почтой и телом.
+        with_files (bool): Добавлять ли вложения.
+
+    Returns:
+        EmailMessage: MIME-сообщение.
+    """
+    mime = EmailMessage()
+    mime['From'] = unfold_header(message.email_from)
+    mime['To'] = message.email.email
+    mime['Subject'] = unfold_header(message.title)
+    mime['Date'] = format_datetime(message.created_at)
+    if message.body and message.body.message_id:
+        mime['Message-ID'] = unfold_header(message.body.message_id)
+    text = message.text or ''
+    subtype = 'html' if text.lstrip()[:1] == '<' else 'plain'
+    mime.set_content(text, subtype=subtype)
+    if with_files:
+        for message_file in message.email_files.all():
+            mime.add_attachment(
+                read_attachment(message_file),
+                maintype='application', subtype='octet-stream',
+                filename=Path(message_file.file.name).name,
+            )
+    return mime
+
+
+def export_mbox(
+        queryset: QuerySet,
+        with_files: bool = False
+        ) -> Iterator[bytes]:
+    """
+    Выгружает письма в формате mbox.
+
+    Строки тела, начинающиеся с "From ", экранируются.
+
+    Args:
+        queryset (QuerySet): Набор писем.
+        with_files (bool): Добавлять ли вложения.
+
+    Yields:
+        bytes: Одно письмо в формате mbox.
+    """
+    for message in iterate_messages(queryset):
+        mime = build_mime_message(message, with_files)
+        buffer = BytesIO()
+        buffer.write(
+            f'From MAILER-DAEMON {message.created_at:%a %b %d %H:%M:%S %Y}\n'
+            .encode()
+        )
+        BytesGenerator(buffer, mangle_from_=True).flatten(mime)
+        buffer.write(b'\n')
+        yield buffer.getvalue()
+
+
+EXPORT_FORMATS = {
+    'ndjson': (export_ndjson, 'application/x-ndjson', 'ndjson'),
+    'csv': (export_csv, 'text/csv', 'csv'),
+    'mbox': (export_mbox, 'application/mbox', 'mbox'),
+}
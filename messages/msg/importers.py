@@ -0,0 +1,141 @@
+import hashlib
+import mailbox
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from django.db import connections
+
+from .constants import IMPORT_UID_VALIDITY
+from .mime import MessagePart
+from .models import Email
+from .services import parse_message, save_messages_in_db_bulk
+
+
+def iterate_raw_messages(path: Path) -> Iterator[bytes]:
+    """
+    Перебирает исходные тексты писем из архива mbox или каталога Maildir.
+
+    Args:
+        path (Path): Путь к файлу mbox или каталогу Maildir.
+
+    Yields:
+        bytes: Исходный текст очередного письма.
+    """
+    if path.is_dir():
+        source = mailbox.Maildir(path, factory=None, create=False)
+    else:
+        source = mailbox.mbox(path, factory=None, create=False)
+    try:
+        for key in source.iterkeys():
+            yield source.get_bytes(key)
+    finally:
+        source.close()
+
+
+def parse_raw_message(
+        raw_message: bytes
+        ) -> Optional[Tuple[Dict[str, Any], List['MessagePart']]]:
+    """
+    Разбирает письмо из архива в рабочем процессе.
+
+    UID письма строится по хешу исходного текста, поэтому повторный
+    импорт того же архива не создает дубликатов. Дата получения для
+    архивных писем совпадает с датой отправки.
+
+    Args:
+        raw_message (bytes): Исходный текст письма.
+
+    Returns:
+        tuple or None: Кортеж (data_msg, attachments) без привязки
+          к почтовому ящику или None, если письмо не удалось разобрать.
+          Содержимое вложений декодируется при передаче в основной
+          процесс.
+    """
+    try:
+        data_msg, attachments = parse_message(raw_message)
+    except Exception:
+        return None
+    data_msg.update({
+        'receipt_date': data_msg['dispatch_date'],
+        'msg_read': True,
+        'uid': hashlib.sha256(raw_message).hexdigest(),
+    })
+    return data_msg, attachments
+
+
+def import_mailbox(
+        email_account: 'Email',
+        paths: List[Path],
+        workers: int = 4,
+        batch_size: int = 500
+        ) -> Dict[str, Any]:
+    """
+    Импортирует письма из архивов mbox и каталогов Maildir.
+
+    Разбор писем выполняется параллельно в пуле процессов, а сохранение —
+    в основном процессе пачками через `save_messages_in_db_bulk`.
+
+    Args:
+        email_account (Email): Почтовый ящик, в который импортируются письма.
+        paths (List[Path]): Файлы mbox и каталоги Maildir.
+        workers (int): Количество процессов разбора.
+        batch_size (int): Количество писем в одной массовой вставке.
+
+    Returns:
+        dict: Итоги импорта: прочитано, сохранено, пропущено, ошибок,
+          байт, длительность и скорость.
+    """
+    stats = {'read': 0, 'imported': 0, 'skipped': 0, 'failed': 0, 'bytes': 0}
+    started = time.monotonic()
+
+    def windows():
+        window = []
+        for path in paths:
+            for raw_message in iterate_raw_messages(path):
+                stats['read'] += 1
+                stats['bytes'] += len(raw_message)
+                window.append(raw_message)
+                if len(window) >= batch_size:
+                    yield window
+                    window = []
+        if window:
+            yield window
+
+    def flush(results):
+        batch = []
+        for record in results:
+            if record is None:
+                stats['failed'] += 1
+                continue
+            data_msg = record[0]
+            data_msg['email'] = email_account
+            data_msg['uid'] = f'import-{email_account.id}-{data_msg["uid"]}'
+            data_msg['uid_validity'] = IMPORT_UID_VALIDITY
+            batch.append(record)
+        if batch:
+            created = save_messages_in_db_bulk(batch)
+            stats['imported'] += len(created)
+            stats['skipped'] += len(batch) - len(created)
+
+    # Дочерние процессы не должны наследовать открытые соединения с БД
+    connections.close_all()
+    chunksize = max(1, batch_size // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # Следующая пачка разбирается, пока предыдущая сохраняется в БД
+        pending = None
+        for window in windows():
+            results = executor.map(
+                parse_raw_message, window, chunksize=chunksize
+            )
+            if pending is not None:
+                flush(pending)
+            pending = results
+        if pending is not None:
+            flush(pending)
+
+    elapsed = time.monotonic() - started
+    stats['elapsed'] = elapsed
+    stats['messages_per_second'] = stats['read'] / elapsed if elapsed else 0
+    return stats
@@ -0,0 +1,317 @@
+import os
+import socket
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from .models import Email, SyncNode, SyncState
+from .routers import untracked_writes
+
+
+def get_node_name() -> str:
+    """
+    Возвращает имя узла синхронизации.
+
+    Берется из настройки `SYNC_NODE_NAME`, по умолчанию — имя хоста
+    и идентификатор процесса.
+    """
+    return settings.SYNC_NODE_NAME or f'{socket.gethostname()}-{os.getpid()}'
+
+
+def get_lease_expiry() -> datetime:
+    """Возвращает срок аренды, отсчитанный от текущего момента."""
+    return timezone.now() + timedelta(seconds=settings.SYNC_LEASE_TIMEOUT)
+
+
+def heartbeat(node: str) -> None:
+    """
+    Отмечает узел живым и продлевает его аренды.
+
+    Продлеваются только аренды, владельцем которых узел все еще
+    записан: если аренду уже забрал другой узел, она не возвращается.
+
+    Args:
+        node (str): Имя узла.
+    """
+    now = timezone.now()
+    SyncNode.objects.update_or_create(
+        name=node, defaults={'heartbeat_at': now},
+    )
+    SyncState.objects.filter(owner=node).update(
+        lease_expires_at=get_lease_expiry(),
+    )
+
+
+def get_live_nodes() -> List[str]:
+    """Возвращает имена узлов с отметкой в пределах срока аренды."""
+    threshold = timezone.now() - timedelta(
+        seconds=settings.SYNC_LEASE_TIMEOUT
+    )
+    return list(
+        SyncNode.objects.filter(
+            heartbeat_at__gte=threshold
+        ).order_by('name').values_list('name', flat=True)
+    )
+
+
+def get_fair_share(node: str, total: int, nodes: List[str]) -> int:
+    """
+    Возвращает число почтовых ящиков, которое должен держать узел.
+
+    Ящики делятся поровну, остаток достается первым по имени узлам,
+    поэтому сумма долей всех живых узлов равна числу ящиков.
+
+    Args:
+        node (str): Имя узла.
+        total (int): Число почтовых ящиков.
+        nodes (List[str]): Имена живых узлов по порядку.
+
+    Returns:
+        int: Доля узла.
+    """
+    if node not in nodes:
+        nodes = sorted([*nodes, node])
+    share, rest = divmod(total, len(nodes))
+    return share + (1 if nodes.index(node) < rest else 0)
+
+
+def ensure_sync_states() -> int:
+    """
+    Создает состояния синхронизации для ящиков, у которых их еще нет.
+
+    Returns:
+        int: Количество созданных состояний.
+    """
+    missing = Email.objects.filter(sync_state__isnull=True).values_list(
+        'id', flat=True
+    )
+    states = [SyncState(email_id=email_id) for email_id in missing]
+    SyncState.objects.bulk_create(states, ignore_conflicts=True)
+    return len(states)
+
+
+def release_excess(node: str, share: int, busy: Iterable[int] = ()) -> int:
+    """
+    Освобождает аренды узла сверх его доли.
+
+    Ящики, которые узел синхронизирует прямо сейчас, не освобождаются,
+    чтобы их не начал синхронизировать другой узел.
+
+    Args:
+        node (str): Имя узла.
+        share (int): Доля узла.
+        busy (Iterable[int]): Идентификаторы ящиков в работе.
+
+    Returns:
+        int: Количество освобожденных аренд.
+    """
+    owned = SyncState.objects.filter(owner=node)
+    excess = owned.count() - share
+    if excess <= 0:
+        return 0
+    release_ids = list(
+        owned.exclude(email_id__in=list(busy)).order_by(
+            '-email_id'
+        ).values_list('id', flat=True)[:excess]
+    )
+    return SyncState.objects.filter(id__in=release_ids, owner=node).update(
+        owner='', lease_expires_at=None,
+    )
+
+
+def acquire_leases(node: str, count: int) -> List[int]:
+    """
+    Забирает свободные или просроченные аренды.
+
+    Строки блокируются `SELECT ... FOR UPDATE SKIP LOCKED`, поэтому
+    узлы, забирающие аренды одновременно, получают разные ящики и не
+    ждут друг друга.
+
+    Args:
+        node (str): Имя узла.
+        count (int): Сколько аренд забрать.
+
+    Returns:
+        List[int]: Идентификаторы почтовых ящиков полученных аренд.
+    """
+    if count <= 0:
+        return []
+    now = timezone.now()
+    with transaction.atomic():
+        states = list(
+            SyncState.objects.select_for_update(skip_locked=True).filter(
+                Q(owner='') | Q(lease_expires_at__lt=now)
+                | Q(lease_expires_at__isnull=True)
+            ).exclude(owner=node).order_by('email_id')[:count]
+        )
+        SyncState.objects.filter(id__in=[state.id for state in states]).update(
+            owner=node, lease_expires_at=get_lease_expiry(),
+        )
+    return [state.email_id for state in states]
+
+
+def rebalance(node: str, busy: Iterable[int] = ()) -> List[int]:
+    """
+    Выполняет один шаг распределения ящиков для узла.
+
+    Узел отмечается живым, продлевает аренды, освобождает лишние при
+    появлении новых узлов и забирает недостающие (свободные или
+    просроченные аренды выбывших узлов).
+
+    Args:
+        node (str): Имя узла.
+        busy (Iterable[int]): Идентификаторы ящиков в работе.
+
+    Returns:
+        List[int]: Идентификаторы почтовых ящиков, арендованных узлом.
+    """
+    heartbeat(node)
+    ensure_sync_states()
+    total = SyncState.objects.count()
+    share = get_fair_share(node, total, get_live_nodes())
+    release_excess(node, share, busy)
+    owned = SyncState.objects.filter(owner=node).count()
+    acquire_leases(node, share - owned)
+    return get_owned_accounts(node)
+
+
+def get_owned_accounts(node: str) -> List[int]:
+    """Возвращает ящики с действующей арендой узла."""
+    return list(
+        SyncState.objects.filter(
+            owner=node, lease_expires_at__gt=timezone.now()
+        ).values_list('email_id', flat=True)
+    )
+
+
+def holds_lease(node: str, email_id: int) -> bool:
+    """Проверяет, что узел держит действующую аренду ящика."""
+    return SyncState.objects.filter(
+        email_id=email_id, owner=node, lease_expires_at__gt=timezone.now()
+    ).exists()
+
+
+def release_all(node: str) -> None:
+    """Освобождает все аренды узла и удаляет его отметку."""
+    SyncState.objects.filter(owner=node).update(
+        owner='', lease_expires_at=None,
+    )
+    SyncNode.objects.filter(name=node).delete()
+
+
+def request_sync(email_id: int) -> None:
+    """
+    Отмечает, что ящику нужна синхронизация вне расписания.
+
+    Запрос выполнит узел, который держит аренду ящика. Запись не
+    считается записью HTTP-запроса: иначе каждый просмотр списка писем
+    переводил бы чтение клиента на основную базу.
+
+    Args:
+        email_id (int): Идентификатор почтового ящика.
+    """
+    with untracked_writes():
+        SyncState.objects.update_or_create(
+            email_id=email_id, defaults={'requested_at': timezone.now()},
+        )
+
+
+def request_preemption(email_id: int) -> None:
+    """
+    Просит фоновую догрузку почтового ящика уступить место интерактивной
+    синхронизации.
+
+    Флаг хранится в базе данных, чтобы его видели обработчики очереди
+    в других процессах при любом кеше, и снимается интерактивной
+    синхронизацией или по истечении `SYNC_PREEMPT_TIMEOUT`. Как и запрос
+    синхронизации, запись не считается записью HTTP-запроса.
+
+    Args:
+        email_id (int): Идентификатор почтового ящика.
+    """
+    with untracked_writes():
+        SyncState.objects.update_or_create(
+            email_id=email_id,
+            defaults={'preempt_requested_at': timezone.now()},
+        )
+
+
+def is_preempted(email_id: int) -> bool:
+    """Проверяет, ждет ли почтовый ящик интерактивной синхронизации."""
+    return SyncState.objects.filter(
+        email_id=email_id,
+        preempt_requested_at__gt=timezone.now() - timedelta(
+            seconds=settings.SYNC_PREEMPT_TIMEOUT
+        ),
+    ).exists()
+
+
+def clear_preemption(email_id: int) -> None:
+    """Снимает флаг ожидания интерактивной синхронизации."""
+    SyncState.objects.filter(email_id=email_id).update(
+        preempt_requested_at=None
+    )
+
+
+def get_due_accounts(node: str) -> List[int]:
+    """
+    Возвращает арендованные узлом ящики, которые пора синхронизировать.
+
+    Синхронизация нужна, если ее запросили или с последней прошло больше
+    `SYNC_INTERVAL` секунд.
+
+    Args:
+        node (str): Имя узла.
+
+    Returns:
+        List[int]: Идентификаторы почтовых ящиков.
+    """
+    now = timezone.now()
+    return list(
+        SyncState.objects.filter(
+            owner=node, lease_expires_at__gt=now,
+        ).filter(
+            Q(requested_at__isnull=False) | Q(last_synced_at__isnull=True)
+            | Q(last_synced_at__lt=now - timedelta(
+                seconds=settings.SYNC_INTERVAL
+            ))
+        ).values_list('email_id', flat=True)
+    )
+
+
+def mark_synced(email_id: int, started_at: datetime) -> None:
+    """
+    Отмечает завершение синхронизации ящика.
+
+    Запрос, поступивший уже во время синхронизации, не снимается.
+
+    Args:
+        email_id (int): Идентификатор почтового ящика.
+        started_at (datetime): Время начала синхронизации.
+    """
+    SyncState.objects.filter(email_id=email_id).update(
+        last_synced_at=timezone.now(),
+    )
+    SyncState.objects.filter(
+        email_id=email_id, requested_at__lte=started_at
+    ).update(requested_at=None)
+
+
+def get_lease_stats() -> Dict[str, Any]:
+    """Возвращает живые узлы и число арендованных ими ящиков."""
+    owned = dict(
+        SyncState.objects.filter(
+            lease_expires_at__gt=timezone.now()
+        ).exclude(owner='').values_list('owner').annotate(
+            accounts=Count('id')
+        )
+    )
+    return {
+        'backend': settings.SYNC_BACKEND,
+        'nodes': {node: owned.get(node, 0) for node in get_live_nodes()},
+        'unowned': SyncState.objects.count() - sum(owned.values()),
+    }
@@ -0,0 +1,97 @@
+import asyncio
+import statistics
+import time
+from unittest import mock
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient, override_settings
+from django.urls import reverse
+
+from msg.models import Email
+from msg.services import get_data_and_send_to_ws
+
+DUMMY_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает пропускную способность синхронного и асинхронного '
+        'представлений списка писем при конкурентных запросах через ASGI.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('email', help='Почтовый ящик для запросов.')
+        parser.add_argument(
+            '--requests', type=int, default=500,
+            help='Количество запросов к каждому представлению.',
+        )
+        parser.add_argument(
+            '--concurrency', type=int, default=50,
+            help='Количество одновременных запросов.',
+        )
+        parser.add_argument(
+            '--enqueue-latency', type=float, default=0.02,
+            help=(
+                'Задержка постановки задачи в очередь, с (имитация '
+                'обращения к брокеру).'
+            ),
+        )
+        parser.add_argument(
+            '--no-cache', action='store_true',
+            help='Отключить кеш страниц.',
+        )
+
+    def handle(self, *args, **options):
+        if not Email.objects.filter(email=options['email']).exists():
+            raise CommandError(f'Почта {options["email"]} не найдена')
+
+        latency = options['enqueue_latency']
+
+        def fake_delay(*args, **kwargs):
+            time.sleep(latency)
+
+        overrides = {
+            'ALLOWED_HOSTS': [*settings.ALLOWED_HOSTS, 'testserver'],
+        }
+        if options['no_cache']:
+            overrides['CACHES'] = DUMMY_CACHES
+
+        with override_settings(**overrides), mock.patch.object(
+                get_data_and_send_to_ws, 'delay', fake_delay):
+            for name in ('msg:get_data', 'msg:get_data_async'):
+                url = reverse(name, kwargs={'email': options['email']})
+                elapsed, latencies = asyncio.run(self.run_requests(
+                    url, options['requests'], options['concurrency']
+                ))
+                self.report(name, elapsed, latencies)
+
+    async def run_requests(self, url, total, concurrency):
+        client = AsyncClient()
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies = []
+
+        async def request():
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.get(url)
+                latencies.append(time.perf_counter() - started)
+                if response.status_code != 200:
+                    raise CommandError(
+                        f'{url}: код ответа {response.status_code}'
+                    )
+
+        started = time.perf_counter()
+        await asyncio.gather(*(request() for _ in range(total)))
+        return time.perf_counter() - started, latencies
+
+    def report(self, name, elapsed, latencies):
+        quantiles = statistics.quantiles(latencies, n=100)
+        self.stdout.write(
+            f'{name}: {len(latencies) / elapsed:.1f} запросов/с, '
+            f'p50 {quantiles[49] * 1000:.1f} мс, '
+            f'p95 {quantiles[94] * 1000:.1f} мс, '
+            f'p99 {quantiles[98] * 1000:.1f} мс'
+        )
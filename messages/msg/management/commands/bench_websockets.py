@@ -0,0 +1,210 @@
+import asyncio
+import statistics
+import time
+import tracemalloc
+from datetime import datetime as dt
+
+from channels.layers import InMemoryChannelLayer
+from channels.testing import WebsocketCommunicator
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+
+from messages.asgi import application
+from msg.models import MessageBody, MessageData
+from msg.services import progress_bar, send_email_by_websocket
+
+WS_PATH = '/ws/msg/'
+# Как часто слой каналов удаляет просроченные сообщения, с
+EXPIRY_CHECK_INTERVAL = 1
+
+
+class BenchChannelLayer(InMemoryChannelLayer):
+    """
+    Слой каналов в памяти для нагрузочного теста.
+
+    Исходный слой при каждом `receive` и `group_send` обходит все каналы
+    в поисках просроченных сообщений, и при тысячах клиентов эта проверка
+    занимает почти все время теста. Redis такой работы не делает, поэтому
+    здесь проверка выполняется не чаще раза в `EXPIRY_CHECK_INTERVAL`.
+    """
+
+    checked_at = 0
+
+    def _clean_expired(self):
+        now = time.monotonic()
+        if now - self.checked_at >= EXPIRY_CHECK_INTERVAL:
+            self.checked_at = now
+            super()._clean_expired()
+
+
+def build_messages(count: int, text_size: int) -> list:
+    """Создает несохраненные письма для рассылки клиентам."""
+    now = dt.now()
+    return [
+        MessageData(
+            id=number, email_id=1, title=f'Письмо {number}',
+            email_from='sender@mail.ru', dispatch_date=now,
+            receipt_date=now, files=[{'filename': 'file.pdf'}],
+            body=MessageBody(text='x' * text_size),
+        )
+        for number in range(1, count + 1)
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочный тест рассылки уведомлений через WebSocket: подключает '
+        'к ASGI-приложению в процессе тысячи клиентов `MyConsumer` и '
+        'рассылает им письма и прогресс функциями из msg/services.py '
+        'через слой каналов в памяти.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--clients', type=int, default=1000,
+            help='Количество одновременных WebSocket-клиентов.',
+        )
+        parser.add_argument(
+            '--messages', type=int, default=50,
+            help='Количество писем в рассылке.',
+        )
+        parser.add_argument(
+            '--rate', type=float, default=20,
+            help=(
+                'Писем в секунду (за каждым письмом идет событие '
+                'прогресса); 0 — без пауз.'
+            ),
+        )
+        parser.add_argument(
+            '--text-size', type=int, default=200,
+            help='Размер текста письма, символов.',
+        )
+        parser.add_argument(
+            '--capacity', type=int, default=1000,
+            help='Емкость очереди канала одного клиента.',
+        )
+        parser.add_argument(
+            '--timeout', type=float, default=30,
+            help='Сколько секунд ждать доставки всех событий.',
+        )
+        parser.add_argument(
+            '--settings-layer', action='store_true',
+            help=(
+                'Использовать слой каналов из настроек (Redis) вместо '
+                'слоя в памяти.'
+            ),
+        )
+
+    def handle(self, *args, **options):
+        if options['clients'] < 1 or options['messages'] < 1:
+            raise CommandError('Нужен хотя бы один клиент и одно письмо')
+        layers = {
+            'default': {
+                'BACKEND': f'{__name__}.BenchChannelLayer',
+                'CONFIG': {'capacity': options['capacity']},
+            },
+        }
+        if options['settings_layer']:
+            asyncio.run(self.run_bench(options))
+            return
+        with override_settings(CHANNEL_LAYERS=layers):
+            asyncio.run(self.run_bench(options))
+
+    async def run_bench(self, options):
+        clients, total = options['clients'], options['messages']
+        messages = build_messages(total, options['text_size'])
+        mail_list = [str(number).encode() for number in range(total)]
+        # Время отправки каждого события: письма по id, прогресс по номеру
+        sent = {}
+        latencies = []
+        received = 0
+
+        tracemalloc.start()
+        memory_before = tracemalloc.get_traced_memory()[0]
+        started = time.perf_counter()
+        communicators = []
+        for _ in range(clients):
+            communicator = WebsocketCommunicator(application, WS_PATH)
+            connected, _ = await communicator.connect()
+            if not connected:
+                raise CommandError('Клиент не подключился')
+            await communicator.receive_json_from()
+            communicators.append(communicator)
+        connect_time = time.perf_counter() - started
+        memory_per_client = (
+            tracemalloc.get_traced_memory()[0] - memory_before
+        ) / clients
+        tracemalloc.stop()
+
+        expected = clients * total * 2
+        done = asyncio.Event()
+
+        async def listen(communicator):
+            nonlocal received
+            while True:
+                try:
+                    event = await communicator.receive_json_from(
+                        timeout=options['timeout']
+                    )
+                except asyncio.TimeoutError:
+                    return
+                now = time.perf_counter()
+                if event['type'] == 'email':
+                    key = ('email', event['email_data']['id'])
+                else:
+                    key = ('progress', event['progress']['count'])
+                latencies.append(now - sent[key])
+                received += 1
+                if received == expected:
+                    done.set()
+
+        listeners = [
+            asyncio.create_task(listen(communicator))
+            for communicator in communicators
+        ]
+        interval = 1 / options['rate'] if options['rate'] else 0
+        started = time.perf_counter()
+        for counter, email_message in enumerate(messages):
+            sent[('email', email_message.id)] = time.perf_counter()
+            await send_email_by_websocket(email_message)
+            sent[('progress', counter + 1)] = time.perf_counter()
+            await progress_bar(mail_list, counter)
+            await asyncio.sleep(interval)
+        try:
+            await asyncio.wait_for(done.wait(), options['timeout'])
+        except asyncio.TimeoutError:
+            pass
+        elapsed = time.perf_counter() - started
+
+        for listener in listeners:
+            listener.cancel()
+        await asyncio.gather(*listeners, return_exceptions=True)
+        for communicator in communicators:
+            await communicator.disconnect()
+        self.report(
+            options, connect_time, memory_per_client, elapsed,
+            latencies, expected,
+        )
+
+    def report(self, options, connect_time, memory_per_client, elapsed,
+               latencies, expected):
+        self.stdout.write(
+            f'Клиентов {options["clients"]}: подключение '
+            f'{connect_time:.2f} с, память {memory_per_client / 1024:.1f} '
+            f'КБ на подключение'
+        )
+        lost = expected - len(latencies)
+        self.stdout.write(
+            f'Доставлено {len(latencies)} из {expected} событий '
+            f'(потеряно {lost}) за {elapsed:.2f} с, '
+            f'{len(latencies) / elapsed:.0f} сообщений/с'
+        )
+        if len(latencies) < 2:
+            return
+        quantiles = statistics.quantiles(latencies, n=100)
+        self.stdout.write(
+            f'Задержка доставки: p50 {quantiles[49] * 1000:.1f} мс, '
+            f'p95 {quantiles[94] * 1000:.1f} мс, '
+            f'p99 {quantiles[98] * 1000:.1f} мс, '
+            f'макс. {max(latencies) * 1000:.1f} мс'
+        )
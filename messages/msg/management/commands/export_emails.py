@@ -0,0 +1,47 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from msg.exporters import EXPORT_FORMATS, get_export_queryset
+from msg.models import Email
+
+
+class Command(BaseCommand):
+    help = 'Потоковая выгрузка писем почтового ящика (NDJSON, CSV, mbox).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('email', help='Почтовый ящик.')
+        parser.add_argument(
+            '--format', dest='export_format', default='ndjson',
+            choices=tuple(EXPORT_FORMATS),
+        )
+        parser.add_argument(
+            '--files', action='store_true',
+            help='Добавить вложения.',
+        )
+        parser.add_argument(
+            '--output', help='Файл для выгрузки (по умолчанию stdout).',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            account = Email.objects.get(email=options['email'])
+        except Email.DoesNotExist:
+            raise CommandError(f'Почта {options["email"]} не найдена')
+
+        with_files = options['files']
+        exporter, _, _ = EXPORT_FORMATS[options['export_format']]
+        output = (
+            open(options['output'], 'wb') if options['output']
+            else sys.stdout.buffer
+        )
+        try:
+            for chunk in exporter(
+                get_export_queryset(account, with_files), with_files
+            ):
+                output.write(
+                    chunk if isinstance(chunk, bytes) else chunk.encode()
+                )
+        finally:
+            if options['output']:
+                output.close()
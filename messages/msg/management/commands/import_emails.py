@@ -0,0 +1,49 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from msg.importers import import_mailbox
+from msg.models import Email
+
+
+class Command(BaseCommand):
+    help = 'Импорт писем из архивов mbox и каталогов Maildir.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('email', help='Почтовый ящик.')
+        parser.add_argument(
+            'paths', nargs='+', type=Path,
+            help='Файлы mbox или каталоги Maildir.',
+        )
+        parser.add_argument(
+            '--workers', type=int, default=4,
+            help='Количество процессов разбора писем.',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Количество писем в одной массовой вставке.',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            account = Email.objects.get(email=options['email'])
+        except Email.DoesNotExist:
+            raise CommandError(f'Почта {options["email"]} не найдена')
+        for path in options['paths']:
+            if not path.exists():
+                raise CommandError(f'Путь {path} не найден')
+
+        stats = import_mailbox(
+            account, options['paths'],
+            workers=options['workers'],
+            batch_size=options['batch_size'],
+        )
+        megabytes = stats['bytes'] / 1024 / 1024
+        self.stdout.write(self.style.SUCCESS(
+            f'Прочитано {stats["read"]}, сохранено {stats["imported"]}, '
+            f'пропущено {stats["skipped"]}, ошибок {stats["failed"]}\n'
+            f'{megabytes:.1f} МБ за {stats["elapsed"]:.1f} с: '
+            f'{stats["messages_per_second"]:.0f} писем/с, '
+            f'{megabytes / stats["elapsed"] if stats["elapsed"] else 0:.1f} '
+            'МБ/с'
+        ))
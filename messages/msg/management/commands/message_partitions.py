@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from msg.partitions import (CONVERT_BATCH_SIZE, convert_to_partitioned,
+                            ensure_partitions, get_partitions, is_partitioned)
+
+
+class Command(BaseCommand):
+    help = 'Управление помесячными секциями таблицы писем (PostgreSQL).'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'action', choices=('status', 'convert', 'ensure'),
+            help=(
+                'status - показать секции, convert - перевести таблицу на '
+                'секционирование, ensure - создать секции на будущие месяцы.'
+            ),
+        )
+        parser.add_argument(
+            '--months-ahead', type=int, default=3,
+            help='На сколько месяцев вперед создавать секции.',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=CONVERT_BATCH_SIZE,
+            help='Сколько писем переносить в одной транзакции при convert.',
+        )
+
+    def handle(self, *args, **options):
+        action = options['action']
+
+        if action == 'convert':
+            try:
+                created = convert_to_partitioned(
+                    options['months_ahead'], max(options['batch_size'], 1)
+                )
+            except ValueError as err:
+                raise CommandError(err)
+            self.stdout.write(self.style.SUCCESS(
+                f'Таблица секционирована, секций: {len(created)}'
+            ))
+            return
+
+        if not is_partitioned():
+            self.stdout.write(
+                'Таблица писем не секционирована, используется обычная '
+                'таблица.'
+            )
+            return
+
+        if action == 'ensure':
+            created = ensure_partitions(options['months_ahead'])
+            self.stdout.write(self.style.SUCCESS(
+                f'Создано секций: {len(created)}'
+            ))
+            return
+
+        for name, month in get_partitions():
+            self.stdout.write(f'{month:%Y-%m}  {name}')
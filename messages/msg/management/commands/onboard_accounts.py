@@ -0,0 +1,72 @@
+import sys
+from collections import Counter
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from msg.constants import ONBOARD_WORKERS
+from msg.onboarding import (CSV, DATA_FORMATS, JSON, onboard_accounts,
+                            parse_accounts)
+
+
+class Command(BaseCommand):
+    help = (
+        'Добавляет почтовые ящики из CSV или JSON: проверяет домены и вход '
+        'по IMAP и сохраняет ящики одной транзакцией.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            help='Файл CSV или JSON со столбцами email, password, provider '
+                 '(- для чтения из stdin).',
+        )
+        parser.add_argument(
+            '--format', choices=DATA_FORMATS, dest='data_format',
+            help='Формат файла (по умолчанию по расширению, иначе CSV).',
+        )
+        parser.add_argument(
+            '--workers', type=int, default=ONBOARD_WORKERS,
+            help='Количество одновременных проверок входа по IMAP.',
+        )
+        parser.add_argument(
+            '--no-verify', action='store_true',
+            help='Не проверять вход по IMAP.',
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только проверить ящики, не сохраняя их.',
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        data_format = options['data_format']
+        if path == '-':
+            content = sys.stdin.read()
+        else:
+            path = Path(path)
+            if not path.exists():
+                raise CommandError(f'Путь {path} не найден')
+            content = path.read_text(encoding='utf-8-sig')
+            if not data_format and path.suffix.lower() == '.json':
+                data_format = JSON
+        try:
+            accounts = parse_accounts(content, data_format or CSV)
+        except ValueError as err:
+            raise CommandError(f'Ошибка разбора списка ящиков: {err}')
+
+        results = onboard_accounts(
+            accounts, max(options['workers'], 1),
+            verify=not options['no_verify'], save=not options['dry_run'],
+        )
+        for result in results:
+            line = f'{result["email"] or "-"}: {result["status"]}'
+            if result['error']:
+                line = f'{line} ({result["error"]})'
+            self.stdout.write(line)
+        counts = Counter(result['status'] for result in results)
+        self.stdout.write(self.style.SUCCESS(
+            f'Ящиков {len(results)}: ' + ', '.join(
+                f'{status} {count}' for status, count in counts.items()
+            )
+        ))
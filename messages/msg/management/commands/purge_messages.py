@@ -0,0 +1,48 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from msg.models import MessageData
+from msg.retention import get_cutoff, purge_messages
+
+
+class Command(BaseCommand):
+    help = 'Удаляет или архивирует письма старше срока хранения.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--months', type=int, required=True,
+            help='Сколько полных месяцев хранить письма.',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Количество писем в одной транзакции.',
+        )
+        parser.add_argument(
+            '--archive-dir', type=Path,
+            help='Каталог для архива писем и вложений перед удалением.',
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать количество писем к удалению.',
+        )
+
+    def handle(self, *args, **options):
+        cutoff = get_cutoff(options['months'])
+        if options['dry_run']:
+            count = MessageData.objects.filter(
+                receipt_date__lt=cutoff
+            ).count()
+            self.stdout.write(f'Писем до {cutoff}: {count}')
+            return
+
+        stats = purge_messages(
+            cutoff,
+            batch_size=options['batch_size'],
+            archive_dir=options['archive_dir'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Удалено до {cutoff}: секций {stats["partitions"]}, '
+            f'писем {stats["messages"]}, вложений {stats["files"]}, '
+            f'тел писем {stats["bodies"]}'
+        ))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from msg.models import Email
+from msg.stats import rebuild_stats
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает статистику по отправителям и дням.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'emails', nargs='*',
+            help='Почтовые ящики (по умолчанию все).',
+        )
+
+    def handle(self, *args, **options):
+        accounts = Email.objects.all()
+        if options['emails']:
+            accounts = accounts.filter(email__in=options['emails'])
+            missing = set(options['emails']) - set(
+                accounts.values_list('email', flat=True)
+            )
+            if missing:
+                raise CommandError(
+                    f'Почта {", ".join(sorted(missing))} не найдена'
+                )
+
+        for account in accounts:
+            totals = rebuild_stats(account)
+            self.stdout.write(
+                f'{account.email}: писем {totals["messages"]}, '
+                f'отправителей {totals["senders"]}, дней {totals["days"]}'
+            )
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from msg.models import Email
+from msg.threads import rebuild_threads
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает цепочки писем по сохраненным письмам.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'emails', nargs='*',
+            help='Почтовые ящики (по умолчанию все).',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Количество писем, читаемых за один запрос.',
+        )
+
+    def handle(self, *args, **options):
+        accounts = Email.objects.all()
+        if options['emails']:
+            accounts = accounts.filter(email__in=options['emails'])
+            missing = set(options['emails']) - set(
+                accounts.values_list('email', flat=True)
+            )
+            if missing:
+                raise CommandError(
+                    f'Почта {", ".join(sorted(missing))} не найдена'
+                )
+
+        for account in accounts:
+            total = rebuild_threads(account, options['batch_size'])
+            threads = account.threads.count()
+            self.stdout.write(
+                f'{account.email}: писем {total}, цепочек {threads}'
+            )
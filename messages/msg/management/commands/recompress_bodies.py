@@ -0,0 +1,111 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from msg.bodies import (decompress_account, delete_unused_dictionaries,
+                        recompress_account, train_account_dictionaries)
+from msg.constants import (BODY_DICT_MAX_SAMPLES, BODY_DICT_MIN_SAMPLES,
+                           BODY_DICT_SIZE, COMPRESS_BATCH_SIZE)
+from msg.models import Email
+
+
+class Command(BaseCommand):
+    help = (
+        'Обучает словари сжатия почтовых ящиков и их отправителей, '
+        'пересжимает ими тела писем и выводит степень сжатия и время '
+        'распаковки.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'emails', nargs='*',
+            help='Почтовые ящики (по умолчанию все).',
+        )
+        parser.add_argument(
+            '--no-train', action='store_true',
+            help='Не обучать словари, использовать уже обученные.',
+        )
+        parser.add_argument(
+            '--account-only', action='store_true',
+            help='Обучать только общий словарь ящика, без отправителей.',
+        )
+        parser.add_argument(
+            '--min-samples', type=int, default=BODY_DICT_MIN_SAMPLES,
+            help='Минимальное число писем для обучения словаря.',
+        )
+        parser.add_argument(
+            '--max-samples', type=int, default=BODY_DICT_MAX_SAMPLES,
+            help='Максимальное число писем для обучения словаря.',
+        )
+        parser.add_argument(
+            '--dict-size', type=int, default=BODY_DICT_SIZE,
+            help='Максимальный размер словаря, байт.',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=COMPRESS_BATCH_SIZE,
+            help='Количество писем в одной пачке.',
+        )
+        parser.add_argument(
+            '--decompress', action='store_true',
+            help='Вернуть тела писем к хранению без сжатия.',
+        )
+
+    def handle(self, *args, **options):
+        accounts = Email.objects.all()
+        if options['emails']:
+            accounts = accounts.filter(email__in=options['emails'])
+            missing = set(options['emails']) - set(
+                accounts.values_list('email', flat=True)
+            )
+            if missing:
+                raise CommandError(
+                    f'Почта {", ".join(sorted(missing))} не найдена'
+                )
+
+        for account in accounts:
+            if options['decompress']:
+                total = decompress_account(account, options['batch_size'])
+                deleted = delete_unused_dictionaries(
+                    account, keep_current=False
+                )
+                self.stdout.write(
+                    f'{account.email}: распаковано тел {total}, '
+                    f'удалено словарей {deleted}'
+                )
+                continue
+
+            if not options['no_train']:
+                for dictionary in train_account_dictionaries(
+                        account, not options['account_only'],
+                        options['min_samples'], options['max_samples'],
+                        options['dict_size']):
+                    self.stdout.write(
+                        f'{account.email}: словарь '
+                        f'{dictionary.sender or "ящика"} '
+                        f'({dictionary.codec}, {len(dictionary.data)} байт), '
+                        f'образцов {dictionary.sample_count}, '
+                        f'сжатие x{dictionary.ratio}'
+                    )
+            stats = recompress_account(account, options['batch_size'])
+            deleted = delete_unused_dictionaries(account)
+            self.report(account, stats, deleted)
+
+    def report(self, account, stats, deleted):
+        ratio = (
+            stats['raw_bytes'] / stats['stored_bytes']
+            if stats['stored_bytes'] else 0
+        )
+        self.stdout.write(
+            f'{account.email}: тел {stats["bodies"]:.0f}, сжато '
+            f'{stats["compressed"]:.0f}, пересжато {stats["changed"]:.0f}, '
+            f'общих с другими ящиками {stats["shared"]:.0f}, '
+            f'{stats["raw_bytes"] / 2 ** 20:.2f} МБ -> '
+            f'{stats["stored_bytes"] / 2 ** 20:.2f} МБ (x{ratio:.2f}), '
+            f'удалено словарей {deleted}'
+        )
+        if stats['compressed'] and stats['decode_seconds']:
+            self.stdout.write(
+                f'{account.email}: распаковка '
+                f'{stats["decode_seconds"] / stats["compressed"] * 1e6:.1f} '
+                f'мкс на письмо, '
+                f'{stats["raw_bytes"] / stats["decode_seconds"] / 2 ** 20:.0f}'
+                f' МБ/с'
+            )
@@ -0,0 +1,79 @@
+import signal
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from msg.leases import (get_due_accounts, get_node_name, holds_lease,
+                        mark_synced, rebalance, release_all)
+from msg.services import get_data_and_send_to_ws
+from msg.workers import get_worker
+
+
+def sync_leased_account(node: str, email_id: int) -> None:
+    """
+    Синхронизирует почтовый ящик, если узел все еще держит его аренду.
+
+    Аренда проверяется и во время синхронизации и догрузки: если ящик
+    перешел к другому узлу, этот узел прекращает работу с ним.
+
+    Args:
+        node (str): Имя узла.
+        email_id (int): Идентификатор почтового ящика.
+    """
+    if not holds_lease(node, email_id):
+        return
+    started_at = timezone.now()
+    try:
+        get_data_and_send_to_ws(email_id, node)
+    finally:
+        mark_synced(email_id, started_at)
+
+
+class Command(BaseCommand):
+    help = (
+        'Запускает узел синхронизации почты. Узлы делят почтовые ящики '
+        'поровну по арендам в базе данных и синхронизируют только свои.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--name',
+            help='Имя узла (по умолчанию SYNC_NODE_NAME или хост и PID).',
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Выполнить один шаг распределения и вывести аренды.',
+        )
+
+    def handle(self, *args, **options):
+        node = options['name'] or get_node_name()
+
+        if options['once']:
+            owned = rebalance(node)
+            self.stdout.write(f'{node}: {len(owned)} ящиков {sorted(owned)}')
+            return
+
+        stop = threading.Event()
+        signal.signal(signal.SIGTERM, lambda *args: stop.set())
+        worker = get_worker()
+        self.stdout.write(f'Узел {node} запущен')
+        try:
+            while not stop.is_set():
+                busy = {key[1] for key in worker.busy_keys()}
+                owned = rebalance(node, busy)
+                for email_id in get_due_accounts(node):
+                    if email_id not in busy:
+                        worker.submit(
+                            ('sync', email_id), sync_leased_account,
+                            node, email_id,
+                        )
+                self.stdout.write(f'{node}: {len(owned)} ящиков')
+                stop.wait(settings.SYNC_HEARTBEAT_INTERVAL)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            worker.shutdown(settings.EMBEDDED_WORKER_SHUTDOWN_TIMEOUT)
+            release_all(node)
+            self.stdout.write(f'Узел {node} остановлен, аренды освобождены')
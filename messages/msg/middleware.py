@@ -0,0 +1,91 @@
+from asgiref.sync import (iscoroutinefunction, markcoroutinefunction,
+                          sync_to_async)
+from django.conf import settings
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from .routers import RoutingState, start_request
+
+REPLICA_PIN_COOKIE = 'msg_primary'
+
+
+class AsyncWhiteNoiseMiddleware(WhiteNoiseMiddleware):
+    """
+    Middleware WhiteNoise с поддержкой асинхронной цепочки.
+
+    Исходный `WhiteNoiseMiddleware` только синхронный, из-за чего Django
+    под ASGI переводит всю цепочку middleware в синхронный режим и
+    выполняет асинхронные представления в потоке. Этот вариант отдает
+    статические файлы так же, а остальные запросы передает дальше без
+    переключения между потоками.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, settings=settings):
+        super().__init__(get_response, settings)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(
+                self.find_file, thread_sensitive=False
+            )(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return await sync_to_async(
+                self.serve, thread_sensitive=False
+            )(static_file, request)
+        return await self.get_response(request)
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Middleware, разрешающий чтение с реплик базы данных.
+
+    Реплики разрешаются для запросов GET и HEAD. После запроса, который
+    записал данные в базу, клиенту ставится cookie, и его запросы
+    `REPLICA_PIN_SECONDS` секунд читают из основной базы, чтобы страница
+    после перенаправления показывала только что записанные данные.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = self.start(request)
+        return self.finish(state, self.get_response(request))
+
+    async def __acall__(self, request):
+        state = self.start(request)
+        return self.finish(state, await self.get_response(request))
+
+    def start(self, request) -> RoutingState:
+        return start_request(
+            bool(settings.DATABASE_REPLICAS)
+            and request.method in ('GET', 'HEAD')
+            and REPLICA_PIN_COOKIE not in request.COOKIES
+        )
+
+    def finish(self, state: RoutingState, response):
+        if state.wrote:
+            response.set_cookie(
+                REPLICA_PIN_COOKIE, '1',
+                max_age=settings.REPLICA_PIN_SECONDS, httponly=True,
+                samesite='Lax',
+            )
+        return response
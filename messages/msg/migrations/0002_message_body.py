@@ -0,0 +1,65 @@
+# Generated by Django 5.1.15 on 2026-10-18 12:00
+
+import hashlib
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def move_text_to_body(apps, schema_editor):
+    MessageBody = apps.get_model('msg', 'MessageBody')
+    MessageData = apps.get_model('msg', 'MessageData')
+    for message in MessageData.objects.only('id', 'text').iterator():
+        content_hash = hashlib.sha256(
+            (message.text or '').encode('utf-8')
+        ).hexdigest()
+        body, _ = MessageBody.objects.get_or_create(
+            message_id='', content_hash=content_hash,
+            defaults={'text': message.text},
+        )
+        MessageData.objects.filter(id=message.id).update(body=body)
+
+
+def move_body_to_text(apps, schema_editor):
+    MessageData = apps.get_model('msg', 'MessageData')
+    for message in MessageData.objects.select_related('body').iterator():
+        if message.body_id:
+            MessageData.objects.filter(id=message.id).update(
+                text=message.body.text
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('msg', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MessageBody',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания записи')),
+                ('message_id', models.CharField(blank=True, default='', max_length=998, verbose_name='Message-ID')),
+                ('content_hash', models.CharField(max_length=64, verbose_name='Хеш содержимого')),
+                ('text', models.TextField(null=True, verbose_name='Текст сообщения')),
+            ],
+            options={
+                'verbose_name': 'Тело письма',
+                'verbose_name_plural': 'Тела писем',
+                'ordering': ('created_at',),
+                'constraints': [models.UniqueConstraint(fields=('message_id', 'content_hash'), name='unique_message_body')],
+            },
+        ),
+        migrations.AddField(
+            model_name='messagedata',
+            name='body',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='messages', to='msg.messagebody', verbose_name='Тело письма'),
+        ),
+        migrations.RunPython(move_text_to_body, move_body_to_text),
+        migrations.RemoveField(
+            model_name='messagedata',
+            name='text',
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.15 on 2026-10-18 23:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('msg', '0002_message_body'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='messagedata',
+            index=models.Index(fields=['email', '-receipt_date'], name='messagedata_email_receipt_idx'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.1.15 on 2026-10-18 23:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('msg', '0003_messagedata_email_receipt_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncNode',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания записи')),
+                ('name', models.CharField(max_length=255, unique=True, verbose_name='Имя узла')),
+                ('heartbeat_at', models.DateTimeField(verbose_name='Последняя отметка')),
+            ],
+            options={
+                'verbose_name': 'Узел синхронизации',
+                'verbose_name_plural': 'Узлы синхронизации',
+                'ordering': ('name',),
+            },
+        ),
+        migrations.CreateModel(
+            name='SyncState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания записи')),
+                ('owner', models.CharField(blank=True, db_index=True, default='', max_length=255, verbose_name='Узел-владелец')),
+                ('lease_expires_at', models.DateTimeField(blank=True, null=True, verbose_name='Аренда до')),
+                ('requested_at', models.DateTimeField(blank=True, null=True, verbose_name='Запрошена синхронизация')),
+                ('last_synced_at', models.DateTimeField(blank=True, null=True, verbose_name='Последняя синхронизация')),
+                ('email', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='sync_state', to='msg.email', verbose_name='Почта')),
+            ],
+            options={
+                'verbose_name': 'Состояние синхронизации',
+                'verbose_name_plural': 'Состояния синхронизации',
+                'ordering': ('email',),
+            },
+        ),
+    ]
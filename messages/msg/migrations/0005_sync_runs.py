@@ -0,0 +1,42 @@
+# Generated by Django 5.1.15 on 2026-10-18 23:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('msg', '0004_sync_leases'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания записи')),
+                ('kind', models.CharField(choices=[('INTERACTIVE', 'Интерактивная'), ('BACKFILL', 'Догрузка')], default='INTERACTIVE', verbose_name='Тип')),
+                ('started_at', models.DateTimeField(verbose_name='Начало')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Окончание')),
+                ('duration', models.FloatField(blank=True, null=True, verbose_name='Длительность, с')),
+                ('messages_seen', models.PositiveIntegerField(default=0, verbose_name='Просмотрено писем')),
+                ('messages_new', models.PositiveIntegerField(default=0, verbose_name='Новых писем')),
+                ('messages_skipped', models.PositiveIntegerField(default=0, verbose_name='Пропущено писем')),
+                ('bytes_transferred', models.BigIntegerField(default=0, verbose_name='Загружено байт')),
+                ('stages', models.JSONField(blank=True, default=dict, verbose_name='Длительность этапов, с')),
+                ('throughput', models.FloatField(blank=True, null=True, verbose_name='Писем в секунду')),
+                ('baseline', models.FloatField(blank=True, null=True, verbose_name='База, писем в секунду')),
+                ('is_slow', models.BooleanField(default=False, verbose_name='Медленный запуск')),
+                ('error_class', models.CharField(blank=True, default='', max_length=255, verbose_name='Класс ошибки')),
+                ('error_message', models.TextField(blank=True, default='', verbose_name='Текст ошибки')),
+                ('email', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sync_runs', to='msg.email', verbose_name='Почта')),
+            ],
+            options={
+                'verbose_name': 'Запуск синхронизации',
+                'verbose_name_plural': 'Запуски синхронизации',
+                'ordering': ('-started_at',),
+                'indexes': [models.Index(fields=['email', '-started_at'], name='syncrun_email_started_idx')],
+            },
+        ),
+    ]
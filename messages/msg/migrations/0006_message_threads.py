@@ -0,0 +1,70 @@
+# Generated by Django 5.1.15 on 2026-10-18 23:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('msg', '0005_sync_runs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='messagedata',
+            name='in_reply_to',
+            field=models.CharField(blank=True, default='', max_length=998, verbose_name='In-Reply-To'),
+        ),
+        migrations.AddField(
+            model_name='messagedata',
+            name='references',
+            field=models.TextField(blank=True, default='', verbose_name='References'),
+        ),
+        migrations.CreateModel(
+            name='MessageThread',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания записи')),
+                ('subject', models.CharField(blank=True, default='', max_length=256, verbose_name='Тема')),
+                ('message_count', models.PositiveIntegerField(default=0, verbose_name='Писем в цепочке')),
+                ('last_receipt_date', models.DateField(blank=True, null=True, verbose_name='Дата последнего письма')),
+                ('email', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='threads', to='msg.email', verbose_name='Почта')),
+                ('last_message', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='msg.messagedata', verbose_name='Последнее письмо')),
+            ],
+            options={
+                'verbose_name': 'Цепочка писем',
+                'verbose_name_plural': 'Цепочки писем',
+                'ordering': ('-last_receipt_date', '-id'),
+            },
+        ),
+        migrations.CreateModel(
+            name='ThreadContainer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания записи')),
+                ('message_id', models.CharField(max_length=998, verbose_name='Message-ID')),
+                ('parent_message_id', models.CharField(blank=True, default='', max_length=998, verbose_name='Message-ID родителя')),
+                ('email', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='thread_containers', to='msg.email', verbose_name='Почта')),
+                ('email_message', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='thread_containers', to='msg.messagedata', verbose_name='Письмо')),
+                ('thread', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='containers', to='msg.messagethread', verbose_name='Цепочка')),
+            ],
+            options={
+                'verbose_name': 'Узел цепочки',
+                'verbose_name_plural': 'Узлы цепочек',
+                'ordering': ('created_at',),
+            },
+        ),
+        migrations.AddIndex(
+            model_name='messagethread',
+            index=models.Index(fields=['email', '-last_receipt_date', '-id'], name='thread_email_last_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='messagethread',
+            index=models.Index(fields=['email', 'subject'], name='thread_email_subject_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='threadcontainer',
+            constraint=models.UniqueConstraint(fields=('email', 'message_id'), name='unique_thread_container'),
+        ),
+    ]
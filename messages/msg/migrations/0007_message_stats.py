@@ -0,0 +1,48 @@
+# Generated by Django 5.1.15 on 2026-10-18 23:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('msg', '0006_message_threads'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания записи')),
+                ('day', models.DateField(verbose_name='День')),
+                ('message_count', models.PositiveIntegerField(default=0, verbose_name='Писем')),
+                ('email', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='msg.email', verbose_name='Почта')),
+            ],
+            options={
+                'verbose_name': 'Статистика по дню',
+                'verbose_name_plural': 'Статистика по дням',
+                'ordering': ('-day',),
+                'constraints': [models.UniqueConstraint(fields=('email', 'day'), name='unique_daily_stat')],
+            },
+        ),
+        migrations.CreateModel(
+            name='SenderStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания записи')),
+                ('sender', models.CharField(max_length=256, verbose_name='Отправитель')),
+                ('message_count', models.PositiveIntegerField(default=0, verbose_name='Писем')),
+                ('last_receipt_date', models.DateField(blank=True, null=True, verbose_name='Дата последнего письма')),
+                ('email', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sender_stats', to='msg.email', verbose_name='Почта')),
+            ],
+            options={
+                'verbose_name': 'Статистика по отправителю',
+                'verbose_name_plural': 'Статистика по отправителям',
+                'ordering': ('-message_count',),
+                'indexes': [models.Index(fields=['email', '-message_count'], name='senderstat_email_count_idx')],
+                'constraints': [models.UniqueConstraint(fields=('email', 'sender'), name='unique_sender_stat')],
+            },
+        ),
+    ]
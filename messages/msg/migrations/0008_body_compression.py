@@ -0,0 +1,67 @@
+# Generated by Django 5.1.15 on 2026-10-19 00:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('msg', '0007_message_stats'),
+    ]
+
+    operations = [
+        # Текст остается в столбце text, меняется только имя поля модели
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.RenameField(
+                    model_name='messagebody',
+                    old_name='text',
+                    new_name='plain_text',
+                ),
+                migrations.AlterField(
+                    model_name='messagebody',
+                    name='plain_text',
+                    field=models.TextField(db_column='text', null=True, verbose_name='Текст сообщения'),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name='messagebody',
+            name='codec',
+            field=models.CharField(blank=True, choices=[('zlib', 'zlib'), ('zstd', 'Zstandard')], default='', max_length=16, verbose_name='Алгоритм сжатия'),
+        ),
+        migrations.AddField(
+            model_name='messagebody',
+            name='compressed_text',
+            field=models.BinaryField(null=True, verbose_name='Сжатый текст сообщения'),
+        ),
+        migrations.CreateModel(
+            name='CompressionDictionary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания записи')),
+                ('sender', models.CharField(blank=True, default='', max_length=256, verbose_name='Отправитель')),
+                ('codec', models.CharField(choices=[('zlib', 'zlib'), ('zstd', 'Zstandard')], default='zlib', max_length=16, verbose_name='Алгоритм')),
+                ('data', models.BinaryField(verbose_name='Словарь')),
+                ('sample_count', models.PositiveIntegerField(default=0, verbose_name='Образцов')),
+                ('sample_bytes', models.PositiveBigIntegerField(default=0, verbose_name='Объем образцов, байт')),
+                ('compressed_bytes', models.PositiveBigIntegerField(default=0, verbose_name='Объем образцов после сжатия, байт')),
+                ('email', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='compression_dictionaries', to='msg.email', verbose_name='Почта')),
+            ],
+            options={
+                'verbose_name': 'Словарь сжатия',
+                'verbose_name_plural': 'Словари сжатия',
+                'ordering': ('created_at',),
+            },
+        ),
+        migrations.AddField(
+            model_name='messagebody',
+            name='dictionary',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='bodies', to='msg.compressiondictionary', verbose_name='Словарь сжатия'),
+        ),
+        migrations.AddIndex(
+            model_name='compressiondictionary',
+            index=models.Index(fields=['email', 'sender', '-id'], name='dictionary_email_sender_idx'),
+        ),
+    ]
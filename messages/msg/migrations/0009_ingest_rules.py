@@ -0,0 +1,32 @@
+# Generated by Django 5.1.15 on 2026-10-19 00:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('msg', '0008_body_compression'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngestRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания записи')),
+                ('kind', models.CharField(choices=[('SENDER', 'Отправитель или домен'), ('SUBJECT', 'Тема'), ('LARGER', 'Размер больше, байт'), ('SMALLER', 'Размер меньше, байт'), ('SINCE', 'Получено не раньше (дата или число дней назад)'), ('BEFORE', 'Получено раньше (дата)')], verbose_name='Условие')),
+                ('action', models.CharField(choices=[('INCLUDE', 'Загружать'), ('EXCLUDE', 'Не загружать')], default='INCLUDE', verbose_name='Действие')),
+                ('value', models.CharField(help_text='Адрес, домен или часть темы; размер в байтах; дата ГГГГ-ММ-ДД или число дней назад.', max_length=255, verbose_name='Значение')),
+                ('is_regex', models.BooleanField(default=False, verbose_name='Регулярное выражение')),
+                ('is_active', models.BooleanField(default=True, verbose_name='Активно')),
+                ('email', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ingest_rules', to='msg.email', verbose_name='Почта')),
+            ],
+            options={
+                'verbose_name': 'Правило загрузки',
+                'verbose_name_plural': 'Правила загрузки',
+                'ordering': ('created_at',),
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.1.15 on 2026-10-19 00:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('msg', '0009_ingest_rules'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RejectedMessage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания записи')),
+                ('uid', models.CharField(max_length=255, verbose_name='UID')),
+                ('uid_validity', models.BigIntegerField(blank=True, null=True, verbose_name='UIDVALIDITY')),
+                ('email', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rejected_messages', to='msg.email', verbose_name='Почта')),
+            ],
+            options={
+                'verbose_name': 'Отклоненное письмо',
+                'verbose_name_plural': 'Отклоненные письма',
+                'ordering': ('created_at',),
+                'constraints': [models.UniqueConstraint(fields=('email', 'uid'), name='unique_rejected_message')],
+            },
+        ),
+    ]
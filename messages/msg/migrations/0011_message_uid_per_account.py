@@ -0,0 +1,41 @@
+# Generated by Django 5.1.15 on 2026-10-19 00:45
+
+from django.db import migrations, models
+
+
+def mark_imported_messages(apps, schema_editor):
+    MessageData = apps.get_model('msg', 'MessageData')
+    MessageData.objects.filter(uid__startswith='import-').update(
+        uid_validity=0
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('msg', '0010_rejected_messages'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='messagedata',
+            name='uid_validity',
+            field=models.BigIntegerField(blank=True, null=True, verbose_name='UIDVALIDITY'),
+        ),
+        migrations.AlterField(
+            model_name='messagedata',
+            name='uid',
+            field=models.CharField(max_length=255),
+        ),
+        migrations.RunPython(
+            mark_imported_messages, migrations.RunPython.noop
+        ),
+        migrations.AddConstraint(
+            model_name='messagedata',
+            constraint=models.UniqueConstraint(fields=('email', 'uid_validity', 'uid'), name='unique_message_uid'),
+        ),
+        migrations.AddConstraint(
+            model_name='messagedata',
+            constraint=models.UniqueConstraint(condition=models.Q(('uid_validity__isnull', True)), fields=('email', 'uid'), name='unique_message_uid_without_validity'),
+        ),
+    ]
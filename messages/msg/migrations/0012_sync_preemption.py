@@ -0,0 +1,18 @@
+# Generated by Django 5.1.15 on 2026-10-19 00:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('msg', '0011_message_uid_per_account'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='syncstate',
+            name='preempt_requested_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Догрузка прервана для синхронизации'),
+        ),
+    ]
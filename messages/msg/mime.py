@@ -0,0 +1,237 @@
+import codecs
+import mimetypes
+from email.header import decode_header
+from email.message import Message
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+DEFAULT_CHARSET = 'utf-8'
+# Кодировки, которые пробуются, если указанная в письме не подошла;
+# cp1251 декодирует почти любые байты и поэтому идет последней
+FALLBACK_CHARSETS = ('utf-8', 'cp1251')
+CHARSET_ALIASES = {
+    'unknown-8bit': None,
+    'x-unknown': None,
+    'x-user-defined': None,
+    'cp-1251': 'cp1251',
+    'win-1251': 'cp1251',
+    'windows-1251r': 'cp1251',
+    'ks_c_5601-1987': 'cp949',
+}
+BODY_TYPES = ('text/plain', 'text/html')
+
+
+@lru_cache(maxsize=256)
+def lookup_codec(charset: Optional[str]) -> Optional[str]:
+    """
+    Возвращает имя кодека Python для кодировки из письма.
+
+    Результат кешируется: в потоке писем встречается несколько десятков
+    кодировок, а поиск кодека по имени относительно дорогой.
+
+    Args:
+        charset (Optional[str]): Кодировка из заголовка письма.
+
+    Returns:
+        str or None: Имя кодека или None, если кодировка не указана
+          или неизвестна.
+    """
+    if not charset:
+        return None
+    name = charset.strip().strip('"\'').lower()
+    name = CHARSET_ALIASES.get(name, name)
+    if not name:
+        return None
+    try:
+        return codecs.lookup(name).name
+    except LookupError:
+        return None
+
+
+def decode_bytes(data: bytes, charset: Optional[str]) -> str:
+    """
+    Декодирует байты письма в строку, не теряя письмо при ошибках.
+
+    Сначала пробуется указанная кодировка, затем `FALLBACK_CHARSETS`;
+    если ни одна не подошла, неизвестные байты заменяются символом
+    замены.
+
+    Args:
+        data (bytes): Данные.
+        charset (Optional[str]): Кодировка из заголовка письма.
+
+    Returns:
+        str: Декодированная строка.
+    """
+    codec = lookup_codec(charset)
+    for candidate in dict.fromkeys((codec, *FALLBACK_CHARSETS)):
+        if candidate is None:
+            continue
+        try:
+            return data.decode(candidate)
+        except UnicodeDecodeError:
+            continue
+    return data.decode(codec or DEFAULT_CHARSET, 'replace')
+
+
+def decode_header_value(value: Any | None) -> Optional[str]:
+    """
+    Декодирует значение заголовка со всеми MIME-фрагментами.
+
+    В отличие от взятия первого фрагмента `decode_header`, корректно
+    обрабатывает как закодированные, так и обычные строки, а также
+    значения из нескольких фрагментов в разных кодировках.
+
+    Args:
+        value (Any | None): Значение заголовка.
+
+    Returns:
+        str or None: Декодированное значение или None, если его нет.
+    """
+    if value is None:
+        return None
+    try:
+        fragments = decode_header(str(value))
+    except Exception:
+        return str(value)
+    return ''.join(
+        fragment if isinstance(fragment, str)
+        else decode_bytes(fragment, charset)
+        for fragment, charset in fragments
+    )
+
+
+class MessagePart:
+    """
+    Часть MIME-письма.
+
+    Хранит только сведения из заголовков части: тип, кодировку,
+    расположение, имя файла, Content-ID и размер закодированных данных.
+    Содержимое декодируется при первом обращении к `payload` или `text`,
+    поэтому ненужные части (например, HTML при наличии текста или
+    вложения уже сохраненного письма) не декодируются вовсе.
+    """
+
+    __slots__ = (
+        'index', 'content_type', 'charset', 'disposition', 'filename',
+        'content_id', 'size', '_part', '_payload',
+    )
+
+    def __init__(self, part: Message, index: int):
+        self.index = index
+        self.content_type = part.get_content_type()
+        self.charset = part.get_content_charset()
+        self.disposition = part.get_content_disposition()
+        self.filename = decode_header_value(part.get_filename())
+        content_id = part.get('Content-ID')
+        self.content_id = (
+            content_id.strip().strip('<>') if content_id else None
+        )
+        raw_payload = part.get_payload()
+        self.size = len(raw_payload) if isinstance(
+            raw_payload, (str, bytes)
+        ) else 0
+        self._part = part
+        self._payload = None
+
+    def __getstate__(self) -> Dict[str, Any]:
+        """Декодирует содержимое перед передачей в другой процесс."""
+        state = {slot: getattr(self, slot) for slot in self.__slots__}
+        state['_payload'] = self.payload
+        state['_part'] = None
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        for slot, value in state.items():
+            setattr(self, slot, value)
+
+    def __repr__(self) -> str:
+        return (
+            f'<MessagePart {self.index} {self.content_type} '
+            f'{self.filename or ""}>'
+        )
+
+    @property
+    def payload(self) -> bytes:
+        """Содержимое части без транспортной кодировки."""
+        if self._payload is None:
+            self._payload = self._part.get_payload(decode=True) or b''
+        return self._payload
+
+    @property
+    def text(self) -> str:
+        """Содержимое текстовой части в виде строки."""
+        return decode_bytes(self.payload, self.charset)
+
+    @property
+    def is_body(self) -> bool:
+        """Является ли часть текстом или HTML-контентом письма."""
+        return (
+            self.content_type in BODY_TYPES
+            and self.disposition != 'attachment'
+        )
+
+    @property
+    def is_attachment(self) -> bool:
+        """Является ли часть вложением, в том числе встроенным в HTML."""
+        return not self.is_body and bool(
+            self.disposition == 'attachment'
+            or self.filename or self.content_id
+        )
+
+    @property
+    def file_name(self) -> str:
+        """Имя файла вложения; для частей без имени строится по номеру."""
+        if self.filename:
+            return self.filename
+        extension = mimetypes.guess_extension(self.content_type) or '.bin'
+        return f'part-{self.index}{extension}'
+
+    def describe(self) -> Dict[str, Any]:
+        """Возвращает сведения о вложении для списка файлов письма."""
+        description = {
+            'filename': self.file_name,
+            'content_type': self.content_type,
+            'size': self.size,
+        }
+        if self.content_id:
+            description['content_id'] = self.content_id
+        return description
+
+
+class MessageParts:
+    """
+    Части MIME-письма, собранные за один проход по дереву письма.
+
+    Текст и HTML склеиваются один раз через `str.join`, поэтому время
+    разбора линейно по числу частей.
+    """
+
+    def __init__(self, message: Message):
+        self.parts: List[MessagePart] = [
+            MessagePart(part, index)
+            for index, part in enumerate(message.walk())
+            if not part.is_multipart()
+        ]
+
+    def get_content(self, content_type: str) -> str:
+        """Возвращает склеенное содержимое частей тела указанного типа."""
+        return ''.join(
+            part.text for part in self.parts
+            if part.is_body and part.content_type == content_type
+        )
+
+    @property
+    def text(self) -> str:
+        """Текстовый контент письма."""
+        return self.get_content('text/plain')
+
+    @property
+    def html(self) -> str:
+        """HTML-контент письма."""
+        return self.get_content('text/html')
+
+    @property
+    def attachments(self) -> List[MessagePart]:
+        """Вложения письма, включая встроенные изображения."""
+        return [part for part in self.parts if part.is_attachment]
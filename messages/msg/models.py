@@ -1,10 +1,23 @@
+import re
+from functools import lru_cache
+
 from cryptography.fernet import Fernet
+from django.core.exceptions import ValidationError
 from django.db import models
 from django.conf import settings
 
 from .base import BaseModel
-from .constants import (EMAIL_CHOICES, MAX_EMAIL_LEGTH, MAX_PASSWORD_LEGTH,
-                        YANDEX)
+from .compression import decompress
+from .constants import (BEFORE, BODY_DICT_CACHE_SIZE, CODEC_CHOICES,
+                        CONTENT_HASH_LEGTH, EMAIL_CHOICES, INCLUDE,
+                        INTERACTIVE, LARGER, MAX_CODEC_LEGTH,
+                        MAX_EMAIL_LEGTH, MAX_ERROR_CLASS_LEGTH,
+                        MAX_MESSAGE_ID_LEGTH, MAX_NODE_NAME_LEGTH,
+                        MAX_PASSWORD_LEGTH, MAX_RULE_VALUE_LEGTH,
+                        MAX_TITLE_LEGTH, RULE_ACTION_CHOICES,
+                        RULE_KIND_CHOICES, SINCE, SMALLER, SYNC_RUN_CHOICES,
+                        YANDEX, ZLIB)
+from .rules import get_rule_date
 from .utils import EmailDomenValidator, mail_directory_path
 
 
@@ -42,6 +55,145 @@ class Email(BaseModel):
         return f'{self.email}'
 
 
+class CompressionDictionary(BaseModel):
+    """
+    Модель словаря сжатия тел писем.
+
+    Словарь обучается на письмах почтового ящика: общий для ящика
+    (пустой отправитель) или для частого отправителя. Словари не
+    изменяются: при переобучении создается новый словарь, а старый
+    удаляется, когда на него больше не ссылаются тела писем.
+    """
+
+    email = models.ForeignKey(
+        Email, on_delete=models.SET_NULL, null=True,
+        verbose_name='Почта',
+        related_name='compression_dictionaries',
+    )
+    sender = models.CharField(
+        'Отправитель', max_length=MAX_EMAIL_LEGTH, blank=True, default='',
+    )
+    codec = models.CharField(
+        'Алгоритм', max_length=MAX_CODEC_LEGTH, choices=CODEC_CHOICES,
+        default=ZLIB,
+    )
+    data = models.BinaryField('Словарь')
+    sample_count = models.PositiveIntegerField('Образцов', default=0)
+    sample_bytes = models.PositiveBigIntegerField(
+        'Объем образцов, байт', default=0,
+    )
+    compressed_bytes = models.PositiveBigIntegerField(
+        'Объем образцов после сжатия, байт', default=0,
+    )
+
+    class Meta:
+        verbose_name = 'Словарь сжатия'
+        verbose_name_plural = 'Словари сжатия'
+        ordering = ('created_at',)
+        indexes = (
+            models.Index(
+                fields=('email', 'sender', '-id'),
+                name='dictionary_email_sender_idx',
+            ),
+        )
+
+    def __str__(self) -> str:
+        return f'{self.email} {self.sender or "*"} ({self.codec})'
+
+    @property
+    def ratio(self) -> float | None:
+        """Степень сжатия образцов со словарем."""
+        if not self.compressed_bytes:
+            return None
+        return round(self.sample_bytes / self.compressed_bytes, 2)
+
+
+@lru_cache(maxsize=BODY_DICT_CACHE_SIZE)
+def get_dictionary_data(dictionary_id: int) -> bytes:
+    """
+    Возвращает данные словаря сжатия.
+
+    Словари не изменяются, поэтому кешируются в процессе и читаются из
+    базы данных один раз.
+    """
+    return bytes(
+        CompressionDictionary.objects.values_list(
+            'data', flat=True
+        ).get(id=dictionary_id)
+    )
+
+
+class MessageBody(BaseModel):
+    """
+    Модель общего тела письма.
+
+    Одно и то же письмо может прийти на несколько ящиков (копия, рассылка,
+    пересылка). Тело хранится один раз и определяется парой
+    Message-ID + хеш содержимого, а записи `MessageData` каждого ящика
+    ссылаются на него.
+
+    Текст хранится как есть (`plain_text`) или в сжатом виде
+    (`compressed_text`, при необходимости со словарем). Свойство `text`
+    возвращает исходный текст в обоих случаях.
+    """
+
+    message_id = models.CharField(
+        'Message-ID', max_length=MAX_MESSAGE_ID_LEGTH, blank=True, default='',
+    )
+    content_hash = models.CharField(
+        'Хеш содержимого', max_length=CONTENT_HASH_LEGTH,
+    )
+    plain_text = models.TextField(
+        'Текст сообщения', null=True, db_column='text',
+    )
+    compressed_text = models.BinaryField(
+        'Сжатый текст сообщения', null=True,
+    )
+    codec = models.CharField(
+        'Алгоритм сжатия', max_length=MAX_CODEC_LEGTH, blank=True,
+        default='', choices=CODEC_CHOICES,
+    )
+    dictionary = models.ForeignKey(
+        CompressionDictionary, on_delete=models.PROTECT, null=True,
+        blank=True, verbose_name='Словарь сжатия',
+        related_name='bodies',
+    )
+
+    class Meta:
+        verbose_name = 'Тело письма'
+        verbose_name_plural = 'Тела писем'
+        ordering = ('created_at',)
+        constraints = (
+            models.UniqueConstraint(
+                fields=('message_id', 'content_hash'),
+                name='unique_message_body',
+            ),
+        )
+
+    def __str__(self) -> str:
+        return f'{self.message_id or self.content_hash}'
+
+    @property
+    def text(self) -> str | None:
+        """Исходный текст письма, распакованный при необходимости."""
+        if self.compressed_text is None:
+            return self.plain_text
+        zdict = (
+            get_dictionary_data(self.dictionary_id)
+            if self.dictionary_id else None
+        )
+        return decompress(
+            bytes(self.compressed_text), self.codec, zdict
+        ).decode('utf-8')
+
+    @text.setter
+    def text(self, value: str | None) -> None:
+        self.plain_text = value
+        self.compressed_text = None
+        self.codec = ''
+        self.dictionary = None
+
+
 class MessageData(BaseModel):
     """Модель данных с почты."""
 
@@ -62,8 +214,10 @@ class MessageData(BaseModel):
     receipt_date = models.DateField(
         'Дата получения',
     )
-    text = models.TextField(
-        'Текст сообщения', null=True
+    body = models.ForeignKey(
+        MessageBody, on_delete=models.PROTECT, null=True,
+        verbose_name='Тело письма',
+        related_name='messages',
     )
     msg_read = models.BooleanField(
         'Письмо прочитано да/нет', default=False,
@@ -71,16 +225,49 @@ class MessageData(BaseModel):
     files = models.JSONField(
         'Прикрепленные файлы', blank=True, null=True
     )
-    uid = models.CharField(max_length=255, unique=True)
+    uid = models.CharField(max_length=255)
+    uid_validity = models.BigIntegerField(
+        'UIDVALIDITY', null=True, blank=True,
+    )
+    in_reply_to = models.CharField(
+        'In-Reply-To', max_length=MAX_MESSAGE_ID_LEGTH, blank=True,
+        default='',
+    )
+    references = models.TextField(
+        'References', blank=True, default='',
+    )
 
     class Meta:
         verbose_name = 'Данные из письма'
         verbose_name_plural = 'Данные из писем'
         ordering = ('created_at',)
+        indexes = (
+            models.Index(
+                fields=('email', '-receipt_date'),
+                name='messagedata_email_receipt_idx',
+            ),
+        )
+        # UID уникален только в пределах папки ящика и ее UIDVALIDITY
+        constraints = (
+            models.UniqueConstraint(
+                fields=('email', 'uid_validity', 'uid'),
+                name='unique_message_uid',
+            ),
+            models.UniqueConstraint(
+                fields=('email', 'uid'),
+                condition=models.Q(uid_validity__isnull=True),
+                name='unique_message_uid_without_validity',
+            ),
+        )
 
     def __str__(self) -> str:
         return f'{self.title}'
 
+    @property
+    def text(self) -> str | None:
+        """Текст письма из общего тела."""
+        return self.body.text if self.body else None
+
 
 class MessageFile(BaseModel):
 
@@ -101,3 +288,416 @@ class MessageFile(BaseModel):
 
     def __str__(self) -> str:
         return f'Файлы из пиьсьма {self.message}'
+
+
+class IngestRule(BaseModel):
+    """
+    Модель правила загрузки писем почтового ящика.
+
+    Правила по отправителю и теме разрешают (загружаются только
+    совпавшие письма) или запрещают загрузку; правила по размеру и дате
+    ограничивают загружаемые письма. Правила компилируются в условия
+    поиска IMAP, а регулярные выражения и строки не в ASCII проверяются
+    по заголовкам писем до загрузки тел.
+    """
+
+    email = models.ForeignKey(
+        Email, on_delete=models.CASCADE,
+        verbose_name='Почта',
+        related_name='ingest_rules',
+    )
+    kind = models.CharField(
+        'Условие', choices=RULE_KIND_CHOICES,
+    )
+    action = models.CharField(
+        'Действие', choices=RULE_ACTION_CHOICES, default=INCLUDE,
+    )
+    value = models.CharField(
+        'Значение', max_length=MAX_RULE_VALUE_LEGTH,
+        help_text=(
+            'Адрес, домен или часть темы; размер в байтах; дата '
+            'ГГГГ-ММ-ДД или число дней назад.'
+        ),
+    )
+    is_regex = models.BooleanField(
+        'Регулярное выражение', default=False,
+    )
+    is_active = models.BooleanField('Активно', default=True)
+
+    class Meta:
+        verbose_name = 'Правило загрузки'
+        verbose_name_plural = 'Правила загрузки'
+        ordering = ('created_at',)
+
+    def __str__(self) -> str:
+        return f'{self.get_action_display()}: {self.kind} {self.value}'
+
+    def clean(self) -> None:
+        """Проверяет значение правила для выбранного условия."""
+        if self.kind in (LARGER, SMALLER) and not self.value.isdigit():
+            raise ValidationError(
+                {'value': 'Размер задается целым числом байт.'}
+            )
+        if self.kind in (SINCE, BEFORE):
+            try:
+                get_rule_date(self.value)
+            except ValueError:
+                raise ValidationError({
+                    'value': 'Дата задается как ГГГГ-ММ-ДД или число дней.'
+                })
+        if self.is_regex:
+            try:
+                re.compile(self.value)
+            except re.error as err:
+                raise ValidationError(
+                    {'value': f'Ошибка в регулярном выражении: {err}'}
+                )
+
+
+class RejectedMessage(BaseModel):
+    """
+    Модель письма, отклоненного правилами загрузки по заголовкам.
+
+    Отклоненные письма остаются непрочитанными на сервере; запись
+    не дает проверять их заголовки при каждой синхронизации. Записи
+    ящика удаляются при изменении его правил загрузки, а записи другой
+    UIDVALIDITY — при следующей синхронизации.
+    """
+
+    email = models.ForeignKey(
+        Email, on_delete=models.CASCADE,
+        verbose_name='Почта',
+        related_name='rejected_messages',
+    )
+    uid = models.CharField('UID', max_length=255)
+    uid_validity = models.BigIntegerField(
+        'UIDVALIDITY', null=True, blank=True,
+    )
+
+    class Meta:
+        verbose_name = 'Отклоненное письмо'
+        verbose_name_plural = 'Отклоненные письма'
+        ordering = ('created_at',)
+        constraints = (
+            models.UniqueConstraint(
+                fields=('email', 'uid'),
+                name='unique_rejected_message',
+            ),
+        )
+
+    def __str__(self) -> str:
+        return f'{self.uid}'
+
+
+class SyncNode(BaseModel):
+    """
+    Модель узла синхронизации почты.
+
+    Узел периодически обновляет отметку `heartbeat_at`; узлы без отметки
+    дольше срока аренды считаются выбывшими и не учитываются при делении
+    почтовых ящиков.
+    """
+
+    name = models.CharField(
+        'Имя узла', max_length=MAX_NODE_NAME_LEGTH, unique=True,
+    )
+    heartbeat_at = models.DateTimeField(
+        'Последняя отметка',
+    )
+
+    class Meta:
+        verbose_name = 'Узел синхронизации'
+        verbose_name_plural = 'Узлы синхронизации'
+        ordering = ('name',)
+
+    def __str__(self) -> str:
+        return f'{self.name}'
+
+
+class SyncState(BaseModel):
+    """
+    Модель состояния синхронизации почтового ящика.
+
+    Хранит аренду ящика: синхронизирует ящик только узел `owner`, пока
+    не истек срок `lease_expires_at`. Узел продлевает свои аренды
+    отметками, а аренду выбывшего узла после истечения срока забирает
+    другой узел. Там же хранится флаг, по которому фоновая догрузка
+    ящика уступает место интерактивной синхронизации.
+    """
+
+    email = models.OneToOneField(
+        Email, on_delete=models.CASCADE,
+        verbose_name='Почта',
+        related_name='sync_state',
+    )
+    owner = models.CharField(
+        'Узел-владелец', max_length=MAX_NODE_NAME_LEGTH, blank=True,
+        default='', db_index=True,
+    )
+    lease_expires_at = models.DateTimeField(
+        'Аренда до', null=True, blank=True,
+    )
+    requested_at = models.DateTimeField(
+        'Запрошена синхронизация', null=True, blank=True,
+    )
+    preempt_requested_at = models.DateTimeField(
+        'Догрузка прервана для синхронизации', null=True, blank=True,
+    )
+    last_synced_at = models.DateTimeField(
+        'Последняя синхронизация', null=True, blank=True,
+    )
+
+    class Meta:
+        verbose_name = 'Состояние синхронизации'
+        verbose_name_plural = 'Состояния синхронизации'
+        ordering = ('email',)
+
+    def __str__(self) -> str:
+        return f'{self.email} ({self.owner or "-"})'
+
+
+class SyncRun(BaseModel):
+    """
+    Модель запуска синхронизации почтового ящика.
+
+    Запись создается в начале синхронизации и дополняется при ее
+    завершении: счетчики писем, объем загруженных данных, длительность
+    этапов (подключение, список писем, загрузка, разбор, сохранение,
+    уведомление) и класс ошибки. Скорость запуска сравнивается со
+    скользящей базой предыдущих запусков ящика.
+    """
+
+    email = models.ForeignKey(
+        Email, on_delete=models.CASCADE,
+        verbose_name='Почта',
+        related_name='sync_runs',
+    )
+    kind = models.CharField(
+        'Тип', choices=SYNC_RUN_CHOICES, default=INTERACTIVE,
+    )
+    started_at = models.DateTimeField(
+        'Начало',
+    )
+    finished_at = models.DateTimeField(
+        'Окончание', null=True, blank=True,
+    )
+    duration = models.FloatField(
+        'Длительность, с', null=True, blank=True,
+    )
+    messages_seen = models.PositiveIntegerField(
+        'Просмотрено писем', default=0,
+    )
+    messages_new = models.PositiveIntegerField(
+        'Новых писем', default=0,
+    )
+    messages_skipped = models.PositiveIntegerField(
+        'Пропущено писем', default=0,
+    )
+    bytes_transferred = models.BigIntegerField(
+        'Загружено байт', default=0,
+    )
+    stages = models.JSONField(
+        'Длительность этапов, с', default=dict, blank=True,
+    )
+    throughput = models.FloatField(
+        'Писем в секунду', null=True, blank=True,
+    )
+    baseline = models.FloatField(
+        'База, писем в секунду', null=True, blank=True,
+    )
+    is_slow = models.BooleanField(
+        'Медленный запуск', default=False,
+    )
+    error_class = models.CharField(
+        'Класс ошибки', max_length=MAX_ERROR_CLASS_LEGTH, blank=True,
+        default='',
+    )
+    error_message = models.TextField(
+        'Текст ошибки', blank=True, default='',
+    )
+
+    class Meta:
+        verbose_name = 'Запуск синхронизации'
+        verbose_name_plural = 'Запуски синхронизации'
+        ordering = ('-started_at',)
+        indexes = (
+            models.Index(
+                fields=('email', '-started_at'),
+                name='syncrun_email_started_idx',
+            ),
+        )
+
+    def __str__(self) -> str:
+        return f'{self.email} {self.started_at:%Y-%m-%d %H:%M:%S}'
+
+
+class MessageThread(BaseModel):
+    """
+    Модель цепочки писем почтового ящика.
+
+    Строка цепочки поддерживается при сохранении каждого письма, поэтому
+    список цепочек читается без разбора заголовков писем. Ссылка на
+    последнее письмо не создает внешнего ключа в базе данных: таблица
+    писем может быть секционирована.
+    """
+
+    email = models.ForeignKey(
+        Email, on_delete=models.CASCADE,
+        verbose_name='Почта',
+        related_name='threads',
+    )
+    subject = models.CharField(
+        'Тема', max_length=MAX_TITLE_LEGTH, blank=True, default='',
+    )
+    message_count = models.PositiveIntegerField(
+        'Писем в цепочке', default=0,
+    )
+    last_receipt_date = models.DateField(
+        'Дата последнего письма', null=True, blank=True,
+    )
+    last_message = models.ForeignKey(
+        MessageData, on_delete=models.SET_NULL, null=True, blank=True,
+        db_constraint=False,
+        verbose_name='Последнее письмо',
+        related_name='+',
+    )
+
+    class Meta:
+        verbose_name = 'Цепочка писем'
+        verbose_name_plural = 'Цепочки писем'
+        ordering = ('-last_receipt_date', '-id')
+        indexes = (
+            models.Index(
+                fields=('email', '-last_receipt_date', '-id'),
+                name='thread_email_last_idx',
+            ),
+            models.Index(
+                fields=('email', 'subject'),
+                name='thread_email_subject_idx',
+            ),
+        )
+
+    def __str__(self) -> str:
+        return f'{self.subject or "-----"} ({self.message_count})'
+
+
+class ThreadContainer(BaseModel):
+    """
+    Модель узла дерева цепочки (контейнер алгоритма JWZ).
+
+    Узел соответствует одному Message-ID в ящике. Для писем, которые
+    упоминаются в References, но еще не получены, создается пустой узел
+    без письма, чтобы их ответы попали в одну цепочку.
+    """
+
+    email = models.ForeignKey(
+        Email, on_delete=models.CASCADE,
+        verbose_name='Почта',
+        related_name='thread_containers',
+    )
+    thread = models.ForeignKey(
+        MessageThread, on_delete=models.CASCADE,
+        verbose_name='Цепочка',
+        related_name='containers',
+    )
+    message_id = models.CharField(
+        'Message-ID', max_length=MAX_MESSAGE_ID_LEGTH,
+    )
+    parent_message_id = models.CharField(
+        'Message-ID родителя', max_length=MAX_MESSAGE_ID_LEGTH, blank=True,
+        default='',
+    )
+    email_message = models.ForeignKey(
+        MessageData, on_delete=models.SET_NULL, null=True, blank=True,
+        db_constraint=False,
+        verbose_name='Письмо',
+        related_name='thread_containers',
+    )
+
+    class Meta:
+        verbose_name = 'Узел цепочки'
+        verbose_name_plural = 'Узлы цепочек'
+        ordering = ('created_at',)
+        constraints = (
+            models.UniqueConstraint(
+                fields=('email', 'message_id'),
+                name='unique_thread_container',
+            ),
+        )
+
+    def __str__(self) -> str:
+        return f'{self.message_id}'
+
+
+class SenderStat(BaseModel):
+    """
+    Модель счетчика писем почтового ящика по отправителю.
+
+    Обновляется в той же транзакции, что и сохранение писем, поэтому
+    самые частые отправители читаются по индексу без группировки писем.
+    """
+
+    email = models.ForeignKey(
+        Email, on_delete=models.CASCADE,
+        verbose_name='Почта',
+        related_name='sender_stats',
+    )
+    sender = models.CharField(
+        'Отправитель', max_length=MAX_EMAIL_LEGTH,
+    )
+    message_count = models.PositiveIntegerField(
+        'Писем', default=0,
+    )
+    last_receipt_date = models.DateField(
+        'Дата последнего письма', null=True, blank=True,
+    )
+
+    class Meta:
+        verbose_name = 'Статистика по отправителю'
+        verbose_name_plural = 'Статистика по отправителям'
+        ordering = ('-message_count',)
+        constraints = (
+            models.UniqueConstraint(
+                fields=('email', 'sender'),
+                name='unique_sender_stat',
+            ),
+        )
+        indexes = (
+            models.Index(
+                fields=('email', '-message_count'),
+                name='senderstat_email_count_idx',
+            ),
+        )
+
+    def __str__(self) -> str:
+        return f'{self.sender}: {self.message_count}'
+
+
+class DailyStat(BaseModel):
+    """Модель счетчика писем почтового ящика по дню получения."""
+
+    email = models.ForeignKey(
+        Email, on_delete=models.CASCADE,
+        verbose_name='Почта',
+        related_name='daily_stats',
+    )
+    day = models.DateField(
+        'День',
+    )
+    message_count = models.PositiveIntegerField(
+        'Писем', default=0,
+    )
+
+    class Meta:
+        verbose_name = 'Статистика по дню'
+        verbose_name_plural = 'Статистика по дням'
+        ordering = ('-day',)
+        constraints = (
+            models.UniqueConstraint(
+                fields=('email', 'day'),
+                name='unique_daily_stat',
+            ),
+        )
+
+    def __str__(self) -> str:
+        return f'{self.day}: {self.message_count}'
@@ -0,0 +1,222 @@
+import csv
+import imaplib
+import io
+import json
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from cryptography.fernet import Fernet
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import IntegrityError, transaction
+
+from .cache import invalidate_accounts
+from .constants import (EMAIL_DICKT, IMAP_SERVERS, MAX_EMAIL_LEGTH,
+                        MAX_PASSWORD_LEGTH, ONBOARD_LOGIN_TIMEOUT,
+                        ONBOARD_WORKERS)
+from .models import Email
+from .utils import EmailDomenValidator
+
+CREATED = 'created'
+VERIFIED = 'verified'
+INVALID = 'invalid'
+EXISTS = 'exists'
+LOGIN_FAILED = 'login_failed'
+FAILED = 'failed'
+CSV = 'csv'
+JSON = 'json'
+DATA_FORMATS = (CSV, JSON)
+# Провайдер по домену почты
+DOMAIN_PROVIDERS = {
+    domain: provider for provider, domain in EMAIL_DICKT.items()
+}
+
+
+def parse_accounts(content: str, data_format: str) -> List[Dict[str, str]]:
+    """
+    Разбирает список почтовых ящиков в CSV или JSON.
+
+    CSV должен содержать заголовок со столбцами email, password и
+    необязательным provider. JSON — список объектов с теми же ключами
+    или объект с таким списком в ключе accounts.
+
+    Args:
+        content (str): Содержимое файла или тела запроса.
+        data_format (str): Формат данных (csv или json).
+
+    Returns:
+        List[Dict[str, str]]: Почтовые ящики в исходном порядке.
+
+    Raises:
+        ValueError: Если данные не удается разобрать.
+    """
+    if data_format == CSV:
+        try:
+            rows = list(csv.DictReader(io.StringIO(content)))
+        except csv.Error as err:
+            raise ValueError(str(err))
+    elif data_format == JSON:
+        rows = json.loads(content)
+        if isinstance(rows, dict):
+            rows = rows.get('accounts')
+    else:
+        raise ValueError(f'Неизвестный формат {data_format}')
+    if not isinstance(rows, list) or not all(
+            isinstance(row, dict) for row in rows):
+        raise ValueError('Ожидается список почтовых ящиков')
+    return [
+        {
+            field: str(row.get(field) or '').strip()
+            for field in ('email', 'password', 'provider')
+        }
+        for row in rows
+    ]
+
+
+def validate_account(account: Dict[str, str]) -> Optional[str]:
+    """
+    Проверяет почтовый ящик так же, как форма добавления почты.
+
+    Если провайдер не указан, он определяется по домену почты.
+
+    Args:
+        account (Dict[str, str]): Почта, пароль и провайдер.
+
+    Returns:
+        str or None: Текст ошибки или None, если ящик корректен.
+    """
+    email = account['email']
+    if not email or not account['password']:
+        return 'Не указана почта или пароль'
+    if len(email) > MAX_EMAIL_LEGTH:
+        return 'Слишком длинный адрес почты'
+    try:
+        validate_email(email)
+        EmailDomenValidator()(email)
+    except ValidationError as err:
+        return ' '.join(' '.join(err.messages).split())
+    domain = email.split('@')[-1]
+    if not account['provider']:
+        account['provider'] = DOMAIN_PROVIDERS[domain]
+    if EMAIL_DICKT.get(account['provider']) != domain:
+        return 'Введенный email должен соответствовать выбранному домену!'
+    return None
+
+
+def verify_login(account: Dict[str, str]) -> Optional[str]:
+    """
+    Проверяет вход в почтовый ящик по IMAP.
+
+    Args:
+        account (Dict[str, str]): Почта, пароль и провайдер.
+
+    Returns:
+        str or None: Текст ошибки или None, если вход выполнен.
+    """
+    try:
+        imap = imaplib.IMAP4_SSL(
+            host=IMAP_SERVERS[account['provider']],
+            timeout=ONBOARD_LOGIN_TIMEOUT,
+        )
+    except OSError as err:
+        return f'Ошибка подключения к почтовому серверу: {err}'
+    try:
+        imap.login(account['email'], account['password'])
+    except (imaplib.IMAP4.error, OSError) as err:
+        return f'Ошибка входа в почтовый ящик: {err}'
+    finally:
+        try:
+            imap.logout()
+        except (imaplib.IMAP4.error, OSError):
+            pass
+    return None
+
+
+def onboard_accounts(
+        accounts: List[Dict[str, str]],
+        workers: int = ONBOARD_WORKERS,
+        verify: bool = True,
+        save: bool = True
+        ) -> List[Dict[str, Any]]:
+    """
+    Добавляет почтовые ящики списком.
+
+    Ящики проверяются как в форме добавления почты, вход по IMAP
+    проверяется одновременно не более чем в `workers` потоках. Пароли
+    шифруются одним ключом, а ящики, прошедшие проверки, сохраняются
+    одной массовой вставкой в транзакции: без `Email.save`, поэтому
+    пароли не шифруются повторно.
+
+    Args:
+        accounts (List[Dict[str, str]]): Ящики из `parse_accounts`.
+        workers (int): Количество одновременных проверок входа.
+        verify (bool): Проверять ли вход по IMAP.
+        save (bool): Сохранять ли ящики или только проверить их.
+
+    Returns:
+        List[Dict[str, Any]]: Результат по каждому ящику в исходном
+          порядке: почта, статус и текст ошибки.
+    """
+    results = [
+        {'email': account['email'], 'status': None, 'error': None}
+        for account in accounts
+    ]
+    existing = set(Email.objects.filter(
+        email__in=[account['email'] for account in accounts]
+    ).values_list('email', flat=True))
+    seen = set()
+    pending = []
+    for account, result in zip(accounts, results):
+        error = validate_account(account)
+        if error:
+            result.update(status=INVALID, error=error)
+        elif account['email'] in existing:
+            result.update(status=EXISTS, error='Почта уже добавлена')
+        elif account['email'] in seen:
+            result.update(status=INVALID, error='Почта указана повторно')
+        else:
+            seen.add(account['email'])
+            pending.append((account, result))
+
+    if verify and pending:
+        with ThreadPoolExecutor(
+                max_workers=max(min(workers, len(pending)), 1)) as executor:
+            errors = list(executor.map(
+                verify_login, [account for account, _ in pending]
+            ))
+        for (_, result), error in zip(pending, errors):
+            if error:
+                result.update(status=LOGIN_FAILED, error=error)
+        pending = [
+            item for item, error in zip(pending, errors) if not error
+        ]
+
+    fernet = Fernet(settings.KEY)
+    new_accounts = []
+    for account, result in pending:
+        password = fernet.encrypt(account['password'].encode()).decode()
+        if len(password) > MAX_PASSWORD_LEGTH:
+            result.update(status=INVALID, error='Слишком длинный пароль')
+            continue
+        result['status'] = CREATED if save else VERIFIED
+        new_accounts.append(Email(
+            email=account['email'], password=password,
+            provider=account['provider'],
+        ))
+    if not save or not new_accounts:
+        return results
+
+    try:
+        with transaction.atomic():
+            Email.objects.bulk_create(new_accounts)
+            transaction.on_commit(invalidate_accounts)
+    except IntegrityError as err:
+        print(f'Ошибка сохранения почтовых ящиков: {err}')
+        for result in results:
+            if result['status'] == CREATED:
+                result.update(
+                    status=FAILED,
+                    error='Ящики не сохранены, повторите загрузку',
+                )
+    return results
@@ -0,0 +1,38 @@
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+from .constants import ESTIMATED_COUNT_THRESHOLD
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Пагинатор с приблизительным подсчетом записей.
+
+    Для нефильтрованного запроса к PostgreSQL количество строк берется из
+    статистики планировщика (`pg_class.reltuples`) вместо `COUNT(*)`,
+    который на больших таблицах читает всю таблицу. Для небольших таблиц,
+    фильтрованных запросов и других СУБД используется обычный подсчет.
+    """
+
+    @cached_property
+    def count(self) -> int:
+        queryset = self.object_list
+        query = getattr(queryset, 'query', None)
+        if query is None or query.where:
+            return super().count
+
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql':
+            return super().count
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class WHERE relname = %s',
+                [queryset.model._meta.db_table],
+            )
+            row = cursor.fetchone()
+
+        if not row or row[0] < ESTIMATED_COUNT_THRESHOLD:
+            return super().count
+        return row[0]
@@ -0,0 +1,483 @@
+from datetime import date
+from typing import List, Optional, Tuple
+
+from django.db import OperationalError, connection, transaction
+from django.db.models import prefetch_related_objects
+
+from .models import MessageData
+
+PARTITION_LOCK_TIMEOUT = '5s'
+CONVERT_BATCH_SIZE = 10000
+
+
+def add_months(month: date, count: int) -> date:
+    """
+    Сдвигает первое число месяца на заданное количество месяцев.
+
+    Args:
+        month (date): Первое число месяца.
+        count (int): Количество месяцев (может быть отрицательным).
+
+    Returns:
+        date: Первое число полученного месяца.
+    """
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def get_table_name() -> str:
+    """Возвращает имя таблицы писем."""
+    return MessageData._meta.db_table
+
+
+def get_partition_name(month: date) -> str:
+    """
+    Возвращает имя месячной секции таблицы писем.
+
+    Args:
+        month (date): Первое число месяца секции.
+
+    Returns:
+        str: Имя секции в формате <table>_pYYYYMM.
+    """
+    return f'{get_table_name()}_p{month:%Y%m}'
+
+
+def is_partitioned() -> bool:
+    """
+    Проверяет, разбита ли таблица писем на секции.
+
+    Секционирование доступно только в PostgreSQL; для остальных СУБД
+    (например, SQLite) таблица всегда обычная.
+
+    Returns:
+        bool: True, если таблица секционирована.
+    """
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT 1 FROM pg_partitioned_table '
+            'WHERE partrelid = %s::regclass',
+            [get_table_name()],
+        )
+        return cursor.fetchone() is not None
+
+
+def get_partitions() -> List[Tuple[str, date]]:
+    """
+    Возвращает месячные секции таблицы писем.
+
+    Returns:
+        list: Список кортежей (имя секции, первое число месяца),
+          отсортированный по месяцу. Секция по умолчанию не включается.
+    """
+    prefix = f'{get_table_name()}_p'
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT c.relname FROM pg_inherits i '
+            'JOIN pg_class c ON c.oid = i.inhrelid '
+            'WHERE i.inhparent = %s::regclass',
+            [get_table_name()],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    partitions = []
+    for name in names:
+        suffix = name[len(prefix):]
+        if name.startswith(prefix) and suffix.isdigit() and len(suffix) == 6:
+            partitions.append(
+                (name, date(int(suffix[:4]), int(suffix[4:]), 1))
+            )
+    return sorted(partitions, key=lambda partition: partition[1])
+
+
+def create_partition(month: date) -> bool:
+    """
+    Создает секцию таблицы писем для указанного месяца.
+
+    Args:
+        month (date): Первое число месяца.
+
+    Returns:
+        bool: True, если секция создана, False, если она уже существовала.
+    """
+    name = get_partition_name(month)
+    if name in dict(get_partitions()):
+        return False
+    quote = connection.ops.quote_name
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"SET LOCAL lock_timeout = '{PARTITION_LOCK_TIMEOUT}'")
+        cursor.execute(
+            f'CREATE TABLE {quote(name)} PARTITION OF '
+            f'{quote(get_table_name())} FOR VALUES FROM (%s) TO (%s)',
+            [month, add_months(month, 1)],
+        )
+    return True
+
+
+def ensure_partitions(months_ahead: int = 3) -> List[str]:
+    """
+    Создает недостающие секции от текущего месяца на несколько вперед.
+
+    Args:
+        months_ahead (int): Количество будущих месяцев.
+
+    Returns:
+        list: Имена созданных секций.
+    """
+    current = date.today().replace(day=1)
+    created = []
+    for offset in range(months_ahead + 1):
+        month = add_months(current, offset)
+        if create_partition(month):
+            created.append(get_partition_name(month))
+    return created
+
+
+def get_detached_name(name: str) -> str:
+    """
+    Возвращает имя отсоединенной секции таблицы писем.
+
+    Args:
+        name (str): Имя секции в формате <table>_pYYYYMM.
+
+    Returns:
+        str: Имя в формате <table>_dYYYYMM.
+    """
+    return f'{get_table_name()}_d{name[-6:]}'
+
+
+def get_detached_partitions() -> List[str]:
+    """
+    Возвращает секции, отсоединенные, но еще не удаленные.
+
+    Такие секции остаются после прерванной очистки `purge_messages`
+    и дочищаются при следующем запуске.
+
+    Returns:
+        list: Имена отсоединенных секций по возрастанию месяца.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT relname FROM pg_class WHERE relkind = 'r' "
+            'AND relname ~ %s ORDER BY relname',
+            [f'^{get_table_name()}_d[0-9]{{6}}$'],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def detach_partition(name: str) -> Optional[str]:
+    """
+    Отсоединяет секцию таблицы писем.
+
+    Отсоединение — операция над метаданными; время ожидания блокировки
+    ограничено `lock_timeout`. Секция переименовывается, чтобы ее можно
+    было найти после прерванной очистки и чтобы не занимать имя секции
+    месяца.
+
+    Args:
+        name (str): Имя секции.
+
+    Returns:
+        str or None: Имя отсоединенной секции или None, если блокировку
+          таблицы писем не удалось получить.
+    """
+    quote = connection.ops.quote_name
+    detached = get_detached_name(name)
+    try:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f"SET LOCAL lock_timeout = '{PARTITION_LOCK_TIMEOUT}'"
+            )
+            cursor.execute(
+                f'ALTER TABLE {quote(get_table_name())} '
+                f'DETACH PARTITION {quote(name)}'
+            )
+            cursor.execute(
+                f'ALTER TABLE {quote(name)} RENAME TO {quote(detached)}'
+            )
+    except OperationalError as err:
+        print(f'Ошибка отсоединения секции {name}: {err}')
+        return None
+    return detached
+
+
+def get_detached_batch(name: str, batch_size: int) -> List['MessageData']:
+    """
+    Возвращает пачку писем отсоединенной секции.
+
+    Args:
+        name (str): Имя отсоединенной секции.
+        batch_size (int): Размер пачки.
+
+    Returns:
+        list: Письма с подгруженными почтой и телом.
+    """
+    quote = connection.ops.quote_name
+    batch = list(MessageData.objects.raw(
+        f'SELECT * FROM {quote(name)} ORDER BY id LIMIT %s', [batch_size]
+    ))
+    prefetch_related_objects(batch, 'email', 'body')
+    return batch
+
+
+def delete_detached_rows(name: str, message_ids: List[int]) -> None:
+    """
+    Удаляет письма из отсоединенной секции.
+
+    Каскадное удаление ORM для таких писем не выполняется, поэтому
+    вызывается в транзакции `retention.purge_batch`, которая удаляет
+    вложения писем, уменьшает статистику и убирает письма из цепочек:
+    повторная очистка продолжается с необработанных писем, и счетчики
+    не уменьшаются дважды.
+
+    Args:
+        name (str): Имя отсоединенной секции.
+        message_ids (List[int]): Идентификаторы писем.
+    """
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {quote(name)} WHERE id = ANY(%s)', [message_ids]
+        )
+
+
+def drop_detached(name: str) -> None:
+    """
+    Удаляет отсоединенную секцию, письма которой уже обработаны.
+
+    Args:
+        name (str): Имя отсоединенной секции.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(f'DROP TABLE {connection.ops.quote_name(name)}')
+
+
+def get_legacy_name() -> str:
+    """Возвращает имя старой таблицы писем на время перевода."""
+    return f'{get_table_name()}_legacy'
+
+
+def table_exists(name: str) -> bool:
+    """Проверяет, существует ли таблица."""
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT to_regclass(%s) IS NOT NULL', [name])
+        return cursor.fetchone()[0]
+
+
+def create_partitioned_table(months_ahead: int) -> List[str]:
+    """
+    Заменяет таблицу писем пустой секционированной таблицей.
+
+    Выполняется одной короткой транзакцией без копирования строк: старая
+    таблица переименовывается и остается источником для переноса, новая
+    таблица сразу получает ключи, индексы, секцию по умолчанию и секции
+    от текущего месяца на `months_ahead` вперед.
+
+    Args:
+        months_ahead (int): Количество будущих месяцев для секций.
+
+    Returns:
+        list: Имена созданных месячных секций.
+    """
+    table = get_table_name()
+    legacy = get_legacy_name()
+    sequence = f'{table}_part_id_seq'
+    quote = connection.ops.quote_name
+
+    current = date.today().replace(day=1)
+    created = []
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"SET LOCAL lock_timeout = '{PARTITION_LOCK_TIMEOUT}'")
+        cursor.execute(f'LOCK TABLE {quote(table)} IN ACCESS EXCLUSIVE MODE')
+        cursor.execute(
+            'SELECT indexrelid::regclass::text, pg_get_indexdef(indexrelid) '
+            'FROM pg_index WHERE indrelid = %s::regclass AND NOT indisunique',
+            [table],
+        )
+        indexes = cursor.fetchall()
+        cursor.execute(
+            'SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint '
+            "WHERE conrelid = %s::regclass AND contype = 'f'",
+            [table],
+        )
+        foreign_keys = cursor.fetchall()
+        cursor.execute(
+            'SELECT conrelid::regclass::text, conname FROM pg_constraint '
+            "WHERE confrelid = %s::regclass AND contype = 'f'",
+            [table],
+        )
+        for related_table, name in cursor.fetchall():
+            cursor.execute(
+                f'ALTER TABLE {related_table} DROP CONSTRAINT {quote(name)}'
+            )
+        cursor.execute(
+            'SELECT conname FROM pg_constraint '
+            "WHERE conrelid = %s::regclass AND contype = 'p'",
+            [table],
+        )
+        primary_key = cursor.fetchone()[0]
+        cursor.execute(f'SELECT max(id) FROM {quote(table)}')
+        max_id = cursor.fetchone()[0]
+
+        # Старая таблица остается источником переноса: имена ее индексов
+        # и первичного ключа освобождаются для новой таблицы
+        cursor.execute(f'ALTER TABLE {quote(table)} RENAME TO {quote(legacy)}')
+        cursor.execute(
+            f'ALTER TABLE {quote(legacy)} RENAME CONSTRAINT '
+            f'{quote(primary_key)} TO {quote(legacy + "_pkey")}'
+        )
+        for index_name, _ in indexes:
+            cursor.execute(f'DROP INDEX {index_name}')
+
+        # Новая секционированная таблица с последовательностью вместо
+        # identity-столбца
+        cursor.execute(
+            f'CREATE TABLE {quote(table)} (LIKE {quote(legacy)} '
+            'INCLUDING DEFAULTS INCLUDING STORAGE INCLUDING COMMENTS) '
+            'PARTITION BY RANGE (receipt_date)'
+        )
+        cursor.execute(f'CREATE SEQUENCE IF NOT EXISTS {quote(sequence)}')
+        cursor.execute(
+            f'ALTER TABLE {quote(table)} ALTER COLUMN id '
+            f"SET DEFAULT nextval('{sequence}')"
+        )
+        cursor.execute(
+            f'ALTER SEQUENCE {quote(sequence)} OWNED BY {quote(table)}.id'
+        )
+        cursor.execute(
+            'SELECT setval(%s, %s, %s)', [sequence, max_id or 1, bool(max_id)]
+        )
+        cursor.execute(
+            f'CREATE TABLE {quote(table + "_default")} '
+            f'PARTITION OF {quote(table)} DEFAULT'
+        )
+        for offset in range(months_ahead + 1):
+            month = add_months(current, offset)
+            create_partition(month)
+            created.append(get_partition_name(month))
+
+        cursor.execute(
+            f'ALTER TABLE {quote(table)} '
+            f'ADD CONSTRAINT {quote(table + "_pkey")} '
+            'PRIMARY KEY (id, receipt_date)'
+        )
+        cursor.execute(
+            f'ALTER TABLE {quote(table)} '
+            f'ADD CONSTRAINT {quote(table + "_uid_receipt_uniq")} '
+            'UNIQUE (email_id, uid_validity, uid, receipt_date)'
+        )
+        unknown_index = quote(table + '_uid_unknown_receipt_uniq')
+        cursor.execute(
+            f'CREATE UNIQUE INDEX {unknown_index} '
+            f'ON {quote(table)} (email_id, uid, receipt_date) '
+            'WHERE uid_validity IS NULL'
+        )
+        for _, index_def in indexes:
+            cursor.execute(index_def)
+        for name, definition in foreign_keys:
+            cursor.execute(
+                f'ALTER TABLE {quote(table)} '
+                f'ADD CONSTRAINT {quote(name)} {definition}'
+            )
+    return created
+
+
+def move_legacy_batch(batch_size: int) -> int:
+    """
+    Переносит пачку самых старых писем из старой таблицы в секции.
+
+    Строки удаляются из старой таблицы и вставляются в новую одной
+    командой в отдельной транзакции, поэтому прерванный перевод
+    продолжается с оставшихся строк.
+
+    Args:
+        batch_size (int): Размер пачки.
+
+    Returns:
+        int: Количество перенесенных писем.
+    """
+    table = get_table_name()
+    legacy = get_legacy_name()
+    quote = connection.ops.quote_name
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f'WITH moved AS (DELETE FROM {quote(legacy)} '
+            'WHERE (receipt_date, id) IN ('
+            f'SELECT receipt_date, id FROM {quote(legacy)} '
+            'ORDER BY receipt_date, id LIMIT %s) RETURNING *) '
+            f'INSERT INTO {quote(table)} SELECT * FROM moved',
+            [batch_size],
+        )
+        return cursor.rowcount
+
+
+def convert_to_partitioned(
+        months_ahead: int = 3,
+        batch_size: int = CONVERT_BATCH_SIZE
+        ) -> List[str]:
+    """
+    Переводит таблицу писем на помесячное секционирование PostgreSQL.
+
+    Таблица пересоздается как секционированная по `receipt_date`:
+    первичный ключ и уникальность UID в ящике дополняются ключом
+    секционирования, обычные индексы и внешние ключи на другие таблицы
+    переносятся, а внешние ключи других таблиц на письма удаляются
+    (PostgreSQL не позволяет ссылаться на секционированную таблицу без
+    ключа секционирования; каскадное удаление выполняет ORM). Для строк вне
+    созданных секций заводится секция по умолчанию.
+
+    Сначала одной короткой транзакцией создается пустая секционированная
+    таблица, затем создаются секции прошлых месяцев, строки старой
+    таблицы переносятся пачками по `receipt_date` в отдельных транзакциях,
+    и старая таблица удаляется. Пока идет перенос, старые письма
+    появляются в списках постепенно, поэтому синхронизацию и импорт
+    на это время лучше остановить: копия письма, которое еще
+    не перенесено, нарушит уникальность UID при переносе. Прерванный
+    перевод продолжается повторным запуском.
+
+    Args:
+        months_ahead (int): Количество будущих месяцев для секций.
+        batch_size (int): Количество писем в одной транзакции переноса.
+
+    Returns:
+        list: Имена созданных месячных секций.
+
+    Raises:
+        ValueError: Если СУБД не PostgreSQL, таблица уже секционирована
+          или старая таблица осталась без секционированной.
+    """
+    if connection.vendor != 'postgresql':
+        raise ValueError('Секционирование поддерживается только PostgreSQL')
+    legacy = get_legacy_name()
+    resumed = table_exists(legacy)
+    if is_partitioned() != resumed:
+        raise ValueError(
+            'Таблица писем уже секционирована' if not resumed
+            else f'Таблица {legacy} уже существует'
+        )
+
+    quote = connection.ops.quote_name
+    created = [] if resumed else create_partitioned_table(months_ahead)
+    with connection.cursor() as cursor:
+        # Индекс по ключу переноса строится без блокировки новой таблицы
+        cursor.execute(
+            f'CREATE INDEX IF NOT EXISTS {quote(legacy + "_move_idx")} '
+            f'ON {quote(legacy)} (receipt_date, id)'
+        )
+        cursor.execute(f'SELECT min(receipt_date) FROM {quote(legacy)}')
+        first_date = cursor.fetchone()[0]
+    current = date.today().replace(day=1)
+    month = first_date.replace(day=1) if first_date else current
+    previous = []
+    while month < current:
+        if create_partition(month):
+            previous.append(get_partition_name(month))
+        month = add_months(month, 1)
+
+    while move_legacy_batch(batch_size):
+        pass
+    with connection.cursor() as cursor:
+        cursor.execute(f'DROP TABLE {quote(legacy)}')
+    return previous + created
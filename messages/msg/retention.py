@@ -0,0 +1,253 @@
+import gzip
+import json
+import shutil
+from functools import partial
+from datetime import date
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import QuerySet
+
+from .cache import invalidate_account_lists, invalidate_all_lists
+from .models import MessageBody, MessageData, MessageFile
+from .partitions import (add_months, delete_detached_rows, detach_partition,
+                         drop_detached, get_detached_batch,
+                         get_detached_partitions, get_partitions,
+                         is_partitioned)
+from .serializers import serialize_message
+from .stats import update_stats
+from .threads import release_threads
+
+
+def get_cutoff(months: int) -> date:
+    """
+    Возвращает границу хранения писем.
+
+    Args:
+        months (int): Сколько полных месяцев хранить, не считая текущего.
+
+    Returns:
+        date: Первое число месяца; письма, полученные раньше, удаляются.
+    """
+    return add_months(date.today().replace(day=1), -months)
+
+
+def archive_messages(
+        messages: List['MessageData'],
+        archive_dir: Path
+        ) -> None:
+    """
+    Дописывает письма в архив в формате NDJSON, сжатый gzip.
+
+    Письма раскладываются по файлам messages-YYYY-MM.ndjson.gz по месяцу
+    получения.
+
+    Args:
+        messages (List[MessageData]): Письма с подгруженными почтой и телом.
+        archive_dir (Path): Каталог архива.
+    """
+    archive_dir.mkdir(parents=True, exist_ok=True)
+    by_month: Dict[str, List[str]] = {}
+    for message in messages:
+        month = f'{message.receipt_date:%Y-%m}'
+        by_month.setdefault(month, []).append(
+            json.dumps(serialize_message(message), ensure_ascii=False)
+        )
+    for month, lines in by_month.items():
+        path = archive_dir / f'messages-{month}.ndjson.gz'
+        with gzip.open(path, 'at', encoding='utf-8') as archive:
+            archive.write('\n'.join(lines) + '\n')
+
+
+def delete_message_files(
+        message_ids: List[int],
+        archive_dir: Optional[Path] = None
+        ) -> int:
+    """
+    Удаляет вложения писем вместе с файлами в хранилище.
+
+    Файл в хранилище удаляется, только если на него не ссылаются
+    вложения других писем (копии письма на разных ящиках используют
+    один файл). При указании архива файл предварительно копируется в
+    подкаталог files.
+
+    Args:
+        message_ids (List[int]): Идентификаторы писем.
+        archive_dir (Optional[Path]): Каталог архива или None.
+
+    Returns:
+        int: Количество удаленных записей `MessageFile`.
+    """
+    files = MessageFile.objects.filter(message_id__in=message_ids)
+    names = set(files.values_list('file', flat=True))
+    shared = set(
+        MessageFile.objects.filter(file__in=names).exclude(
+            message_id__in=message_ids
+        ).values_list('file', flat=True)
+    )
+    for name in names - shared:
+        if not name or not default_storage.exists(name):
+            continue
+        if archive_dir:
+            target = archive_dir / 'files' / name
+            target.parent.mkdir(parents=True, exist_ok=True)
+            with default_storage.open(name) as source, \
+                    open(target, 'wb') as destination:
+                shutil.copyfileobj(source, destination)
+        default_storage.delete(name)
+    deleted, _ = files.delete()
+    return deleted
+
+
+def purge_batch(
+        messages: List['MessageData'],
+        archive_dir: Optional[Path] = None,
+        detached: Optional[str] = None
+        ) -> int:
+    """
+    Удаляет одну пачку писем в отдельной короткой транзакции.
+
+    Статистика по отправителям и дням и цепочки писем обновляются в той
+    же транзакции, что и удаление строк писем, в том числе для писем
+    отсоединенной секции.
+
+    Args:
+        messages (List[MessageData]): Письма пачки.
+        archive_dir (Optional[Path]): Каталог архива или None.
+        detached (Optional[str]): Отсоединенная секция, из которой
+          удаляются письма, или None для таблицы писем.
+
+    Returns:
+        int: Количество удаленных вложений.
+    """
+    message_ids = [message.id for message in messages]
+    with transaction.atomic():
+        if archive_dir:
+            archive_messages(messages, archive_dir)
+        files_deleted = delete_message_files(message_ids, archive_dir)
+        # Цепочки до статистики, как при сохранении писем: блокировки
+        # берутся в одном порядке
+        release_threads(messages)
+        update_stats(messages, sign=-1)
+        if detached:
+            delete_detached_rows(detached, message_ids)
+        else:
+            MessageData.objects.filter(id__in=message_ids).delete()
+        transaction.on_commit(partial(
+            invalidate_account_lists,
+            [message.email_id for message in messages],
+        ))
+    return files_deleted
+
+
+def iterate_batches(queryset: QuerySet, batch_size: int):
+    """
+    Перебирает письма пачками по возрастанию идентификатора.
+
+    Используется пагинация по ключу (id > последний), поэтому каждая
+    пачка читается по индексу без OFFSET.
+
+    Args:
+        queryset (QuerySet): Набор писем.
+        batch_size (int): Размер пачки.
+
+    Yields:
+        list: Очередная пачка писем с подгруженными почтой и телом.
+    """
+    last_id = 0
+    queryset = queryset.select_related('email', 'body').order_by('id')
+    while True:
+        batch = list(queryset.filter(id__gt=last_id)[:batch_size])
+        if not batch:
+            return
+        yield batch
+        last_id = batch[-1].id
+
+
+def delete_orphan_bodies(batch_size: int) -> int:
+    """
+    Удаляет пачками тела писем, на которые больше не ссылаются письма.
+
+    Args:
+        batch_size (int): Размер пачки.
+
+    Returns:
+        int: Количество удаленных тел.
+    """
+    deleted = 0
+    while True:
+        body_ids = list(
+            MessageBody.objects.filter(
+                messages__isnull=True
+            ).values_list('id', flat=True)[:batch_size]
+        )
+        if not body_ids:
+            return deleted
+        MessageBody.objects.filter(id__in=body_ids).delete()
+        deleted += len(body_ids)
+
+
+def purge_messages(
+        cutoff: date,
+        batch_size: int = 1000,
+        archive_dir: Optional[Path] = None
+        ) -> Dict[str, int]:
+    """
+    Удаляет или архивирует письма, полученные раньше границы хранения.
+
+    Если таблица писем секционирована, месячные секции целиком старше
+    границы сначала отсоединяются (DETACH), затем их письма пачками
+    убираются из статистики и цепочек вместе с вложениями, и пустая
+    секция удаляется. Секция, которую не удалось отсоединить за
+    `lock_timeout`, пропускается до следующего запуска, а отсоединенные
+    секции прерванного запуска дочищаются. Оставшиеся письма (обычная
+    таблица, секция по умолчанию) удаляются пачками в коротких
+    транзакциях, без одного большого DELETE.
+    В конце удаляются тела писем, оставшиеся без ссылок.
+
+    Args:
+        cutoff (date): Граница хранения.
+        batch_size (int): Размер пачки.
+        archive_dir (Optional[Path]): Каталог архива или None, если
+          письма нужно только удалить.
+
+    Returns:
+        dict: Количество удаленных секций, писем, вложений и тел.
+    """
+    stats = {'partitions': 0, 'messages': 0, 'files': 0, 'bodies': 0}
+
+    expired = MessageData.objects.filter(receipt_date__lt=cutoff)
+    if is_partitioned():
+        detached = get_detached_partitions()
+        for name, month in get_partitions():
+            if add_months(month, 1) > cutoff:
+                continue
+            detached_name = detach_partition(name)
+            if detached_name is None:
+                expired = expired.exclude(
+                    receipt_date__gte=month,
+                    receipt_date__lt=add_months(month, 1),
+                )
+                continue
+            invalidate_all_lists()
+            detached.append(detached_name)
+        for name in detached:
+            while True:
+                batch = get_detached_batch(name, batch_size)
+                if not batch:
+                    break
+                stats['files'] += purge_batch(
+                    batch, archive_dir, detached=name
+                )
+                stats['messages'] += len(batch)
+            drop_detached(name)
+            stats['partitions'] += 1
+
+    for batch in iterate_batches(expired, batch_size):
+        stats['files'] += purge_batch(batch, archive_dir)
+        stats['messages'] += len(batch)
+
+    stats['bodies'] = delete_orphan_bodies(batch_size)
+    return stats
@@ -0,0 +1,210 @@
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Отставание реплики PostgreSQL в секундах; 0, если реплика применила
+# все полученные изменения или база не является репликой. NULL, если
+# реплика не получает WAL с основной базы: тогда равенство полученной
+# и примененной позиций не означает, что реплика не отстает. Статус
+# приемника виден роли с pg_read_all_stats, без нее проверяется только
+# наличие приемника
+REPLICA_LAG_SQL = '''
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN NOT EXISTS (
+            SELECT 1 FROM pg_stat_wal_receiver
+            WHERE COALESCE(status, 'streaming') = 'streaming'
+        ) THEN NULL
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(
+            EPOCH FROM now() - pg_last_xact_replay_timestamp()
+        ), 0)
+    END
+'''
+
+
+class RoutingState:
+    """
+    Состояние маршрутизации запросов к базе данных в рамках HTTP-запроса.
+
+    Создается `ReplicaRoutingMiddleware`. Вне HTTP-запросов (задачи
+    синхронизации, команды управления) состояния нет, и все запросы
+    идут в основную базу.
+    """
+
+    __slots__ = ('use_replicas', 'wrote', 'fresh_since')
+
+    def __init__(self, use_replicas: bool):
+        self.use_replicas = use_replicas
+        self.wrote = False
+        self.fresh_since = None
+
+
+routing_state: ContextVar[Optional[RoutingState]] = ContextVar(
+    'routing_state', default=None
+)
+_lag_lock = threading.Lock()
+_lag_checks: Dict[str, Tuple[float, Optional[float]]] = {}
+
+
+def start_request(use_replicas: bool) -> RoutingState:
+    """Начинает маршрутизацию для нового HTTP-запроса."""
+    state = RoutingState(use_replicas)
+    routing_state.set(state)
+    return state
+
+
+@contextmanager
+def untracked_writes():
+    """
+    Не считает записи внутри блока записями HTTP-запроса.
+
+    Для служебных записей, которые запрос не читает обратно (например,
+    запрос синхронизации ящика): они не должны переводить чтение запроса
+    и следующие запросы клиента на основную базу.
+    """
+    state = routing_state.get()
+    wrote = state.wrote if state is not None else False
+    try:
+        yield
+    finally:
+        if state is not None:
+            state.wrote = wrote
+
+
+def require_fresh(timestamp: float) -> None:
+    """
+    Требует для чтения реплику, которая содержит изменения до `timestamp`.
+
+    Используется, когда страница строится для версии данных, записанной
+    в момент `timestamp`: реплика, которая ее еще не получила, отдала бы
+    устаревшие данные под новой версией.
+
+    Args:
+        timestamp (float): Время записи данных (timestamp).
+    """
+    state = routing_state.get()
+    if state is not None:
+        state.fresh_since = max(state.fresh_since or 0, timestamp)
+
+
+def measure_lag(alias: str) -> Optional[float]:
+    """
+    Измеряет отставание реплики.
+
+    Args:
+        alias (str): Псевдоним базы данных реплики.
+
+    Returns:
+        float or None: Отставание в секундах или None, если реплика
+          недоступна или не получает изменения с основной базы.
+    """
+    connection = connections[alias]
+    if connection.vendor != 'postgresql':
+        return 0.0
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(REPLICA_LAG_SQL)
+            lag = cursor.fetchone()[0]
+            if lag is None:
+                print(f'Реплика {alias} не получает изменения')
+                return None
+            return float(lag)
+    except Exception as err:
+        print(f'Ошибка проверки реплики {alias}: {err}')
+        return None
+
+
+def get_replica_lag(alias: str) -> Tuple[float, Optional[float]]:
+    """
+    Возвращает время проверки и отставание реплики.
+
+    Отставание проверяется не чаще раза в `REPLICA_LAG_CHECK_INTERVAL`
+    секунд на процесс, остальные запросы берут сохраненное значение.
+
+    Args:
+        alias (str): Псевдоним базы данных реплики.
+
+    Returns:
+        tuple: Время проверки (timestamp) и отставание в секундах или None,
+          если реплика недоступна.
+    """
+    now = time.time()
+    with _lag_lock:
+        checked = _lag_checks.get(alias)
+        if checked and now - checked[0] < settings.REPLICA_LAG_CHECK_INTERVAL:
+            return checked
+        # Остальные потоки до окончания проверки используют старое значение
+        _lag_checks[alias] = (now, checked[1] if checked else None)
+    checked = (now, measure_lag(alias))
+    with _lag_lock:
+        _lag_checks[alias] = checked
+    return checked
+
+
+def get_fresh_replicas(since: Optional[float] = None) -> List[str]:
+    """
+    Возвращает реплики с допустимым отставанием.
+
+    Args:
+        since (Optional[float]): Время записи (timestamp), изменения до
+          которого реплика должна содержать.
+
+    Returns:
+        List[str]: Псевдонимы подходящих реплик.
+    """
+    replicas = []
+    for alias in settings.DATABASE_REPLICAS:
+        checked_at, lag = get_replica_lag(alias)
+        if lag is None or lag > settings.REPLICA_MAX_LAG:
+            continue
+        if since is not None and checked_at - lag < since:
+            continue
+        replicas.append(alias)
+    return replicas
+
+
+class ReplicaRouter:
+    """
+    Маршрутизатор запросов чтения на реплики базы данных.
+
+    На реплики идут только запросы чтения из HTTP-запросов GET и HEAD, для
+    которых `ReplicaRoutingMiddleware` разрешил реплики. Запросы остаются
+    в основной базе, если:
+
+    - запрос уже что-то записал (чтение своих записей);
+    - чтение выполняется внутри транзакции основной базы;
+    - все реплики отстают больше `REPLICA_MAX_LAG` или недоступны.
+
+    Записи, миграции и все запросы вне HTTP-запросов всегда идут
+    в основную базу.
+    """
+
+    def db_for_read(self, model, **hints):
+        state = routing_state.get()
+        if (state is None or not state.use_replicas or state.wrote
+                or connections[DEFAULT_DB_ALIAS].in_atomic_block):
+            return DEFAULT_DB_ALIAS
+        replicas = get_fresh_replicas(state.fresh_since)
+        return random.choice(replicas) if replicas else DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        state = routing_state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
@@ -0,0 +1,243 @@
+import imaplib
+import re
+from datetime import date, timedelta
+from email.parser import BytesParser
+from functools import reduce
+from typing import Dict, Iterable, List, Tuple
+
+from .constants import (BEFORE, EXCLUDE, INCLUDE, LARGER,
+                        RULES_HEADER_CHUNK_SIZE, SENDER, SINCE, SMALLER,
+                        SUBJECT)
+from .mime import decode_header_value
+
+# Ключи поиска IMAP для правил по тексту заголовков
+TEXT_SEARCH_KEYS = {SENDER: 'FROM', SUBJECT: 'SUBJECT'}
+HEADER_NAMES = {SENDER: 'From', SUBJECT: 'Subject'}
+# Месяцы в датах IMAP не зависят от локали
+IMAP_MONTHS = (
+    'Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun',
+    'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec',
+)
+HEADERS_FETCH = '(BODY.PEEK[HEADER.FIELDS (FROM SUBJECT)])'
+UID_RE = re.compile(rb'\bUID (\d+)')
+
+
+def get_rule_date(value: str) -> date:
+    """
+    Возвращает дату правила.
+
+    Args:
+        value (str): Дата в формате ГГГГ-ММ-ДД или число дней назад.
+
+    Returns:
+        date: Дата.
+
+    Raises:
+        ValueError: Если значение не является датой или числом.
+    """
+    value = value.strip()
+    if value.isdigit():
+        return date.today() - timedelta(days=int(value))
+    return date.fromisoformat(value)
+
+
+def format_imap_date(value: date) -> str:
+    """Форматирует дату для поиска IMAP (01-Jan-2024)."""
+    return f'{value.day:02d}-{IMAP_MONTHS[value.month - 1]}-{value.year}'
+
+
+def quote(value: str) -> str:
+    """Заключает строку в кавычки для команды IMAP."""
+    escaped = value.replace('\\', '\\\\').replace('"', '\\"')
+    return f'"{escaped}"'
+
+
+def is_server_rule(rule) -> bool:
+    """
+    Можно ли проверить правило поиском на сервере.
+
+    Регулярные выражения сервер не поддерживает, а строки не в ASCII
+    imaplib не передает в команде поиска, поэтому такие правила
+    проверяются по заголовкам писем.
+    """
+    if rule.kind not in TEXT_SEARCH_KEYS:
+        return True
+    return not rule.is_regex and rule.value.isascii()
+
+
+def combine_or(criteria: List[str]) -> str:
+    """Объединяет условия поиска IMAP через OR."""
+    return reduce(lambda left, right: f'OR {left} {right}', criteria)
+
+
+def compile_limit(rule) -> str:
+    """Компилирует правило по размеру или дате в условие поиска IMAP."""
+    if rule.kind in (LARGER, SMALLER):
+        return f'{rule.kind} {int(rule.value)}'
+    return f'{rule.kind} {format_imap_date(get_rule_date(rule.value))}'
+
+
+def compile_rules(rules: Iterable) -> Tuple[List[str], List]:
+    """
+    Компилирует правила загрузки в условия поиска IMAP.
+
+    Разрешающие правила одного вида объединяются через OR, правила
+    разных видов и запрещающие правила (NOT) — через AND. Размер и даты
+    всегда проверяются сервером: запрещающее правило по размеру или дате
+    исключает совпавшие письма (NOT LARGER ...). Если хотя бы одно
+    разрешающее правило вида нельзя проверить на сервере, все разрешающие
+    правила этого вида проверяются по заголовкам.
+
+    Args:
+        rules (Iterable[IngestRule]): Активные правила почтового ящика.
+
+    Returns:
+        tuple: Условия поиска (начиная с UNSEEN) и правила, которые
+          проверяются по заголовкам писем.
+    """
+    criteria, local_rules = ['UNSEEN'], []
+    includes = {}
+    for rule in rules:
+        if rule.kind in (LARGER, SMALLER, SINCE, BEFORE):
+            term = compile_limit(rule)
+            criteria.append(
+                term if rule.action == INCLUDE else f'NOT {term}'
+            )
+        elif rule.action == INCLUDE:
+            includes.setdefault(rule.kind, []).append(rule)
+        elif is_server_rule(rule):
+            criteria.append(
+                f'NOT {TEXT_SEARCH_KEYS[rule.kind]} {quote(rule.value)}'
+            )
+        else:
+            local_rules.append(rule)
+
+    for kind, kind_rules in includes.items():
+        if all(is_server_rule(rule) for rule in kind_rules):
+            criteria.append(combine_or([
+                f'{TEXT_SEARCH_KEYS[kind]} {quote(rule.value)}'
+                for rule in kind_rules
+            ]))
+        else:
+            local_rules.extend(kind_rules)
+    return criteria, local_rules
+
+
+def get_account_rules(email_account) -> Tuple[List[str], List]:
+    """Компилирует активные правила загрузки почтового ящика."""
+    return compile_rules(email_account.ingest_rules.filter(is_active=True))
+
+
+def rule_matches(rule, headers: Dict[str, str]) -> bool:
+    """Совпадает ли заголовок письма с правилом."""
+    value = headers.get(HEADER_NAMES[rule.kind], '')
+    if rule.is_regex:
+        return re.search(rule.value, value, re.IGNORECASE) is not None
+    return rule.value.lower() in value.lower()
+
+
+def matches_rules(local_rules: List, headers: Dict[str, str]) -> bool:
+    """
+    Проходит ли письмо правила, которые проверяются по заголовкам.
+
+    Письмо должно совпасть хотя бы с одним разрешающим правилом каждого
+    вида и не совпасть ни с одним запрещающим.
+
+    Args:
+        local_rules (List[IngestRule]): Правила из `compile_rules`.
+        headers (Dict[str, str]): Декодированные заголовки From и Subject.
+
+    Returns:
+        bool: True, если письмо нужно загрузить.
+    """
+    includes = {}
+    for rule in local_rules:
+        if rule.action == EXCLUDE:
+            if rule_matches(rule, headers):
+                return False
+        else:
+            includes.setdefault(rule.kind, []).append(rule)
+    return all(
+        any(rule_matches(rule, headers) for rule in kind_rules)
+        for kind_rules in includes.values()
+    )
+
+
+def fetch_headers(
+        imap: imaplib.IMAP4_SSL,
+        mail_list: List[bytes]
+        ) -> Dict[bytes, Dict[str, str]]:
+    """
+    Загружает заголовки From и Subject писем без тел.
+
+    Заголовки запрашиваются одной командой UID FETCH на пачку из
+    `RULES_HEADER_CHUNK_SIZE` писем, письма не помечаются прочитанными.
+
+    Args:
+        imap (imaplib.IMAP4_SSL): Активное IMAP-соединение.
+        mail_list (List[bytes]): UID писем.
+
+    Returns:
+        dict: Декодированные заголовки по UID письма.
+    """
+    headers = {}
+    parser = BytesParser()
+    for start in range(0, len(mail_list), RULES_HEADER_CHUNK_SIZE):
+        chunk = mail_list[start:start + RULES_HEADER_CHUNK_SIZE]
+        status, data = imap.uid(
+            'FETCH', b','.join(chunk).decode('utf-8'), HEADERS_FETCH
+        )
+        if status != 'OK':
+            raise imaplib.IMAP4.error('Ошибка получения заголовков писем')
+        for item in data:
+            if not isinstance(item, tuple):
+                continue
+            found = UID_RE.search(item[0])
+            if not found:
+                continue
+            message = parser.parsebytes(item[1], headersonly=True)
+            headers[found.group(1)] = {
+                name: decode_header_value(message[name]) or ''
+                for name in HEADER_NAMES.values()
+            }
+    return headers
+
+
+def select_by_headers(
+        imap: imaplib.IMAP4_SSL,
+        mail_list: List[bytes],
+        local_rules: List,
+        limit: int
+        ) -> Tuple[List[bytes], List[bytes], int]:
+    """
+    Отбирает письма, которые проходят правила по заголовкам.
+
+    Заголовки загружаются пачками по `RULES_HEADER_CHUNK_SIZE` писем
+    в порядке списка, пока не наберется `limit` подходящих писем, поэтому
+    отклоненные письма не уменьшают пачку синхронизации.
+
+    Args:
+        imap (imaplib.IMAP4_SSL): Активное IMAP-соединение.
+        mail_list (List[bytes]): UID писем в порядке обработки.
+        local_rules (List[IngestRule]): Правила из `compile_rules`.
+        limit (int): Сколько писем отобрать.
+
+    Returns:
+        tuple: UID подходящих писем (не больше `limit`), UID отклоненных
+          писем и количество просмотренных писем с начала списка.
+    """
+    selected, rejected, examined = [], [], 0
+    for start in range(0, len(mail_list), RULES_HEADER_CHUNK_SIZE):
+        chunk = mail_list[start:start + RULES_HEADER_CHUNK_SIZE]
+        headers = fetch_headers(imap, chunk)
+        for num in chunk:
+            examined += 1
+            if num not in headers:
+                continue
+            if matches_rules(local_rules, headers[num]):
+                selected.append(num)
+                if len(selected) == limit:
+                    return selected, rejected, examined
+            else:
+                rejected.append(num)
+    return selected, rejected, examined
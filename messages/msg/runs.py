@@ -0,0 +1,157 @@
+import statistics
+import time
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from datetime import timedelta
+from typing import Any, Dict, List, Optional
+
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .constants import SLOW_RUN_FACTOR, SYNC_BASELINE_RUNS
+from .models import Email, SyncRun
+
+
+class SyncRunRecorder:
+    """
+    Запись истории одного запуска синхронизации.
+
+    Используется как контекстный менеджер: при входе создается запись
+    `SyncRun`, при выходе сохраняются счетчики, длительность этапов,
+    скорость относительно базы ящика и класс ошибки, если запуск
+    завершился исключением.
+    """
+
+    def __init__(self, email_account: 'Email', kind: str):
+        self.email_account = email_account
+        self.kind = kind
+        self.run = None
+        self.stages = defaultdict(float)
+        self.started = None
+
+    def __enter__(self) -> 'SyncRunRecorder':
+        self.started = time.perf_counter()
+        self.run = SyncRun.objects.create(
+            email=self.email_account, kind=self.kind,
+            started_at=timezone.now(),
+        )
+        return self
+
+    def __exit__(self, exc_type, exc, traceback) -> None:
+        if exc is not None:
+            self.fail(exc)
+        self.finish()
+
+    @contextmanager
+    def stage(self, name: str):
+        """Добавляет время выполнения блока к длительности этапа."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] += time.perf_counter() - started
+
+    def fail(self, err: BaseException) -> None:
+        """Запоминает первую ошибку запуска."""
+        if not self.run.error_class:
+            self.run.error_class = type(err).__name__
+            self.run.error_message = str(err)
+
+    def finish(self) -> None:
+        """Сохраняет итоги запуска и сравнивает скорость с базой ящика."""
+        run = self.run
+        run.finished_at = timezone.now()
+        run.duration = time.perf_counter() - self.started
+        run.stages = {
+            name: round(seconds, 3) for name, seconds in self.stages.items()
+        }
+        if run.messages_new and run.duration:
+            run.throughput = run.messages_new / run.duration
+            run.baseline = get_baseline(run)
+            run.is_slow = bool(
+                run.baseline and run.throughput * SLOW_RUN_FACTOR
+                < run.baseline
+            )
+        run.save()
+
+
+def measure(recorder: Optional['SyncRunRecorder'], name: str):
+    """Возвращает замер этапа или пустой контекст без записи запуска."""
+    return recorder.stage(name) if recorder else nullcontext()
+
+
+def get_baseline(run: 'SyncRun') -> Optional[float]:
+    """
+    Возвращает скользящую базу скорости для запуска.
+
+    База — медиана скорости последних `SYNC_BASELINE_RUNS` успешных
+    запусков того же ящика и типа, в которых были новые письма.
+
+    Args:
+        run (SyncRun): Запуск синхронизации.
+
+    Returns:
+        float or None: Писем в секунду или None, если истории нет.
+    """
+    previous = list(
+        SyncRun.objects.filter(
+            email_id=run.email_id, kind=run.kind, error_class='',
+            throughput__isnull=False, started_at__lt=run.started_at,
+        ).order_by('-started_at').values_list(
+            'throughput', flat=True
+        )[:SYNC_BASELINE_RUNS]
+    )
+    return statistics.median(previous) if previous else None
+
+
+def get_throughput_trends(days: int) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Возвращает скорость синхронизации по дням для ящиков и провайдеров.
+
+    Args:
+        days (int): За сколько последних дней считать.
+
+    Returns:
+        dict: Списки по ключам accounts и providers; в каждой строке
+          день, число запусков, медленных запусков и ошибок, новые письма,
+          байты и скорость (писем и байт в секунду).
+    """
+    runs = SyncRun.objects.filter(
+        started_at__gte=timezone.now() - timedelta(days=days),
+        finished_at__isnull=False,
+    ).annotate(day=TruncDate('started_at'))
+    totals = {
+        'runs': Count('id'),
+        'slow_runs': Count('id', filter=Q(is_slow=True)),
+        'failed_runs': Count('id', filter=~Q(error_class='')),
+        'messages_new': Sum('messages_new'),
+        'bytes': Sum('bytes_transferred'),
+        'duration': Sum('duration'),
+    }
+    return {
+        'accounts': add_rates(
+            runs.values('day', 'email__email').annotate(**totals)
+            .order_by('email__email', 'day')
+        ),
+        'providers': add_rates(
+            runs.values('day', 'email__provider').annotate(**totals)
+            .order_by('email__provider', 'day')
+        ),
+    }
+
+
+def add_rates(rows) -> List[Dict[str, Any]]:
+    """Добавляет к строкам скорость и приводит дни к строкам."""
+    result = []
+    for row in rows:
+        duration = row.pop('duration') or 0
+        row['day'] = row['day'].isoformat()
+        row['messages_per_second'] = (
+            round(row['messages_new'] / duration, 3) if duration else None
+        )
+        row['bytes_per_second'] = (
+            round(row['bytes'] / duration, 1) if duration else None
+        )
+        result.append(row)
+    return result
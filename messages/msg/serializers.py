@@ -0,0 +1,32 @@
+from typing import Any, Dict
+
+from .models import MessageData
+
+
+def serialize_message(message: 'MessageData') -> Dict[str, Any]:
+    """
+    Преобразует письмо в словарь для выгрузки.
+
+    Для письма должны быть подгружены связанные почта и тело
+    (`select_related('email', 'body')`), иначе каждое письмо
+    потребует дополнительных запросов.
+
+    Args:
+        message (MessageData): Экземпляр письма.
+
+    Returns:
+        dict: Данные письма, пригодные для сериализации в JSON.
+    """
+    return {
+        'id': message.id,
+        'email': message.email.email,
+        'email_from': message.email_from,
+        'title': message.title,
+        'dispatch_date': message.dispatch_date.isoformat(),
+        'receipt_date': message.receipt_date.isoformat(),
+        'text': message.text,
+        'msg_read': message.msg_read,
+        'files': message.files,
+        'uid': message.uid,
+        'message_id': message.body.message_id if message.body else '',
+    }
@@ -4,15 +4,34 @@ from datetime import datetime as dt
 from email.header import decode_header
 from email.parser import BytesParser
 from email.utils import parsedate_to_datetime
+from functools import partial
 from typing import Optional, Dict, Any, List, Tuple
 
-from asgiref.sync import async_to_sync
+from asgiref.sync import async_to_sync, sync_to_async
 from celery import shared_task
 from channels.layers import get_channel_layer
+from django.conf import settings
 from django.core.files.base import ContentFile
 from django.db import transaction
-
-from .models import Email, MessageData, MessageFile
+from django.db.models import OuterRef, Q, Subquery
+
+from .bodies import get_body_fields, get_dictionaries
+from .cache import invalidate_account_list, invalidate_account_lists
+from .constants import (BACKFILL, BACKFILL_CHUNK_SIZE, IMAP_SERVERS,
+                        INTERACTIVE, INTERACTIVE_SYNC_LIMIT,
+                        MAX_MESSAGE_ID_LEGTH, PREVIEW_LEGTH)
+from .leases import (clear_preemption, holds_lease, is_preempted,
+                     request_preemption, request_sync)
+from .mime import MessagePart, MessageParts
+from .models import (Email, IngestRule, MessageBody, MessageData, MessageFile,
+                     RejectedMessage)
+from .rules import get_account_rules, select_by_headers
+from .runs import SyncRunRecorder, measure
+from .stats import update_stats
+from .threads import assign_thread, assign_threads
+from .utils import get_content_hash
+from .workers import (BACKFILL_PRIORITY, EMBEDDED, INTERACTIVE_PRIORITY,
+                      LEASES, get_worker)
 
 
 def decode_and_get_title(
@@ -71,72 +90,9 @@ def decode_and_get_email(
     return byte_or_str_email_from
 
 
-def decode_and_get_text(
-        message
-        ) -> tuple:
-    """
-    Декодирование данных письма (текст, HTML-контент, файлы).
-
-    Функция принимает экземпляр 'message', представляющий собой MIME-сообщение
-    и извлекает из него текстовый и HTML-контент, а также файлы вложений.
-    текст, HTML-контент, файлы в формате MIME. Для каждого текстового и
-    HTML-содержимого происходит декодирование с использованием
-    указанной кодировки. Вложения извлекаются и декодируются, после чего
-    сохраняются в виде списка словарей.
-
-    Args:
-        message (email.message.Message): Экземпляр сообщения, из которого
-        извлекаются и декодируются данные.
-
-    Returns:
-        tuple: Кортеж, содержащий:
-            - text_content (str): Декодированный текстовый контент письма.
-            - html_content (str): Декодированный HTML-контент письма.
-            - files_list (list of dict): Список словарей, каждый из которых
-              содержит информацию о файле-вложении.
-            - filename (str or None): Имя последнего найденного файла-вложения
-              (может быть None, если вложений нет).
-            - file_data (bytes or None): Декодированные данные последнего
-              найденного файла-вложения (может быть None, если вложений нет).
-    """
-    text_content, html_content = '', ''
-    files_list = []
-    filename, file_data = None, None
-
-    for part in message.walk():
-        content_type = part.get_content_type()
-        content_disposition = part.get("Content-Disposition", "")
-
-        # Получение текста и его декодироваине
-        if (content_type == "text/plain"
-                and "attachment" not in content_disposition):
-            text_content += part.get_payload(decode=True).decode(
-                part.get_content_charset() or 'utf-8'
-            )
-
-        # Получение HTML и его декодирование
-        elif (content_type == "text/html"
-                and "attachment" not in content_disposition):
-            html_content += part.get_payload(decode=True).decode(
-                part.get_content_charset() or 'utf-8'
-            )
-
-        # Получение вложений
-        elif "attachment" in content_disposition or part.get_filename():
-            filename = part.get_filename()
-            if filename:
-                # Декодирование вложения
-                filename = decode_header(part.get_filename())[0][0].decode()
-                file_data = part.get_payload(decode=True)
-                files_list.append(
-                    {'filename': filename}
-                )
-
-    return text_content, html_content, files_list, filename, file_data
-
-
 def connect_to_mail_server(
-        email_account: 'Email'
+        email_account: 'Email',
+        run: Optional['SyncRunRecorder'] = None
         ) -> imaplib.IMAP4_SSL | None:
     """
     Подключается к почтовому сервису с использованием учетных данных
@@ -152,6 +108,8 @@ def connect_to_mail_server(
     Args:
         email_account (Email): Объект, содержащий данные для входа в почтовый
         сервис, включая email, пароль и провайдера почты.
+        run (Optional[SyncRunRecorder]): Запись запуска синхронизации,
+          в которую сохраняется ошибка.
 
     Returns:
         imaplib.IMAP4_SSL or None: Объект IMAP-соединения в случае успешного
@@ -163,13 +121,7 @@ def connect_to_mail_server(
         Exception: Если возникает ошибка при подключении к почтовому серверу.
     """
     try:
-        imap_server_map = {
-            'YANDEX': 'imap.yandex.ru',
-            'GMAIL': 'imap.gmail.com',
-            'MAILRU': 'imap.mail.ru'
-        }
-
-        host = imap_server_map.get(email_account.provider)
+        host = IMAP_SERVERS.get(email_account.provider)
 
         if not host:
             raise ValueError(f'Неверный потчовый индекс {host}')
@@ -183,22 +135,35 @@ def connect_to_mail_server(
 
     except Exception as err:
         print(f'Ошибка подключения к почтовому серверу: {err}')
+        if run:
+            run.fail(err)
         return None
 
 
-def get_mail_list(imap: imaplib.IMAP4_SSL) -> List[bytes]:
+def get_mail_list(
+        imap: imaplib.IMAP4_SSL,
+        run: Optional['SyncRunRecorder'] = None,
+        criteria: Optional[List[str]] = None
+        ) -> List[bytes]:
 
     """
     Получает список всех писем из почтового ящика.
 
     Функция подключается к почтовому ящику через IMAP и выполняет поиск писем,
-    используя команду `search`. По умолчанию функция возвращает список всех
-    непрочитанных писем в ящике. Возвращаемое значение — это список уникальных
-    идентификаторов писем (UID). Если возникает ошибка при получении писем,
-    функция возвращает пустой список.
+    используя команду `UID SEARCH`. По умолчанию функция возвращает список
+    всех непрочитанных писем в ящике, а условия из правил загрузки ящика
+    (`compile_rules`) отбирают письма на сервере. Возвращаемое значение —
+    это список уникальных
+    идентификаторов писем (UID) по возрастанию. В отличие от порядковых
+    номеров, UID не сдвигаются при удалении писем из папки. Если возникает
+    ошибка при получении писем, функция возвращает пустой список.
 
     Args:
         imap (imaplib.IMAP4_SSL): Активное IMAP-соединение с почтовым ящиком.
+        run (Optional[SyncRunRecorder]): Запись запуска синхронизации,
+          в которую сохраняется ошибка.
+        criteria (Optional[List[str]]): Условия поиска IMAP; по умолчанию
+          UNSEEN.
 
     Returns:
         list: Список UID (уникальных идентификаторов) всех писем в почтовом
@@ -210,19 +175,110 @@ def get_mail_list(imap: imaplib.IMAP4_SSL) -> List[bytes]:
     """
     try:
         # status, messages_count = imap.search(None, 'ALL')
-        status, messages_count = imap.search(None, 'UNSEEN')
+        status, messages_count = imap.uid(
+            'SEARCH', *(criteria or ['UNSEEN'])
+        )
         if status == 'OK':
-            return messages_count[0].split()
+            return sorted(messages_count[0].split(), key=int)
     except Exception as err:
         print(f'Ошибка получения списка писем {err}')
+        if run:
+            run.fail(err)
     return []
 
 
+def get_uid_validity(imap: imaplib.IMAP4_SSL) -> Optional[int]:
+    """
+    Возвращает UIDVALIDITY выбранной папки.
+
+    Значение приходит в ответе на SELECT; если сервер его изменил, UID
+    писем папки назначены заново и курсор догрузки недействителен.
+    """
+    _, data = imap.response('UIDVALIDITY')
+    try:
+        return int(data[0])
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+def claim_unknown_validity(
+        email_account: 'Email',
+        uid_validity: Optional[int]
+        ) -> None:
+    """
+    Относит письма ящика без UIDVALIDITY к текущей папке.
+
+    UIDVALIDITY не было у писем, сохраненных до ее учета или когда
+    сервер ее не сообщил; их UID выданы текущей папкой, поэтому они
+    проверяются на повтор вместе с письмами этой папки.
+
+    Args:
+        email_account (Email): Почтовый ящик.
+        uid_validity (Optional[int]): UIDVALIDITY папки.
+    """
+    if uid_validity is None:
+        return
+    MessageData.objects.filter(
+        email=email_account, uid_validity__isnull=True
+    ).update(uid_validity=uid_validity)
+
+
+def parse_message(
+        raw_message: bytes
+        ) -> Tuple[Dict[str, Any], List['MessagePart']]:
+    """
+    Разбирает исходный текст письма в формате RFC 822.
+
+    Функция декодирует заголовок, дату отправки, адрес отправителя,
+    заголовки цепочки (Message-ID, In-Reply-To, References) и текст,
+    а части письма собирает за один проход в
+    `MessageParts`. HTML-контент декодируется, только если в письме нет
+    текста, а содержимое вложений — при сохранении. Не обращается к базе
+    данных, поэтому используется как при получении писем по IMAP, так и
+    при импорте архивов в отдельных процессах.
+
+    Args:
+        raw_message (bytes): Исходный текст письма.
+
+    Returns:
+        tuple: Кортеж, содержащий:
+            - data_msg (dict): Словарь с отправителем, заголовком,
+              датой отправки, текстом/HTML контентом, списком файлов,
+              Message-ID, In-Reply-To и References письма.
+            - attachments (List[MessagePart]): Вложения письма, включая
+              встроенные изображения.
+    """
+    message = BytesParser().parsebytes(raw_message)
+
+    title = decode_and_get_title(message.get('subject'))
+    sent_date = parsedate_to_datetime(message.get('date'))
+    email_from = decode_and_get_email(message.get('from'))
+    parts = MessageParts(message)
+    attachments = parts.attachments
+    message_id = (message.get('Message-ID') or '').strip()
+    in_reply_to = (message.get('In-Reply-To') or '').strip()
+    references = ' '.join((message.get('References') or '').split())
+
+    data_msg = {
+        'email_from': email_from,
+        'title': title,
+        'dispatch_date': sent_date,
+        'text': parts.text or parts.html,
+        'files': [attachment.describe() for attachment in attachments],
+        'message_id': message_id[:MAX_MESSAGE_ID_LEGTH],
+        'in_reply_to': in_reply_to[:MAX_MESSAGE_ID_LEGTH],
+        'references': references,
+    }
+    return data_msg, attachments
+
+
 def get_mail_data(
         imap: imaplib.IMAP4_SSL,
         num: bytes,
-        email_account: 'Email'
-        ) -> Tuple[Dict[str, Any], Optional[str], Optional[bytes]]:
+        email_account: 'Email',
+        run: Optional['SyncRunRecorder'] = None,
+        uid_validity: Optional[int] = None
+        ) -> Tuple[Optional[Dict[str, Any]], List['MessagePart']]:
     """
     Извлекает и обрабатывает данные из письма, подключенного через IMAP.
 
@@ -236,106 +292,379 @@ def get_mail_data(
     Args:
         imap (imaplib.IMAP4_SSL): Активное IMAP-соединение с почтовым ящиком.
         num (bytes): Уникальный идентификатор (UID) письма,
-          используемый для его извлечения.
+          используемый для его извлечения командой `UID FETCH`.
         email_account (Email): Экземпляр модели почтового аккаунта,
           с которого получено письмо.
+        run (Optional[SyncRunRecorder]): Запись запуска синхронизации,
+          в которую добавляются объем, длительность загрузки и разбора
+          и ошибка.
+        uid_validity (Optional[int]): UIDVALIDITY папки, в которой
+          действует UID письма.
 
     Returns:
         tuple: Кортеж, содержащий:
             - data_msg (dict): Словарь с данными письма,
               включая заголовок, отправителя, дату отправки,
-              текст/HTML контент, статус прочтения, список файлов и UID письма.
-            - file_name (str or None): Имя последнего найденного
-              файла-вложения (может быть None, если вложений нет).
-            - file_data (bytes or None): Декодированные данные последнего
-              найденного файла-вложения (может быть None, если вложений нет).
+              текст/HTML контент, статус прочтения, список файлов, UID,
+              UIDVALIDITY и Message-ID письма, или
+              None, если письмо не удалось получить или разобрать.
+            - attachments (List[MessagePart]): Вложения письма.
 
     Raises:
         ValueError: Если не удается получить данные из письма.
         Exception: Если возникает ошибка при обработке данных письма.
     """
+    data_msg, attachments = None, []
     try:
         time.sleep(2)
         # Получение данных из сообщения
         num_str = num.decode('utf-8')
-        _, message_data = imap.fetch(num_str, '(RFC822)')
+        with measure(run, 'fetch'):
+            _, message_data = imap.uid('FETCH', num_str, '(RFC822)')
 
         # Проверка, что получены данные из письма
         if not message_data or not message_data[0]:
             raise ValueError('Ошибка получения данных письма')
         msg = message_data[0][1]
+        if run:
+            run.run.bytes_transferred += len(msg)
 
-        if isinstance(msg, (bytes, bytearray)):
-            message = BytesParser().parsebytes(msg)
-
-        title = decode_and_get_title(message.get('subject'))
-        sent_date = parsedate_to_datetime(message.get('date'))
-        email_from = decode_and_get_email(message.get('from'))
-        text, html, files, file_name, file_data = decode_and_get_text(message)
-        uid = num.decode('utf-8')
-
-        data_msg = {
+        with measure(run, 'parse'):
+            data_msg, attachments = parse_message(msg)
+        data_msg.update({
             "email": email_account,
-            'email_from': email_from,
-            "title": title,
-            "dispatch_date": sent_date,
             "receipt_date": dt.now(),
-            "text": text if text else html,
             "msg_read": True,
-            "files": files,
-            "uid": uid,
-        }
+            "uid": num.decode('utf-8'),
+            "uid_validity": uid_validity,
+        })
     except Exception as err:
         print(f'Ошибка обратотки пиьсма {err}')
-    return data_msg, file_name, file_data
+        if run:
+            run.fail(err)
+    return data_msg, attachments
+
+
+def get_or_create_message_body(
+        message_id: str,
+        text: Optional[str],
+        account_id: Optional[int] = None,
+        email_from: Optional[str] = None
+        ) -> Tuple['MessageBody', bool]:
+    """
+    Возвращает общее тело письма, создавая его при необходимости.
+
+    Тело определяется парой Message-ID + хеш содержимого, поэтому копии
+    одного письма на разных ящиках ссылаются на одну запись `MessageBody`.
+    При включенной настройке `BODY_COMPRESSION` новое тело сжимается
+    словарем отправителя или ящика.
+
+    Args:
+        message_id (str): Значение заголовка Message-ID (может быть пустым).
+        text (Optional[str]): Текст или HTML-контент письма.
+        account_id (Optional[int]): Идентификатор почтового ящика.
+        email_from (Optional[str]): Отправитель письма.
+
+    Returns:
+        tuple: Кортеж из экземпляра `MessageBody` и флага,
+          была ли запись создана.
+    """
+    return MessageBody.objects.get_or_create(
+        message_id=message_id or '',
+        content_hash=get_content_hash(text),
+        defaults=get_body_fields(text, account_id, email_from),
+    )
+
+
+def get_shared_files(
+        bodies: List['MessageBody']
+        ) -> Dict[int, List[str]]:
+    """
+    Возвращает пути уже сохраненных вложений для общих тел писем.
+
+    Вложения переиспользуются только для писем с Message-ID: без него
+    совпадение текста не гарантирует совпадения вложений. Для каждого
+    тела берутся файлы первого письма с вложениями, все тела
+    обрабатываются одним запросом.
+
+    Args:
+        bodies (List[MessageBody]): Общие тела писем.
+
+    Returns:
+        Dict[int, List[str]]: Пути файлов в хранилище в порядке вложений
+          письма по идентификатору тела; тела без файлов не включаются.
+    """
+    body_ids = [body.id for body in bodies if body.message_id]
+    if not body_ids:
+        return {}
+    first_message = MessageFile.objects.filter(
+        message__body_id=OuterRef('message__body_id')
+    ).order_by('id').values('message_id')[:1]
+    shared = {}
+    for body_id, name in MessageFile.objects.filter(
+            message__body_id__in=body_ids,
+            message_id=Subquery(first_message),
+            ).order_by('id').values_list('message__body_id', 'file'):
+        shared.setdefault(body_id, []).append(name)
+    return shared
+
+
+def get_shared_file_names(body: 'MessageBody') -> List[str]:
+    """
+    Возвращает пути уже сохраненных вложений для общего тела письма.
+
+    Args:
+        body (MessageBody): Общее тело письма.
+
+    Returns:
+        List[str]: Пути файлов в хранилище в порядке вложений письма или
+          пустой список, если файлов нет.
+    """
+    return get_shared_files([body]).get(body.id, [])
+
+
+def build_message_files(
+        email_message: 'MessageData',
+        attachments: List['MessagePart'],
+        shared_file_names: List[str]
+        ) -> List['MessageFile']:
+    """
+    Создает несохраненные записи `MessageFile` для вложений письма.
+
+    Если у копии письма уже есть сохраненные файлы, записи ссылаются
+    на них, и содержимое вложений не декодируется.
+
+    Args:
+        email_message (MessageData): Письмо.
+        attachments (List[MessagePart]): Вложения письма.
+        shared_file_names (List[str]): Пути сохраненных вложений копии
+          письма или пустой список.
+
+    Returns:
+        List[MessageFile]: Записи вложений.
+    """
+    email_files = []
+    if shared_file_names:
+        for name in shared_file_names:
+            email_file = MessageFile(message=email_message)
+            email_file.file.name = name
+            email_files.append(email_file)
+        return email_files
+    for attachment in attachments:
+        email_file = MessageFile(message=email_message)
+        email_file.file.save(
+            attachment.file_name, ContentFile(attachment.payload), save=False
+        )
+        email_files.append(email_file)
+    return email_files
 
 
 def save_data_in_db(
         data_msg: Dict[str, Any],
-        file_name: Optional[str],
-        file_data: Optional[bytes]
-        ) -> 'MessageData':
+        attachments: List['MessagePart']
+        ) -> Optional['MessageData']:
     """
     Сохраняет данные письма и вложения в базу данных с
     использованием транзакции.
 
     Функция принимает данные письма, создает объект модели `MessageData`
-    и сохраняет его в базе данных. Если письмо содержит вложение, оно
-    сохраняется как объект `MessageFile`, связанный с письмом.
+    и сохраняет его в базе данных. Текст письма хранится один раз в
+    `MessageBody` и переиспользуется копиями письма на других ящиках.
+    Каждое вложение сохраняется как объект `MessageFile`, связанный
+    с письмом; файлы копии не записываются повторно, а ссылаются на уже
+    сохраненные.
     Операции выполняются в рамках транзакции для обеспечения
-    целостности данных.
+    целостности данных: при ошибке письмо не сохраняется целиком.
 
     Args:
         data_msg (Dict[str, Any]): Словарь с данными письма, которые будут
           использованы для создания объекта `MessageData`.
-        file_name (Optional[str]): Имя файла-вложения. Может быть `None`,
-          если вложений нет.
-        file_data (Optional[bytes]): Декодированные данные файла-вложения.
-          Может быть `None`, если вложений нет.
+        attachments (List[MessagePart]): Вложения письма.
 
     Returns:
-        MessageData: Экземпляр модели `MessageData`, представляющий
-          сохраненное письмо.
+        MessageData or None: Экземпляр модели `MessageData`,
+          представляющий сохраненное письмо, или None, если письмо
+          не сохранено.
 
     Raises:
         Exception: Если возникает ошибка при сохранении данных в базу данных.
     """
+    email_message = None
     try:
-        email_message = MessageData(**data_msg)
+        data_msg = dict(data_msg)
+        text = data_msg.pop('text', None)
+        message_id = data_msg.pop('message_id', '')
 
         with transaction.atomic():
+            body, created = get_or_create_message_body(
+                message_id, text, data_msg['email'].id,
+                data_msg.get('email_from'),
+            )
+            email_message = MessageData(body=body, **data_msg)
             email_message.save()
-
-        if file_data:
-            email_files = MessageFile(message=email_message)
-            email_files.file.save(file_name, ContentFile(file_data))
-            email_files.save()
+            assign_thread(email_message)
+            update_stats([email_message])
+            if attachments:
+                shared_file_names = (
+                    [] if created else get_shared_file_names(body)
+                )
+                MessageFile.objects.bulk_create(build_message_files(
+                    email_message, attachments, shared_file_names
+                ))
+            transaction.on_commit(
+                lambda: invalidate_account_list(email_message.email_id)
+            )
 
     except Exception as err:
         print(f'Ошибка сохранения пиьсма {err}')
+        return None
     return email_message
 
 
+def save_messages_in_db_bulk(
+        records: List[Tuple[Dict[str, Any], List['MessagePart']]]
+        ) -> List['MessageData']:
+    """
+    Сохраняет пачку писем в базу данных массовыми вставками.
+
+    Пакетный вариант `save_data_in_db` для импорта: уже сохраненные
+    письма (по ящику, UIDVALIDITY и UID) пропускаются, недостающие тела
+    писем, письма и вложения создаются через `bulk_create` в одной
+    транзакции, в ней же обновляются цепочки и статистика по
+    отправителям и дням.
+
+    Args:
+        records (List[Tuple]): Список кортежей (data_msg, attachments)
+          в формате `save_data_in_db`.
+
+    Returns:
+        List[MessageData]: Созданные письма.
+    """
+    uids = {}
+    for data_msg, _ in records:
+        uids.setdefault(
+            (data_msg['email'].id, data_msg.get('uid_validity')), []
+        ).append(data_msg['uid'])
+    query = Q()
+    for (email_id, uid_validity), folder_uids in uids.items():
+        query |= Q(
+            email_id=email_id, uid_validity=uid_validity,
+            uid__in=folder_uids,
+        )
+    seen_uids = set(MessageData.objects.filter(query).values_list(
+        'email_id', 'uid_validity', 'uid'
+    ))
+    new_records = []
+    for data_msg, attachments in records:
+        uid_key = (
+            data_msg['email'].id, data_msg.get('uid_validity'),
+            data_msg['uid'],
+        )
+        if uid_key in seen_uids:
+            continue
+        seen_uids.add(uid_key)
+        data_msg = dict(data_msg)
+        text = data_msg.pop('text', None)
+        key = (data_msg.pop('message_id', '') or '', get_content_hash(text))
+        new_records.append((data_msg, text, key, attachments))
+    if not new_records:
+        return []
+
+    with transaction.atomic():
+        hashes = {key[1] for _, _, key, _ in new_records}
+        bodies = {
+            (body.message_id, body.content_hash): body
+            for body in MessageBody.objects.filter(content_hash__in=hashes)
+        }
+        existing_keys = set(bodies)
+        missing = {}
+        dictionaries = get_dictionaries(
+            data_msg['email'].id for data_msg, _, _, _ in new_records
+        ) if settings.BODY_COMPRESSION else {}
+        for data_msg, text, key, _ in new_records:
+            if key not in bodies and key not in missing:
+                missing[key] = MessageBody(
+                    message_id=key[0], content_hash=key[1],
+                    **get_body_fields(
+                        text, data_msg['email'].id,
+                        data_msg.get('email_from'), dictionaries,
+                    ),
+                )
+        if missing:
+            MessageBody.objects.bulk_create(
+                missing.values(), ignore_conflicts=True
+            )
+            bodies.update({
+                (body.message_id, body.content_hash): body
+                for body in MessageBody.objects.filter(
+                    content_hash__in={key[1] for key in missing}
+                )
+            })
+
+        messages = MessageData.objects.bulk_create([
+            MessageData(body=bodies[key], **data_msg)
+            for data_msg, _, key, _ in new_records
+        ])
+        assign_threads(messages)
+        update_stats(messages)
+
+        shared_files = get_shared_files([
+            bodies[key] for _, _, key, attachments in new_records
+            if attachments and key in existing_keys
+        ])
+        email_files = []
+        for message, (_, _, key, attachments) in zip(
+                messages, new_records):
+            if not attachments:
+                continue
+            shared_file_names = (
+                shared_files.get(bodies[key].id, [])
+                if key in existing_keys else []
+            )
+            email_files.extend(build_message_files(
+                message, attachments, shared_file_names
+            ))
+        MessageFile.objects.bulk_create(email_files)
+        transaction.on_commit(partial(
+            invalidate_account_lists,
+            [message.email_id for message in messages],
+        ))
+    return messages
+
+
+def build_email_data(
+        email_message: 'MessageData'
+        ) -> Dict[str, Any]:
+    """
+    Формирует данные письма для отправки клиенту через WebSocket.
+
+    Идентификатор письма служит курсором: клиент передает последний
+    полученный идентификатор при переподключении, чтобы получить
+    пропущенные письма.
+
+    Args:
+        email_message (MessageData): Экземпляр модели `MessageData`
+          с подгруженным телом письма.
+
+    Returns:
+        dict: Данные письма для WebSocket.
+    """
+    return {
+        'id': email_message.id,
+        'account': email_message.email_id,
+        'email_from': email_message.email_from,
+        'title': email_message.title[:PREVIEW_LEGTH],
+        'dispatch_date': (
+            email_message.dispatch_date.strftime('%Y-%m-%d %H:%M:%S')
+        ),
+        'receipt_date': (
+            email_message.receipt_date.strftime('%Y-%m-%d %H:%M:%S')
+        ),
+        'text': (email_message.text or '')[:PREVIEW_LEGTH],
+        'files': email_message.files,
+    }
+
+
 async def send_email_by_websocket(
         email_message: 'MessageData'
         ) -> None:
@@ -346,7 +675,9 @@ async def send_email_by_websocket(
     и отправляет их клиенту через WebSocket соединение. Данные включают
     информацию о отправителе, заголовке письма, дате отправки и получения,
     тексте письма и файлах вложений.
-    Сообщение отправляется в определенную группу WebSocket.
+    Сообщение отправляется в определенную группу WebSocket. Данные
+    собираются в синхронном потоке: для сжатого текста может
+    понадобиться запрос словаря к базе данных.
 
     Args:
         email_message (MessageData): Экземпляр модели `MessageData`,
@@ -360,18 +691,7 @@ async def send_email_by_websocket(
     """
     try:
         channel_layer = get_channel_layer()
-        email_data = {
-            'email_from': email_message.email_from,
-            'title': email_message.title[:50],
-            'dispatch_date': (
-                email_message.dispatch_date.strftime('%Y-%m-%d %H:%M:%S')
-            ),
-            'receipt_date': (
-                email_message.receipt_date.strftime('%Y-%m-%d %H:%M:%S')
-            ),
-            'text': email_message.text[:50],
-            'files': email_message.files,
-        }
+        email_data = await sync_to_async(build_email_data)(email_message)
 
         # Отправляем сообщение в группу вебсокет
         await channel_layer.group_send(
@@ -428,54 +748,326 @@ async def progress_bar(
         print(f'Ошибка прогресс-бара {err}')
 
 
+def select_messages(
+        email_account: 'Email',
+        imap: imaplib.IMAP4_SSL,
+        mail_list: List[bytes],
+        local_rules: List['IngestRule'],
+        limit: int,
+        uid_validity: Optional[int] = None,
+        run: Optional['SyncRunRecorder'] = None
+        ) -> Tuple[Optional[List[bytes]], Optional[bytes]]:
+    """
+    Выбирает следующую пачку писем для загрузки, от новых к старым.
+
+    Если у ящика есть правила, которые проверяются по заголовкам, письма
+    отбираются по заголовкам до того, как пачка ограничивается `limit`.
+    Отклоненные письма сохраняются в `RejectedMessage` и в следующие
+    синхронизации не проверяются.
+
+    Args:
+        email_account (Email): Почтовый ящик.
+        imap (imaplib.IMAP4_SSL): Подключение к почтовому серверу.
+        mail_list (List[bytes]): UID найденных писем по возрастанию.
+        local_rules (List[IngestRule]): Правила из `compile_rules`.
+        limit (int): Размер пачки.
+        uid_validity (Optional[int]): UIDVALIDITY папки.
+        run (Optional[SyncRunRecorder]): Запись запуска синхронизации.
+
+    Returns:
+        tuple: UID писем пачки (None при ошибке проверки заголовков)
+          и UID последнего просмотренного письма, если остались
+          непросмотренные письма, иначе None.
+    """
+    candidates = mail_list[::-1]
+    if not local_rules:
+        batch = candidates[:limit]
+        examined = len(batch)
+    else:
+        rejected_messages = RejectedMessage.objects.filter(email=email_account)
+        rejected_messages.exclude(uid_validity=uid_validity).delete()
+        known = set(
+            uid.encode('utf-8')
+            for uid in rejected_messages.values_list('uid', flat=True)
+        )
+        candidates = [num for num in candidates if num not in known]
+        try:
+            with measure(run, 'headers'):
+                batch, rejected, examined = select_by_headers(
+                    imap, candidates, local_rules, limit
+                )
+        except Exception as err:
+            print(f'Ошибка проверки правил загрузки {err}')
+            if run:
+                run.fail(err)
+            return None, None
+        RejectedMessage.objects.bulk_create([
+            RejectedMessage(
+                email=email_account, uid=num.decode('utf-8'),
+                uid_validity=uid_validity,
+            )
+            for num in rejected
+        ], ignore_conflicts=True)
+    if examined < len(candidates):
+        return batch, candidates[examined - 1]
+    return batch, None
+
+
+def sync_mail_batch(
+        email_account: 'Email',
+        imap: imaplib.IMAP4_SSL,
+        mail_list: List[bytes],
+        preemptible: bool = False,
+        run: Optional['SyncRunRecorder'] = None,
+        node: Optional[str] = None,
+        uid_validity: Optional[int] = None
+        ) -> Optional[bytes]:
+    """
+    Загружает и сохраняет пачку писем, отправляя новые письма и прогресс
+    клиенту через WebSocket.
+
+    Письма, уже сохраненные в базе данных (по UID в пределах ящика
+    и UIDVALIDITY папки), не скачиваются.
+    На узлах с арендой ящиков аренда проверяется перед каждым письмом:
+    если ее забрал другой узел, обработка прекращается.
+
+    Args:
+        email_account (Email): Почтовый ящик.
+        imap (imaplib.IMAP4_SSL): Подключение к почтовому серверу.
+        mail_list (List[bytes]): UID писем в порядке обработки.
+        preemptible (bool): Прерывать ли обработку, если ящик ждет
+          интерактивной синхронизации.
+        run (Optional[SyncRunRecorder]): Запись запуска синхронизации
+          для счетчиков писем и длительности этапов.
+        node (Optional[str]): Узел, который должен держать аренду ящика,
+          или None без проверки аренды.
+        uid_validity (Optional[int]): UIDVALIDITY папки.
+
+    Returns:
+        Optional[bytes]: UID письма, перед которым обработка прервана,
+          или None, если обработана вся пачка.
+    """
+    i = 0
+    for num in mail_list:
+        if preemptible and is_preempted(email_account.id):
+            return num
+        if node and not holds_lease(node, email_account.id):
+            print(f'Аренда ящика {email_account} потеряна узлом {node}')
+            return num
+        if run:
+            run.run.messages_seen += 1
+        if MessageData.objects.filter(
+                email=email_account, uid_validity=uid_validity,
+                uid=num.decode('utf-8')).exists():
+            if run:
+                run.run.messages_skipped += 1
+            continue
+        data_msg, attachments = get_mail_data(
+            imap, num, email_account, run, uid_validity
+        )
+        with measure(run, 'save'):
+            email_message = (
+                save_data_in_db(data_msg, attachments) if data_msg else None
+            )
+        if email_message is None:
+            if run:
+                run.run.messages_skipped += 1
+            continue
+        if run:
+            run.run.messages_new += 1
+        with measure(run, 'notify'):
+            async_to_sync(send_email_by_websocket)(email_message)
+            async_to_sync(progress_bar)(mail_list, i)
+        i = i + 1
+    return None
+
+
 @shared_task
 def get_data_and_send_to_ws(
-    email_id: int
+    email_id: int,
+    node: Optional[str] = None
         ) -> None:
     """
-    Задача Celery для получения данных писем и отправки их через WebSocket.
+    Задача Celery для интерактивной синхронизации почтового ящика.
 
     Эта задача выполняет следующие действия:
     1. Подключается к почтовому серверу с использованием учетных данных,
       связанных с `email_id`.
-    2. Получает список всех писем из почтового ящика.
-    3. Для каждого письма, начиная с самого последнего, извлекает его данные и
-      сохраняет их в базе данных.
-    4. Если письмо еще не существует в базе данных (определяется по UID),
-      данные сохраняются, и информация о письме
-       отправляется клиенту через WebSocket.
-    5. Обновляет прогресс-бар в реальном времени через WebSocket.
-    6. После обработки всех писем происходит отключение от почтового сервера.
+    2. Получает список непрочитанных писем из почтового ящика.
+    3. Сразу загружает `INTERACTIVE_SYNC_LIMIT` самых новых писем, сохраняет
+      их в базе данных и отправляет клиенту через WebSocket вместе
+      с прогрессом.
+    4. Снимает флаг ожидания, по которому фоновая догрузка уступает место
+      этой задаче, и ставит в очередь догрузку остальных писем.
+
+    Каждый запуск сохраняется в истории `SyncRun`. На узлах с арендой
+    ящиков синхронизация прекращается, если узел потерял аренду ящика,
+    и догрузка в этом случае не ставится.
 
     Args:
         email_id (int): Идентификатор почтового аккаунта, для которого
           необходимо получить письма.
+        node (Optional[str]): Узел, который держит аренду ящика, или None
+          без проверки аренды.
 
     Returns:
         None: Функция не возвращает значения. Все результаты операции
           сохраняются в базе данных и отправляются клиенту через WebSocket.
-
-    Raises:
-        Exception: Если возникает ошибка при выполнении
-          любого из этапов задачи.
     """
-    i = 0
     email_account = Email.objects.get(id=email_id)
-    imap = connect_to_mail_server(email_account)
+    with SyncRunRecorder(email_account, INTERACTIVE) as run:
+        with run.stage('connect'):
+            imap = connect_to_mail_server(email_account, run)
+
+        if not imap:
+            clear_preemption(email_id)
+            return
+
+        try:
+            uid_validity = get_uid_validity(imap)
+            claim_unknown_validity(email_account, uid_validity)
+            criteria, local_rules = get_account_rules(email_account)
+            with run.stage('list'):
+                mail_list = get_mail_list(imap, run, criteria)
+            newest, cursor = select_messages(
+                email_account, imap, mail_list, local_rules,
+                INTERACTIVE_SYNC_LIMIT, uid_validity, run,
+            )
+            stopped = newest is None or sync_mail_batch(
+                email_account, imap, newest, run=run, node=node,
+                uid_validity=uid_validity,
+            )
+        finally:
+            imap.logout()
+            clear_preemption(email_id)
+
+    if stopped is None and cursor:
+        schedule_backfill(email_id, int(cursor), uid_validity, node)
 
-    if not imap:
+
+@shared_task
+def backfill_messages(
+    email_id: int,
+    before: Optional[int],
+    uid_validity: Optional[int] = None,
+    node: Optional[str] = None
+        ) -> None:
+    """
+    Задача Celery для фоновой догрузки старых писем почтового ящика.
+
+    За один запуск обрабатывается не больше `BACKFILL_CHUNK_SIZE` писем
+    с UID меньше `before`, от новых к старым, после чего задача
+    ставит в очередь следующую пачку. Курсор — UID, а не порядковый номер:
+    номера сдвигаются, если между пачками письма удаляются из папки. Если
+    сервер сменил UIDVALIDITY, курсор сбрасывается. Если ящик ждет
+    интерактивной синхронизации, задача прерывается без постановки
+    продолжения: интерактивная синхронизация сама запустит догрузку после
+    себя. На узлах с арендой ящиков догрузка выполняется, только пока узел
+    держит аренду ящика: после перераспределения ящиков или истечения
+    аренды пачка прерывается, а продолжение не ставится. Каждый запуск
+    сохраняется в истории `SyncRun`.
+
+    Args:
+        email_id (int): Идентификатор почтового ящика.
+        before (Optional[int]): UID письма, с которого продолжать догрузку
+          (не включительно), или None, чтобы начать с самых новых.
+        uid_validity (Optional[int]): UIDVALIDITY папки, для которой
+          получен курсор.
+        node (Optional[str]): Узел, который должен держать аренду ящика,
+          или None без проверки аренды.
+    """
+    if is_preempted(email_id):
+        return
+    if node and not holds_lease(node, email_id):
         return
 
-    mail_list = get_mail_list(imap)
+    email_account = Email.objects.get(id=email_id)
+    with SyncRunRecorder(email_account, BACKFILL) as run:
+        with run.stage('connect'):
+            imap = connect_to_mail_server(email_account, run)
+
+        if not imap:
+            return
+
+        try:
+            current_validity = get_uid_validity(imap)
+            if uid_validity and current_validity != uid_validity:
+                before = None
+            claim_unknown_validity(email_account, current_validity)
+            criteria, local_rules = get_account_rules(email_account)
+            with run.stage('list'):
+                mail_list = [
+                    num for num in get_mail_list(imap, run, criteria)
+                    if before is None or int(num) < before
+                ]
+            chunk, cursor = select_messages(
+                email_account, imap, mail_list, local_rules,
+                BACKFILL_CHUNK_SIZE, current_validity, run,
+            )
+            stopped = chunk is None or sync_mail_batch(
+                email_account, imap, chunk, preemptible=True, run=run,
+                node=node, uid_validity=current_validity,
+            )
+        finally:
+            imap.logout()
 
-    for num in mail_list[::-1]:
-        data_msg, file_name, file_data = get_mail_data(
-            imap, num, email_account
+    if stopped is None and cursor:
+        schedule_backfill(email_id, int(cursor), current_validity, node)
+
+
+def schedule_sync(email_id: int) -> bool:
+    """
+    Ставит интерактивную синхронизацию почтового ящика в очередь
+    выбранного обработчика.
+
+    Обработчик задается настройкой `SYNC_BACKEND`: брокер Celery (очередь
+    interactive), встроенный пул потоков с высоким приоритетом или узлы
+    с арендой ящиков (запрос выполнит узел-владелец ящика). Идущая
+    догрузка этого ящика прерывается на ближайшем письме.
+
+    Args:
+        email_id (int): Идентификатор почтового ящика.
+
+    Returns:
+        bool: True, если задача принята.
+    """
+    request_preemption(email_id)
+    if settings.SYNC_BACKEND == LEASES:
+        request_sync(email_id)
+        return True
+    if settings.SYNC_BACKEND == EMBEDDED:
+        return get_worker().submit(
+            ('sync', email_id), get_data_and_send_to_ws, email_id,
+            priority=INTERACTIVE_PRIORITY,
         )
-        if not MessageData.objects.filter(uid=num.decode('utf-8')).exists():
-            email_message = save_data_in_db(data_msg, file_name, file_data)
-            async_to_sync(send_email_by_websocket)(email_message)
-            async_to_sync(progress_bar)(mail_list, i)
-            i = i + 1
+    get_data_and_send_to_ws.delay(email_id)
+    return True
+
+
+def schedule_backfill(
+        email_id: int,
+        before: int,
+        uid_validity: Optional[int] = None,
+        node: Optional[str] = None
+        ) -> bool:
+    """
+    Ставит фоновую догрузку писем почтового ящика в очередь выбранного
+    обработчика (очередь backfill или низкий приоритет пула потоков).
+    На узлах с арендой ящиков догрузка выполняется пулом потоков узла.
 
-    imap.logout()
+    Args:
+        email_id (int): Идентификатор почтового ящика.
+        before (int): UID письма, с которого продолжать догрузку.
+        uid_validity (Optional[int]): UIDVALIDITY папки.
+        node (Optional[str]): Узел, который держит аренду ящика.
+
+    Returns:
+        bool: True, если задача принята.
+    """
+    if settings.SYNC_BACKEND in (EMBEDDED, LEASES):
+        return get_worker().submit(
+            ('backfill', email_id), backfill_messages, email_id, before,
+            uid_validity, node, priority=BACKFILL_PRIORITY,
+        )
+    backfill_messages.delay(email_id, before, uid_validity, node)
+    return True
@@ -0,0 +1,20 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import invalidate_accounts
+from .models import Email, IngestRule, RejectedMessage
+
+
+@receiver((post_save, post_delete), sender=Email)
+def reset_accounts_cache(**kwargs):
+    """Сбрасывает кеш списка почтовых ящиков при его изменении."""
+    invalidate_accounts()
+
+
+@receiver((post_save, post_delete), sender=IngestRule)
+def reset_rejected_messages(instance, **kwargs):
+    """
+    Удаляет отклоненные письма ящика при изменении его правил загрузки,
+    чтобы письма проверялись по новым правилам.
+    """
+    RejectedMessage.objects.filter(email_id=instance.email_id).delete()
@@ -0,0 +1,305 @@
+from collections import Counter
+from datetime import date, datetime, timedelta
+from email.utils import parseaddr
+from typing import Any, Dict, Iterable, List, Tuple
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .constants import MAX_EMAIL_LEGTH, STATS_CHUNK_SIZE
+from .models import DailyStat, Email, MessageData, SenderStat
+
+
+def normalize_sender(email_from: str | None) -> str:
+    """
+    Приводит отправителя к адресу в нижнем регистре.
+
+    Args:
+        email_from (str | None): Отправитель из заголовка From.
+
+    Returns:
+        str: Адрес отправителя или исходная строка, если адрес не найден.
+    """
+    email_from = (email_from or '').strip()
+    address = parseaddr(email_from)[1] or email_from
+    return address.lower()[:MAX_EMAIL_LEGTH]
+
+
+def get_day(receipt_date: date) -> date:
+    """Возвращает день получения письма."""
+    if isinstance(receipt_date, datetime):
+        return receipt_date.date()
+    return receipt_date
+
+
+def count_messages(
+        rows: Iterable[Tuple[int, str | None, date]]
+        ) -> Tuple[Counter, Counter, Dict[Tuple[int, str], date]]:
+    """
+    Считает письма по отправителям и дням.
+
+    Args:
+        rows (Iterable[Tuple]): Кортежи (идентификатор ящика, отправитель,
+          дата получения).
+
+    Returns:
+        tuple: Счетчики по (ящик, отправитель) и (ящик, день) и последняя
+          дата письма для каждой пары (ящик, отправитель).
+    """
+    senders, days, last_dates = Counter(), Counter(), {}
+    for account_id, email_from, receipt_date in rows:
+        sender_key = (account_id, normalize_sender(email_from))
+        day = get_day(receipt_date)
+        senders[sender_key] += 1
+        days[(account_id, day)] += 1
+        if sender_key not in last_dates or day > last_dates[sender_key]:
+            last_dates[sender_key] = day
+    return senders, days, last_dates
+
+
+def get_rows(
+        counts: Counter,
+        last_dates: Dict[Tuple[int, str], date] | None = None
+        ) -> List[List[Any]]:
+    """
+    Возвращает строки счетчиков для массовых запросов.
+
+    Строки отсортированы по ключу, чтобы параллельные транзакции
+    блокировали строки статистики в одном порядке и не ждали друг друга
+    встречно.
+    """
+    adapt = connection.ops.adapt_datefield_value
+    rows = []
+    for key in sorted(counts):
+        account_id, value = key
+        row = [
+            account_id,
+            adapt(value) if isinstance(value, date) else value,
+            counts[key],
+        ]
+        if last_dates is not None:
+            row.append(adapt(last_dates[key]))
+        rows.append(row)
+    return rows
+
+
+def add_counts(
+        model,
+        field: str,
+        counts: Counter,
+        last_dates: Dict[Tuple[int, str], date] | None = None
+        ) -> None:
+    """
+    Прибавляет счетчики в таблице статистики.
+
+    Недостающие строки создаются, а существующие увеличиваются одним
+    запросом INSERT ... ON CONFLICT DO UPDATE на пачку из
+    `STATS_CHUNK_SIZE` ключей. Приращение атомарно, поэтому параллельные
+    записи не теряют друг друга.
+
+    Args:
+        model: Модель статистики (`SenderStat` или `DailyStat`).
+        field (str): Имя поля ключа кроме ящика (sender или day).
+        counts (Counter): Счетчики по (ящик, значение ключа).
+        last_dates (Dict | None): Дата последнего письма по ключу для
+          `SenderStat` или None.
+    """
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    columns = ['created_at', 'email_id', quote(field), 'message_count']
+    updates = [
+        f'message_count = {table}.message_count + EXCLUDED.message_count'
+    ]
+    if last_dates is not None:
+        columns.append('last_receipt_date')
+        # GREATEST в SQLite нет, а max() там возвращает NULL для NULL
+        updates.append(
+            'last_receipt_date = CASE '
+            f'WHEN {table}.last_receipt_date IS NULL '
+            f'OR {table}.last_receipt_date < EXCLUDED.last_receipt_date '
+            'THEN EXCLUDED.last_receipt_date '
+            f'ELSE {table}.last_receipt_date END'
+        )
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    rows = get_rows(counts, last_dates)
+    placeholders = '(' + ', '.join(['%s'] * len(columns)) + ')'
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), STATS_CHUNK_SIZE):
+            chunk = rows[start:start + STATS_CHUNK_SIZE]
+            cursor.execute(
+                f'INSERT INTO {table} ({", ".join(columns)}) VALUES '
+                + ', '.join([placeholders] * len(chunk))
+                + f' ON CONFLICT (email_id, {quote(field)}) DO UPDATE SET '
+                + ', '.join(updates),
+                [value for row in chunk for value in (now, *row)],
+            )
+
+
+def subtract_counts(model, field: str, counts: Counter) -> None:
+    """
+    Вычитает счетчики в таблице статистики.
+
+    Счетчики уменьшаются одним запросом UPDATE ... FROM (VALUES ...)
+    на пачку из `STATS_CHUNK_SIZE` ключей, затем строки, счетчик которых
+    дошел до нуля, удаляются.
+
+    Args:
+        model: Модель статистики (`SenderStat` или `DailyStat`).
+        field (str): Имя поля ключа кроме ящика (sender или day).
+        counts (Counter): Счетчики по (ящик, значение ключа).
+    """
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    rows = get_rows(counts)
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), STATS_CHUNK_SIZE):
+            chunk = rows[start:start + STATS_CHUNK_SIZE]
+            cursor.execute(
+                f'UPDATE {table} SET message_count = CASE '
+                f'WHEN {table}.message_count > counts.column3 '
+                f'THEN {table}.message_count - counts.column3 ELSE 0 END '
+                'FROM (VALUES '
+                + ', '.join(['(%s, %s, %s)'] * len(chunk))
+                + f') AS counts WHERE {table}.email_id = counts.column1 '
+                f'AND {table}.{quote(field)} = counts.column2',
+                [value for row in chunk for value in row],
+            )
+    model.objects.filter(
+        email_id__in={account_id for account_id, _ in counts},
+        message_count=0,
+    ).delete()
+
+
+def update_stats(messages: List['MessageData'], sign: int = 1) -> None:
+    """
+    Обновляет статистику по отправителям и дням для пачки писем.
+
+    Вызывается в транзакции записи писем (или их удаления с sign=-1),
+    так что статистика всегда согласована с таблицей писем. Каждая
+    таблица статистики обновляется одним запросом на пачку ключей.
+
+    Args:
+        messages (List[MessageData]): Сохраненные или удаляемые письма.
+        sign (int): 1 для новых писем, -1 для удаленных.
+    """
+    if not messages:
+        return
+    senders, days, last_dates = count_messages(
+        (message.email_id, message.email_from, message.receipt_date)
+        for message in messages
+    )
+    if sign > 0:
+        add_counts(SenderStat, 'sender', senders, last_dates)
+        add_counts(DailyStat, 'day', days)
+    else:
+        subtract_counts(SenderStat, 'sender', senders)
+        subtract_counts(DailyStat, 'day', days)
+
+
+def rebuild_stats(email_account: 'Email') -> Dict[str, int]:
+    """
+    Пересчитывает статистику почтового ящика по сохраненным письмам.
+
+    Читаются только отправитель и дата получения, без тел писем. Письма
+    читаются в той же транзакции, что и замена статистики, а в PostgreSQL
+    таблицы статистики до чтения блокируются от записи: сохранение и
+    удаление писем, которые обновляют статистику, ждут окончания
+    пересчета, поэтому их изменения не теряются и не учитываются дважды.
+
+    Args:
+        email_account (Email): Почтовый ящик.
+
+    Returns:
+        dict: Количество писем, отправителей и дней.
+    """
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            quote = connection.ops.quote_name
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'LOCK TABLE {quote(SenderStat._meta.db_table)}, '
+                    f'{quote(DailyStat._meta.db_table)} '
+                    'IN SHARE ROW EXCLUSIVE MODE'
+                )
+        rows = MessageData.objects.filter(email=email_account).values_list(
+            'email_id', 'email_from', 'receipt_date'
+        ).iterator(chunk_size=STATS_CHUNK_SIZE)
+        senders, days, last_dates = count_messages(rows)
+        SenderStat.objects.filter(email=email_account).delete()
+        DailyStat.objects.filter(email=email_account).delete()
+        SenderStat.objects.bulk_create(
+            [
+                SenderStat(
+                    email_id=account_id, sender=sender, message_count=count,
+                    last_receipt_date=last_dates[(account_id, sender)],
+                )
+                for (account_id, sender), count in senders.items()
+            ],
+            batch_size=STATS_CHUNK_SIZE,
+        )
+        DailyStat.objects.bulk_create(
+            [
+                DailyStat(email_id=account_id, day=day, message_count=count)
+                for (account_id, day), count in days.items()
+            ],
+            batch_size=STATS_CHUNK_SIZE,
+        )
+    return {
+        'messages': sum(days.values()),
+        'senders': len(senders),
+        'days': len(days),
+    }
+
+
+def get_account_stats(
+        email_account: 'Email',
+        top: int,
+        days: int
+        ) -> Dict[str, Any]:
+    """
+    Возвращает статистику почтового ящика из таблиц статистики.
+
+    Запросы читают не больше `top` строк отправителей и `days` строк
+    дней по индексам, поэтому время ответа не зависит от числа писем.
+
+    Args:
+        email_account (Email): Почтовый ящик.
+        top (int): Сколько самых частых отправителей вернуть.
+        days (int): За сколько последних дней вернуть счетчики.
+
+    Returns:
+        dict: Самые частые отправители и письма по дням (дни без писем
+          заполнены нулями).
+    """
+    today = date.today()
+    start = today - timedelta(days=days - 1)
+    counts = dict(
+        DailyStat.objects.filter(
+            email=email_account, day__gte=start, day__lte=today,
+        ).values_list('day', 'message_count')
+    )
+    daily = [
+        {
+            'day': (start + timedelta(days=offset)).isoformat(),
+            'messages': counts.get(start + timedelta(days=offset), 0),
+        }
+        for offset in range(days)
+    ]
+    top_senders = [
+        {
+            'sender': sender,
+            'messages': count,
+            'last_receipt_date': last_date.isoformat() if last_date else None,
+        }
+        for sender, count, last_date in SenderStat.objects.filter(
+            email=email_account
+        ).order_by('-message_count', 'sender').values_list(
+            'sender', 'message_count', 'last_receipt_date'
+        )[:top]
+    ]
+    return {
+        'email': email_account.email,
+        'top_senders': top_senders,
+        'daily': daily,
+        'period_total': sum(counts.values()),
+    }
@@ -0,0 +1,396 @@
+import re
+from collections import Counter
+from datetime import date, datetime
+from typing import Iterable, List, Tuple
+
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery
+from django.db.models.functions import Greatest
+
+from .constants import (MAX_MESSAGE_ID_LEGTH, MAX_TITLE_LEGTH,
+                        THREAD_REFERENCES_LIMIT)
+from .models import Email, MessageData, MessageThread, ThreadContainer
+
+MESSAGE_ID_RE = re.compile(r'<[^<>\s]+>')
+SUBJECT_PREFIX_RE = re.compile(
+    r'^\s*((re|fwd?|aw|ответ|отв|пересл)\s*(\[\d+\])?\s*:\s*)+',
+    re.IGNORECASE,
+)
+
+
+def parse_references(references: str, in_reply_to: str) -> List[str]:
+    """
+    Возвращает Message-ID предков письма от корня цепочки к родителю.
+
+    Берется заголовок References, а если его нет — первый Message-ID из
+    In-Reply-To. Повторы удаляются, а длинные цепочки обрезаются до
+    последних `THREAD_REFERENCES_LIMIT` ссылок.
+
+    Args:
+        references (str): Значение заголовка References.
+        in_reply_to (str): Значение заголовка In-Reply-To.
+
+    Returns:
+        List[str]: Message-ID предков письма.
+    """
+    ids = MESSAGE_ID_RE.findall(references or '')
+    if not ids:
+        ids = MESSAGE_ID_RE.findall(in_reply_to or '')[:1]
+    ids = [
+        message_id for message_id in dict.fromkeys(ids)
+        if len(message_id) <= MAX_MESSAGE_ID_LEGTH
+    ]
+    return ids[-THREAD_REFERENCES_LIMIT:]
+
+
+def normalize_subject(title: str | None) -> Tuple[str, bool]:
+    """
+    Отделяет от темы письма префиксы ответа и пересылки.
+
+    Args:
+        title (str | None): Тема письма.
+
+    Returns:
+        tuple: Тема без префиксов и признак, были ли префиксы.
+    """
+    title = title or ''
+    subject = SUBJECT_PREFIX_RE.sub('', title).strip()
+    return subject[:MAX_TITLE_LEGTH], subject != title.strip()
+
+
+def get_thread_message_id(email_message: 'MessageData') -> str:
+    """
+    Возвращает Message-ID письма для дерева цепочки.
+
+    Письмам без Message-ID присваивается локальный идентификатор, чтобы
+    они попали в дерево отдельным узлом.
+    """
+    raw = email_message.body.message_id if email_message.body else ''
+    found = MESSAGE_ID_RE.findall(raw or '')
+    if found:
+        return found[0]
+    return f'<local-{email_message.id}@{email_message.email_id}>'
+
+
+def absorb_thread(
+        thread: 'MessageThread',
+        other: 'MessageThread'
+        ) -> None:
+    """Переносит счетчики цепочки `other` в цепочку `thread`."""
+    thread.message_count += other.message_count
+    if other.last_receipt_date and (
+            not thread.last_receipt_date
+            or other.last_receipt_date > thread.last_receipt_date):
+        thread.last_receipt_date = other.last_receipt_date
+        thread.last_message_id = other.last_message_id
+
+
+def lock_threads(account_ids: Iterable[int]) -> None:
+    """
+    Блокирует цепочки почтовых ящиков до конца транзакции.
+
+    Цепочки ящика меняют сохранение писем, их удаление и перестроение;
+    блокировка строк ящиков выполняет эти изменения по очереди. Режим
+    FOR NO KEY UPDATE не мешает вставке писем, ссылающихся на ящик.
+    В SQLite транзакции записи и так выполняются по очереди.
+
+    Args:
+        account_ids (Iterable[int]): Идентификаторы почтовых ящиков.
+    """
+    list(Email.objects.select_for_update(no_key=True).filter(
+        id__in=set(account_ids)
+    ).order_by('id').values_list('id', flat=True))
+
+
+def assign_threads(
+        messages: List['MessageData']
+        ) -> List['MessageThread']:
+    """
+    Добавляет пачку писем в цепочки по алгоритму JWZ.
+
+    По Message-ID письма и его предков (References/In-Reply-To) находятся
+    уже известные узлы дерева. Если они принадлежат разным цепочкам,
+    цепочки объединяются: остается самая большая, к ней переносятся узлы
+    и счетчики остальных. Недостающие предки добавляются пустыми узлами,
+    каждый предок связывается с предыдущим, а письмо — с последним.
+    Ответ без ссылок на предков (тема с Re:/Fwd:) присоединяется к
+    последней цепочке ящика с той же темой. Повторная копия письма
+    с уже известным Message-ID в цепочку не добавляется. Счетчики
+    цепочек обновляются сразу, поэтому список цепочек не требует
+    пересчета.
+
+    Узлы и цепочки всей пачки читаются несколькими запросами, письма
+    разбираются в памяти по порядку, а изменения записываются массовыми
+    вставками и обновлениями, поэтому число запросов не зависит от
+    размера пачки.
+
+    Должна вызываться в той же транзакции, что и сохранение писем:
+    цепочки ящиков пачки блокируются до ее конца (`lock_threads`).
+
+    Args:
+        messages (List[MessageData]): Сохраненные письма с подгруженными
+          телами.
+
+    Returns:
+        List[MessageThread]: Цепочки писем в порядке писем.
+    """
+    entries, keys, account_ids, reply_subjects = [], set(), set(), set()
+    for email_message in messages:
+        message_id = get_thread_message_id(email_message)
+        references = [
+            reference for reference in parse_references(
+                email_message.references, email_message.in_reply_to
+            )
+            if reference != message_id
+        ]
+        subject, is_reply = normalize_subject(email_message.title)
+        entries.append(
+            (email_message, message_id, references, subject, is_reply)
+        )
+        keys.update((*references, message_id))
+        account_ids.add(email_message.email_id)
+        if not references and is_reply and subject:
+            reply_subjects.add(subject)
+    if not entries:
+        return []
+    lock_threads(account_ids)
+
+    containers = {
+        (container.email_id, container.message_id): container
+        for container in ThreadContainer.objects.filter(
+            email_id__in=account_ids, message_id__in=keys
+        )
+    }
+    threads = MessageThread.objects.in_bulk(
+        {container.thread_id for container in containers.values()}
+    )
+    # Цепочки по теме для ответов без ссылок на предков
+    by_subject = {}
+    if reply_subjects:
+        for thread in MessageThread.objects.filter(
+                email_id__in=account_ids, subject__in=reply_subjects):
+            thread = threads.setdefault(thread.id, thread)
+            by_subject.setdefault(
+                (thread.email_id, thread.subject), []
+            ).append(thread)
+    for container in containers.values():
+        container.thread = threads[container.thread_id]
+
+    # Объединенные цепочки: id(цепочки) -> цепочка, в которую она вошла
+    merged = {}
+
+    new_threads, new_containers, result = [], [], []
+    changed, touched, created = {}, {}, {}
+
+    def find(thread):
+        while id(thread) in merged:
+            thread = merged[id(thread)]
+        return thread
+
+    def order(thread):
+        # Порядок создания: новые цепочки пачки идут после сохраненных
+        return thread.id is None, thread.id or 0, created.get(id(thread), 0)
+    for email_message, message_id, references, subject, is_reply in entries:
+        account_id = email_message.email_id
+        own = containers.get((account_id, message_id))
+        if own and own.email_message_id:
+            result.append(own.thread)
+            continue
+
+        found = {}
+        for key in (*references, message_id):
+            if (account_id, key) in containers:
+                thread = find(containers[(account_id, key)].thread)
+                found[id(thread)] = thread
+        candidates = sorted(found.values(), key=lambda thread: (
+            -thread.message_count, order(thread),
+        ))
+        if not candidates and not references and is_reply and subject:
+            candidates = sorted((
+                thread for thread in by_subject.get((account_id, subject), ())
+                if id(thread) not in merged
+            ), key=lambda thread: (
+                thread.last_receipt_date or date.min, order(thread),
+            ))[-1:]
+        if candidates:
+            thread = candidates[0]
+            for other in candidates[1:]:
+                absorb_thread(thread, other)
+                merged[id(other)] = thread
+        else:
+            thread = MessageThread(email_id=account_id)
+            created[id(thread)] = len(new_threads)
+            new_threads.append(thread)
+
+        parent = ''
+        for reference in references:
+            container = containers.get((account_id, reference))
+            if container is None:
+                container = ThreadContainer(
+                    email_id=account_id, thread=thread,
+                    message_id=reference, parent_message_id=parent,
+                )
+                containers[(account_id, reference)] = container
+                new_containers.append(container)
+            elif parent and not container.parent_message_id:
+                container.parent_message_id = parent
+                changed[id(container)] = container
+            parent = reference
+        if own:
+            own.email_message = email_message
+            own.parent_message_id = parent or own.parent_message_id
+            own.thread = thread
+            changed[id(own)] = own
+        else:
+            own = ThreadContainer(
+                email_id=account_id, thread=thread, message_id=message_id,
+                parent_message_id=parent, email_message=email_message,
+            )
+            containers[(account_id, message_id)] = own
+            new_containers.append(own)
+
+        receipt_date = email_message.receipt_date
+        if isinstance(receipt_date, datetime):
+            receipt_date = receipt_date.date()
+        thread.message_count += 1
+        if not thread.subject and subject:
+            thread.subject = subject
+            by_subject.setdefault((account_id, subject), []).append(thread)
+        if (not thread.last_receipt_date
+                or receipt_date >= thread.last_receipt_date):
+            thread.last_receipt_date = receipt_date
+            thread.last_message = email_message
+        touched[id(thread)] = thread
+        result.append(thread)
+
+    updated = [
+        thread for thread in touched.values()
+        if thread.pk and id(thread) not in merged
+    ]
+    changed = [container for container in changed.values() if container.pk]
+    MessageThread.objects.bulk_create([
+        thread for thread in new_threads if id(thread) not in merged
+    ])
+    absorbed = {}
+    for thread in threads.values():
+        if id(thread) in merged:
+            target = find(thread)
+            absorbed.setdefault(id(target), (target, []))[1].append(
+                thread.id
+            )
+    for target, thread_ids in absorbed.values():
+        ThreadContainer.objects.filter(thread_id__in=thread_ids).update(
+            thread=target
+        )
+    if absorbed:
+        MessageThread.objects.filter(id__in=[
+            thread_id for _, thread_ids in absorbed.values()
+            for thread_id in thread_ids
+        ]).delete()
+    for container in (*new_containers, *changed):
+        container.thread = find(container.thread)
+    ThreadContainer.objects.bulk_create(new_containers)
+    ThreadContainer.objects.bulk_update(
+        changed, ('email_message', 'parent_message_id', 'thread'),
+    )
+    MessageThread.objects.bulk_update(
+        updated,
+        ('subject', 'message_count', 'last_receipt_date', 'last_message'),
+    )
+    return [find(thread) for thread in result]
+
+
+def assign_thread(email_message: 'MessageData') -> 'MessageThread':
+    """
+    Добавляет письмо в цепочку, см. `assign_threads`.
+
+    Должна вызываться в той же транзакции, что и сохранение письма.
+
+    Args:
+        email_message (MessageData): Сохраненное письмо с подгруженным
+          телом.
+
+    Returns:
+        MessageThread: Цепочка письма.
+    """
+    return assign_threads([email_message])[0]
+
+
+def release_threads(messages: List['MessageData']) -> None:
+    """
+    Убирает удаляемые письма из цепочек.
+
+    Узлы писем остаются в дереве пустыми, счетчики цепочек уменьшаются,
+    цепочки без писем удаляются, а цепочкам, последнее письмо которых
+    удаляется, последнее письмо выбирается заново. Ссылки на письма
+    не создают внешних ключей, поэтому без этого они остались бы
+    висящими после удаления секции целиком.
+
+    Должна вызываться в той же транзакции, что и удаление писем, пока
+    строки писем еще существуют.
+
+    Args:
+        messages (List[MessageData]): Удаляемые письма.
+    """
+    message_ids = [message.id for message in messages]
+    lock_threads(message.email_id for message in messages)
+    containers = ThreadContainer.objects.filter(
+        email_message_id__in=message_ids
+    )
+    removed = Counter(containers.values_list('thread_id', flat=True))
+    if not removed:
+        return
+    containers.update(email_message=None)
+    by_count = {}
+    for thread_id, count in removed.items():
+        by_count.setdefault(count, []).append(thread_id)
+    for count, thread_ids in by_count.items():
+        MessageThread.objects.filter(id__in=thread_ids).update(
+            message_count=Greatest(F('message_count') - count, 0)
+        )
+    threads = MessageThread.objects.filter(id__in=list(removed))
+    threads.filter(message_count=0).delete()
+    latest = ThreadContainer.objects.filter(
+        thread=OuterRef('pk'), email_message__isnull=False
+    ).order_by('-email_message__receipt_date', '-email_message_id')
+    threads.filter(last_message_id__in=message_ids).update(
+        last_message_id=Subquery(latest.values('email_message_id')[:1]),
+        last_receipt_date=Subquery(
+            latest.values('email_message__receipt_date')[:1]
+        ),
+    )
+
+
+def rebuild_threads(email_account: 'Email', batch_size: int = 1000) -> int:
+    """
+    Перестраивает цепочки почтового ящика по сохраненным письмам.
+
+    Нужна для писем, сохраненных до появления цепочек, и после удаления
+    писем в обход срока хранения (например, в админке): тогда счетчики
+    цепочек не уменьшаются. Старые цепочки удаляются и строятся заново
+    в одной транзакции с блокировкой цепочек ящика (`lock_threads`):
+    сохранение писем ящика ждет окончания перестроения, а при ошибке
+    остаются прежние цепочки. Письма читаются пачками по возрастанию
+    идентификатора.
+
+    Args:
+        email_account (Email): Почтовый ящик.
+        batch_size (int): Размер пачки.
+
+    Returns:
+        int: Количество обработанных писем.
+    """
+    messages = MessageData.objects.filter(
+        email=email_account
+    ).select_related('body').order_by('id')
+    last_id, total = 0, 0
+    with transaction.atomic():
+        lock_threads([email_account.id])
+        MessageThread.objects.filter(email=email_account).delete()
+        while True:
+            batch = list(messages.filter(id__gt=last_id)[:batch_size])
+            if not batch:
+                return total
+            assign_threads(batch)
+            total += len(batch)
+            last_id = batch[-1].id
@@ -15,4 +15,44 @@ urlpatterns = [
         views.get_emails,
         name='get_data'
     ),
+    path(
+        'threads/<str:email>/',
+        views.get_threads,
+        name='threads'
+    ),
+    path(
+        'stats/<str:email>/',
+        views.get_stats,
+        name='stats'
+    ),
+    path(
+        'onboard/',
+        views.onboard_emails,
+        name='onboard'
+    ),
+    path(
+        'async/add-mail/',
+        views.add_mail_async,
+        name='add_mail_async'
+    ),
+    path(
+        'async/get-data/<str:email>/',
+        views.get_emails_async,
+        name='get_data_async'
+    ),
+    path(
+        'sync-status/',
+        views.sync_status,
+        name='sync_status'
+    ),
+    path(
+        'sync-runs/',
+        views.sync_runs,
+        name='sync_runs'
+    ),
+    path(
+        'export/<str:email>/<str:export_format>/',
+        views.export_emails,
+        name='export_data'
+    ),
 ]
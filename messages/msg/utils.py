@@ -1,3 +1,4 @@
+import hashlib
 from pathlib import Path
 from typing import TYPE_CHECKING
 
@@ -57,3 +58,19 @@ def mail_directory_path(instance: "MessageFile", file_name: str) -> Path:
     email_name_list = instance.message.email.email.split('@')
     mail_name = email_name_list[0] + '-' + email_name_list[-1]
     return Path(f"{mail_name}/{file_name}")
+
+
+def get_content_hash(text: str | None) -> str:
+    """
+    Вычисляет хеш содержимого письма.
+
+    Используется вместе с Message-ID для поиска уже сохраненного
+    тела письма при получении копии на другой ящик.
+
+    Args:
+        text (str | None): Текст письма.
+
+    Returns:
+        str: Хеш SHA-256 в шестнадцатеричном виде.
+    """
+    return hashlib.sha256((text or '').encode('utf-8')).hexdigest()
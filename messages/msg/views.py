@@ -1,18 +1,37 @@
-from threading import Thread
+from asgiref.sync import sync_to_async
 
-from django.shortcuts import get_object_or_404, render
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.core.paginator import Paginator
+from django.db.models import Max
+from django.http import (Http404, HttpResponse, JsonResponse,
+                         StreamingHttpResponse)
+from django.shortcuts import (aget_object_or_404, get_object_or_404,
+                              redirect, render)
+from django.template.loader import render_to_string
 from django.urls import reverse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django.views.decorators.http import require_POST
 from django.views.generic import CreateView
 
+from .cache import (aget_accounts, aget_list_page, aget_list_version,
+                    aset_list_page, get_accounts, get_list_etag,
+                    get_list_page, get_list_version, set_list_page)
+from .constants import (ONBOARD_MAX_ACCOUNTS, SLOW_RUNS_LIMIT, STATS_DAYS,
+                        STATS_MAX_DAYS, STATS_MAX_TOP_SENDERS,
+                        STATS_TOP_SENDERS, SYNC_STATS_DAYS,
+                        THREADS_PAGE_SIZE)
+from .exporters import (EXPORT_FORMATS, aiterate_export,
+                        get_export_queryset)
 from .forms import EmailForm
-from .models import Email, MessageData
-from .services import get_data_and_send_to_ws
-
-
-def async_process_emails_in_background(email_account):
-    thread = Thread(target=get_data_and_send_to_ws, args=(email_account,))
-    thread.daemon = True
-    thread.start()
+from .models import Email, MessageData, MessageThread, SyncRun
+from .onboarding import CSV, JSON, onboard_accounts, parse_accounts
+from .routers import require_fresh
+from .runs import get_throughput_trends
+from .services import schedule_sync
+from .stats import get_account_stats
+from .workers import get_sync_stats
 
 
 class AddMailCreateView(CreateView):
@@ -27,20 +46,266 @@ class AddMailCreateView(CreateView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['email_accounts'] = Email.objects.all()
+        context['email_accounts'] = get_accounts(Email.objects.all())
         return context
 
 
+def build_list_page(request, account, version=None) -> str:
+    """
+    Строит страницу списка писем почтового ящика.
+
+    Если передана версия списка, страница строится по реплике, только
+    если реплика уже содержит данные этой версии.
+    """
+    if version is not None:
+        require_fresh(version)
+    messages = MessageData.objects.filter(
+        email=account
+    ).select_related('body').order_by('-receipt_date')
+    last_message_id = MessageData.objects.filter(
+        email=account
+    ).aggregate(last_id=Max('id'))['last_id']
+    context = {
+        'mail_to': account.email,
+        'messages': messages,
+        'last_message_id': last_message_id or 0,
+    }
+    return render_to_string('msg/get_data.html', context, request)
+
+
 def get_emails(request, email):
-    """Функция представления списка писем."""
-    template = 'msg/get_data.html'
+    """
+    Функция представления списка писем.
+
+    Отрисованная страница кешируется по версии списка писем ящика, которая
+    меняется при записи новых писем. Версия же служит для ETag и
+    Last-Modified, поэтому повторный запрос без изменений получает 304.
+    Страница строится по реплике, только если реплика уже содержит
+    данные этой версии. Без общего кеша (`LIST_CACHE`) страница строится
+    при каждом запросе.
+    """
     account = get_object_or_404(Email, email=email)
-    messages = MessageData.objects.filter(
+    schedule_sync(account.id)
+    if not settings.LIST_CACHE:
+        return HttpResponse(build_list_page(request, account))
+
+    version = get_list_version(account.id)
+    etag = get_list_etag(account.id, version)
+    response = get_conditional_response(
+        request, etag=etag, last_modified=int(version),
+    )
+    if response is None:
+        content = get_list_page(account.id, version)
+        if content is None:
+            content = build_list_page(request, account, version)
+            set_list_page(account.id, version, content)
+        response = HttpResponse(content)
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(version)
+    return response
+
+
+def get_threads(request, email):
+    """
+    Функция представления списка цепочек писем.
+
+    Читает только готовые строки цепочек, которые поддерживаются при
+    сохранении писем, с постраничным выводом.
+    """
+    account = get_object_or_404(Email, email=email)
+    threads = MessageThread.objects.filter(
         email=account
-    ).order_by('-receipt_date')
+    ).select_related('last_message').order_by('-last_receipt_date', '-id')
+    page_obj = Paginator(threads, THREADS_PAGE_SIZE).get_page(
+        request.GET.get('page')
+    )
     context = {
         'mail_to': email,
-        'messages': messages
+        'page_obj': page_obj,
+    }
+    return render(request, 'msg/threads.html', context)
+
+
+def export_emails(request, email, export_format):
+    """
+    Функция представления потоковой выгрузки писем почтового ящика.
+
+    Формат задается в адресе (ndjson, csv, mbox), параметр `files=1`
+    добавляет вложения. Под ASGI выгрузка отдается асинхронным
+    итератором, который читает письма пачками.
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise Http404('Неизвестный формат выгрузки')
+    account = get_object_or_404(Email, email=email)
+    with_files = request.GET.get('files') == '1'
+    exporter, content_type, extension = EXPORT_FORMATS[export_format]
+    content = exporter(get_export_queryset(account, with_files), with_files)
+    if isinstance(request, ASGIRequest):
+        content = aiterate_export(content)
+    response = StreamingHttpResponse(content, content_type=content_type)
+    response['Content-Disposition'] = (
+        f'attachment; filename="{account.email}.{extension}"'
+    )
+    return response
+
+
+async def enqueue_sync(email_id: int) -> None:
+    """
+    Ставит задачу получения писем в очередь, не блокируя цикл событий.
+
+    Обращение к брокеру Celery синхронное, поэтому выполняется в
+    отдельном потоке, не привязанном к потоку синхронных представлений.
+    """
+    await sync_to_async(schedule_sync, thread_sensitive=False)(email_id)
+
+
+async def add_mail_async(request):
+    """
+    Асинхронная функция представления для добавления почты.
+
+    Аналог `AddMailCreateView` для ASGI.
+    """
+    template = 'msg/add_mail.html'
+    form = EmailForm(request.POST or None)
+    if request.method == 'POST':
+        if await sync_to_async(form.is_valid)():
+            await sync_to_async(form.save)()
+            return redirect('msg:add_mail_async')
+    context = {
+        'form': form,
+        'email_accounts': await aget_accounts(Email.objects.all()),
     }
-    get_data_and_send_to_ws.delay(account.id)
     return render(request, template, context)
+
+
+async def abuild_list_page(request, account, version=None) -> str:
+    """
+    Асинхронный вариант `build_list_page`.
+
+    Письма читаются асинхронно, а шаблон рендерится в синхронном потоке:
+    для сжатых текстов может понадобиться запрос словаря к базе данных.
+    """
+    if version is not None:
+        require_fresh(version)
+    queryset = MessageData.objects.filter(email=account)
+    messages = [
+        message async for message in queryset.select_related(
+            'body'
+        ).order_by('-receipt_date')
+    ]
+    last_message_id = (
+        await queryset.aaggregate(last_id=Max('id'))
+    )['last_id']
+    context = {
+        'mail_to': account.email,
+        'messages': messages,
+        'last_message_id': last_message_id or 0,
+    }
+    return await sync_to_async(render_to_string)(
+        'msg/get_data.html', context, request
+    )
+
+
+async def get_emails_async(request, email):
+    """
+    Асинхронная функция представления списка писем.
+
+    Аналог `get_emails` для ASGI: запросы к базе данных выполняются
+    асинхронным ORM, постановка задачи в очередь не блокирует цикл событий.
+    """
+    account = await aget_object_or_404(Email, email=email)
+    await enqueue_sync(account.id)
+    if not settings.LIST_CACHE:
+        return HttpResponse(await abuild_list_page(request, account))
+
+    version = await aget_list_version(account.id)
+    etag = get_list_etag(account.id, version)
+    response = get_conditional_response(
+        request, etag=etag, last_modified=int(version),
+    )
+    if response is None:
+        content = await aget_list_page(account.id, version)
+        if content is None:
+            content = await abuild_list_page(request, account, version)
+            await aset_list_page(account.id, version, content)
+        response = HttpResponse(content)
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(version)
+    return response
+
+
+def sync_status(request):
+    """Функция представления состояния очереди синхронизации почты."""
+    return JsonResponse(get_sync_stats())
+
+
+def sync_runs(request):
+    """
+    Функция представления истории синхронизации.
+
+    Возвращает скорость синхронизации по дням для каждого ящика и
+    провайдера за `days` дней и последние запуски, которые оказались
+    намного медленнее скользящей базы своего ящика.
+    """
+    days = request.GET.get('days', '')
+    days = int(days) if days.isdigit() else SYNC_STATS_DAYS
+    trends = get_throughput_trends(days)
+    trends['slow_runs'] = list(
+        SyncRun.objects.filter(is_slow=True).values(
+            'id', 'email__email', 'kind', 'started_at', 'duration',
+            'messages_new', 'throughput', 'baseline', 'stages',
+        )[:SLOW_RUNS_LIMIT]
+    )
+    return JsonResponse(trends)
+
+
+def get_stats(request, email):
+    """
+    Функция представления статистики почтового ящика.
+
+    Отвечает из таблиц статистики: самые частые отправители (`top`) и
+    письма по дням за последние `days` дней.
+    """
+    account = get_object_or_404(Email, email=email)
+    top = request.GET.get('top', '')
+    days = request.GET.get('days', '')
+    top = int(top) if top.isdigit() else STATS_TOP_SENDERS
+    days = int(days) if days.isdigit() else STATS_DAYS
+    return JsonResponse(get_account_stats(
+        account, max(min(top, STATS_MAX_TOP_SENDERS), 1),
+        max(min(days, STATS_MAX_DAYS), 1),
+    ))
+
+
+@require_POST
+async def onboard_emails(request):
+    """
+    Асинхронная функция представления массового добавления почты.
+
+    Доступна только сотрудникам: иначе по результату проверки входа
+    можно подбирать пароли. Принимает список ящиков в JSON или, с типом
+    содержимого text/csv, в CSV, не больше `ONBOARD_MAX_ACCOUNTS`.
+    Проверяет домены и вход по IMAP в отдельном потоке, не занимая
+    поток синхронных представлений, сохраняет ящики одной транзакцией
+    и возвращает результат по каждому ящику. С параметром `dry_run=1`
+    ящики только проверяются. Большие списки добавляются командой
+    `onboard_accounts`.
+    """
+    user = await request.auser()
+    if not user.is_staff:
+        return JsonResponse({'error': 'Доступ запрещен'}, status=403)
+    data_format = CSV if request.content_type == 'text/csv' else JSON
+    try:
+        accounts = parse_accounts(
+            request.body.decode(request.encoding or 'utf-8'), data_format
+        )
+    except ValueError as err:
+        return JsonResponse({'error': str(err)}, status=400)
+    if len(accounts) > ONBOARD_MAX_ACCOUNTS:
+        return JsonResponse({
+            'error': f'Не больше {ONBOARD_MAX_ACCOUNTS} ящиков за запрос'
+        }, status=400)
+    results = await sync_to_async(onboard_accounts, thread_sensitive=False)(
+        accounts, save=request.GET.get('dry_run') != '1'
+    )
+    return JsonResponse({'results': results})
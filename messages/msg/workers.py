@@ -0,0 +1,220 @@
+import atexit
+import itertools
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from django.conf import settings
+from django.db import connection
+
+from .leases import get_lease_stats
+
+EMBEDDED = 'embedded'
+LEASES = 'leases'
+INTERACTIVE_PRIORITY = 0
+BACKFILL_PRIORITY = 10
+SHUTDOWN_PRIORITY = 100
+
+
+class EmbeddedWorker:
+    """
+    Встроенный обработчик синхронизации почты без брокера Celery.
+
+    Ограниченный пул потоков с приоритетной очередью фиксированного
+    размера: задачи с меньшим приоритетом (интерактивная синхронизация)
+    выбираются раньше фоновой догрузки, задачи сверх емкости отклоняются,
+    повторная постановка задачи с ключом, который уже ждет в очереди,
+    игнорируется. Задача с ключом, который сейчас выполняется, не идет
+    параллельно, а откладывается и ставится в очередь после завершения
+    текущей (из нескольких отложенных остается последняя). При остановке
+    процесса очередь дорабатывается с ограничением по времени.
+    """
+
+    def __init__(self, threads: int, queue_size: int):
+        self.queue = queue.PriorityQueue(maxsize=queue_size)
+        self.capacity = queue_size
+        self.lock = threading.Lock()
+        self.counter = itertools.count()
+        self.queued_keys = set()
+        self.active_keys = set()
+        self.pending = {}
+        self.accepting = True
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.threads = [
+            threading.Thread(
+                target=self.run, name=f'embedded-worker-{number}',
+                daemon=True,
+            )
+            for number in range(threads)
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def submit(
+            self,
+            key: Hashable,
+            func: Callable[..., Any],
+            *args: Any,
+            priority: int = INTERACTIVE_PRIORITY
+            ) -> bool:
+        """
+        Ставит задачу в очередь.
+
+        Args:
+            key (Hashable): Ключ задачи для отбрасывания повторов, например
+              ('sync', идентификатор ящика).
+            func (Callable): Выполняемая функция.
+            *args (Any): Аргументы функции.
+            priority (int): Приоритет, меньшее значение выполняется раньше.
+
+        Returns:
+            bool: True, если задача в очереди (в том числе уже стояла в ней)
+              или отложена до завершения задачи с тем же ключом, False,
+              если очередь заполнена или обработчик остановлен.
+        """
+        with self.lock:
+            if not self.accepting:
+                self.rejected += 1
+                return False
+            if key in self.queued_keys:
+                return True
+            if key in self.active_keys:
+                self.pending[key] = (priority, func, args)
+                return True
+            return self.enqueue(key, func, args, priority)
+
+    def enqueue(
+            self,
+            key: Hashable,
+            func: Callable[..., Any],
+            args: tuple,
+            priority: int
+            ) -> bool:
+        """Кладет задачу в очередь; вызывается под блокировкой."""
+        try:
+            self.queue.put_nowait(
+                (priority, next(self.counter), key, func, args)
+            )
+        except queue.Full:
+            self.rejected += 1
+            return False
+        self.queued_keys.add(key)
+        return True
+
+    def run(self) -> None:
+        """Цикл потока: выполняет задачи из очереди до сигнала остановки."""
+        while True:
+            _, _, key, func, args = self.queue.get()
+            if func is None:
+                self.queue.task_done()
+                return
+            with self.lock:
+                self.queued_keys.discard(key)
+                self.active_keys.add(key)
+                self.running += 1
+            failed = False
+            try:
+                func(*args)
+            except Exception as err:
+                failed = True
+                print(f'Ошибка выполнения задачи {key}: {err}')
+            finally:
+                connection.close()
+                with self.lock:
+                    self.active_keys.discard(key)
+                    self.running -= 1
+                    self.completed += 1
+                    if failed:
+                        self.failed += 1
+                    if key in self.pending:
+                        # Отложенная задача уже принята, поэтому
+                        # выполняется и при остановке, до ее сигнала
+                        priority, func, args = self.pending.pop(key)
+                        self.enqueue(key, func, args, priority)
+                self.queue.task_done()
+
+    def shutdown(self, timeout: Optional[float] = None) -> None:
+        """
+        Останавливает прием задач и дожидается обработки очереди.
+
+        Args:
+            timeout (Optional[float]): Максимальное время ожидания, с.
+        """
+        with self.lock:
+            if not self.accepting:
+                return
+            self.accepting = False
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for _ in self.threads:
+            remaining = (
+                None if deadline is None
+                else max(deadline - time.monotonic(), 0)
+            )
+            try:
+                self.queue.put(
+                    (SHUTDOWN_PRIORITY, next(self.counter), None, None, ()),
+                    timeout=remaining,
+                )
+            except queue.Full:
+                break
+        for thread in self.threads:
+            thread.join(
+                None if deadline is None
+                else max(deadline - time.monotonic(), 0)
+            )
+
+    def busy_keys(self) -> set:
+        """Возвращает ключи задач, которые ждут в очереди или выполняются."""
+        with self.lock:
+            return self.queued_keys | self.active_keys
+
+    def stats(self) -> Dict[str, Any]:
+        """Возвращает состояние очереди и счетчики задач."""
+        with self.lock:
+            return {
+                'backend': EMBEDDED,
+                'threads': len(self.threads),
+                'capacity': self.capacity,
+                'queued': len(self.queued_keys),
+                'pending': len(self.pending),
+                'running': self.running,
+                'completed': self.completed,
+                'failed': self.failed,
+                'rejected': self.rejected,
+                'accepting': self.accepting,
+            }
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def get_worker() -> EmbeddedWorker:
+    """
+    Возвращает встроенный обработчик процесса, создавая его при первом
+    обращении.
+    """
+    global _worker
+    with _worker_lock:
+        if _worker is None:
+            _worker = EmbeddedWorker(
+                settings.EMBEDDED_WORKER_THREADS,
+                settings.EMBEDDED_WORKER_QUEUE_SIZE,
+            )
+            atexit.register(
+                _worker.shutdown, settings.EMBEDDED_WORKER_SHUTDOWN_TIMEOUT
+            )
+        return _worker
+
+
+def get_sync_stats() -> Dict[str, Any]:
+    """Возвращает состояние очереди синхронизации."""
+    if settings.SYNC_BACKEND == EMBEDDED:
+        return get_worker().stats()
+    if settings.SYNC_BACKEND == LEASES:
+        return get_lease_stats()
+    return {'backend': settings.SYNC_BACKEND}
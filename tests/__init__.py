@@ -0,0 +1,10 @@
+import os
+import sys
+from pathlib import Path
+
+import django
+
+# Приложение msg лежит в каталоге проекта Django
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'messages'))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'messages.settings')
+django.setup()
@@ -0,0 +1,19 @@
+import pytest
+from django.test.utils import (setup_databases, setup_test_environment,
+                               teardown_databases, teardown_test_environment)
+
+
+@pytest.fixture(scope='session', autouse=True)
+def django_test_databases():
+    """
+    Тестовые базы данных для запуска через pytest.
+
+    `manage.py test` создает их сам; здесь то же делается один раз
+    на весь запуск, а тесты `django.test.TestCase` откатывают свои
+    изменения.
+    """
+    setup_test_environment()
+    old_config = setup_databases(verbosity=0, interactive=False)
+    yield
+    teardown_databases(old_config, verbosity=0)
+    teardown_test_environment()
@@ -0,0 +1,55 @@
+from django.test import TestCase, override_settings
+
+from msg.leases import clear_preemption, is_preempted, request_preemption
+from msg.models import Email
+from msg.services import select_messages, sync_mail_batch
+
+
+class PreemptionTest(TestCase):
+
+    def setUp(self):
+        self.account = Email.objects.create(
+            email='backfill@yandex.ru', password='secret', provider='YANDEX',
+        )
+
+    def test_request_and_clear(self):
+        self.assertFalse(is_preempted(self.account.id))
+        request_preemption(self.account.id)
+        self.assertTrue(is_preempted(self.account.id))
+        clear_preemption(self.account.id)
+        self.assertFalse(is_preempted(self.account.id))
+
+    @override_settings(SYNC_PREEMPT_TIMEOUT=0)
+    def test_flag_expires(self):
+        request_preemption(self.account.id)
+        self.assertFalse(is_preempted(self.account.id))
+
+    def test_preempted_batch_stops_before_fetching(self):
+        request_preemption(self.account.id)
+        # Подключение не нужно: пачка прерывается до загрузки письма
+        stopped = sync_mail_batch(
+            self.account, None, [b'7', b'5'], preemptible=True,
+        )
+        self.assertEqual(stopped, b'7')
+
+
+class SelectMessagesTest(TestCase):
+
+    def setUp(self):
+        self.account = Email.objects.create(
+            email='cursor@yandex.ru', password='secret', provider='YANDEX',
+        )
+
+    def test_newest_first_with_cursor(self):
+        batch, cursor = select_messages(
+            self.account, None, [b'1', b'3', b'8', b'10'], [], 2, 1, None,
+        )
+        self.assertEqual(batch, [b'10', b'8'])
+        self.assertEqual(cursor, b'8')
+
+    def test_last_batch_has_no_cursor(self):
+        batch, cursor = select_messages(
+            self.account, None, [b'1', b'3'], [], 2, 1, None,
+        )
+        self.assertEqual(batch, [b'3', b'1'])
+        self.assertIsNone(cursor)
@@ -0,0 +1,82 @@
+from itertools import count
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from msg.cache import (
+    get_accounts, get_list_page, get_list_version, invalidate_account_list,
+    invalidate_all_lists, set_list_page,
+)
+from msg.models import Email
+from msg.services import save_data_in_db
+
+from .test_services import make_data_msg
+
+
+class ListVersionTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        clock = count(1000)
+        patcher = mock.patch(
+            'msg.cache.time.time', side_effect=lambda: float(next(clock)),
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.account = Email.objects.create(
+            email='cache@yandex.ru', password='secret', provider='YANDEX',
+        )
+        self.other = Email.objects.create(
+            email='other@yandex.ru', password='secret', provider='YANDEX',
+        )
+
+    def test_version_is_stable_until_invalidated(self):
+        version = get_list_version(self.account.id)
+        self.assertEqual(get_list_version(self.account.id), version)
+
+        invalidate_account_list(self.account.id)
+        self.assertGreater(get_list_version(self.account.id), version)
+
+    def test_invalidation_is_per_account(self):
+        other_version = get_list_version(self.other.id)
+        invalidate_account_list(self.account.id)
+        self.assertEqual(get_list_version(self.other.id), other_version)
+
+    def test_invalidate_all_lists(self):
+        versions = [get_list_version(self.account.id),
+                    get_list_version(self.other.id)]
+        invalidate_all_lists()
+        self.assertGreater(get_list_version(self.account.id), versions[0])
+        self.assertGreater(get_list_version(self.other.id), versions[1])
+
+    def test_page_of_old_version_is_not_used(self):
+        version = get_list_version(self.account.id)
+        set_list_page(self.account.id, version, '<p>old</p>')
+        self.assertEqual(
+            get_list_page(self.account.id, version), '<p>old</p>',
+        )
+
+        invalidate_account_list(self.account.id)
+        self.assertIsNone(
+            get_list_page(self.account.id, get_list_version(self.account.id))
+        )
+
+    def test_saved_message_invalidates_list_on_commit(self):
+        version = get_list_version(self.account.id)
+        other_version = get_list_version(self.other.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            save_data_in_db(make_data_msg(self.account, '1'), [])
+        self.assertGreater(get_list_version(self.account.id), version)
+        self.assertEqual(get_list_version(self.other.id), other_version)
+
+    @override_settings(LIST_CACHE=True)
+    def test_accounts_refresh_after_new_account(self):
+        accounts = get_accounts(Email.objects.order_by('id'))
+        self.assertEqual(len(accounts), 2)
+
+        Email.objects.create(
+            email='new@yandex.ru', password='secret', provider='YANDEX',
+        )
+        accounts = get_accounts(Email.objects.order_by('id'))
+        self.assertEqual(accounts[-1]['email'], 'new@yandex.ru')
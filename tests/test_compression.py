@@ -0,0 +1,86 @@
+from unittest import TestCase, skipIf
+
+from django.test import TestCase as DatabaseTestCase, override_settings
+
+from msg.bodies import recompress_account
+from msg.compression import (compress, decompress, train_dictionary,
+                             zstandard)
+from msg.constants import ZLIB, ZSTD
+from msg.models import CompressionDictionary, Email, MessageBody
+from msg.services import save_data_in_db
+
+from .test_services import make_data_msg
+
+
+def make_text(number):
+    """Шаблонное письмо рассылки."""
+    return (
+        'Здравствуйте!\n'
+        f'Ваш заказ №{number} передан в доставку.\n'
+        'Отследить посылку можно в личном кабинете магазина.\n'
+        'Спасибо, что выбрали наш магазин.\n'
+        'С уважением, служба доставки.\n'
+    )
+
+
+SAMPLES = [make_text(number).encode('utf-8') for number in range(50)]
+
+
+class CompressTest(TestCase):
+
+    def check_round_trip(self, codec):
+        zdict = train_dictionary(SAMPLES, 4096, codec)
+        self.assertTrue(zdict)
+        data = make_text(1000).encode('utf-8')
+        with_dict = compress(data, codec, zdict)
+        without_dict = compress(data, codec, None)
+        self.assertEqual(decompress(with_dict, codec, zdict), data)
+        self.assertEqual(decompress(without_dict, codec, None), data)
+        self.assertLess(len(with_dict), len(without_dict))
+
+    def test_zlib_round_trip(self):
+        self.check_round_trip(ZLIB)
+
+    @skipIf(zstandard is None, 'пакет zstandard не установлен')
+    def test_zstd_round_trip(self):
+        self.check_round_trip(ZSTD)
+
+
+@override_settings(BODY_COMPRESSION_MIN_SIZE=10)
+class RecompressSharedBodyTest(DatabaseTestCase):
+
+    def setUp(self):
+        self.first = Email.objects.create(
+            email='first@yandex.ru', password='secret', provider='YANDEX',
+        )
+        self.second = Email.objects.create(
+            email='second@yandex.ru', password='secret', provider='YANDEX',
+        )
+        own = make_data_msg(self.first, '1', text=make_text(1))
+        own['message_id'] = '<own@shop.ru>'
+        self.own = save_data_in_db(own, []).body
+        self.shared = save_data_in_db(
+            make_data_msg(self.first, '2', text=make_text(2)), []
+        ).body
+        save_data_in_db(
+            make_data_msg(self.second, '2', text=make_text(2)), []
+        )
+        self.dictionaries = [
+            CompressionDictionary.objects.create(
+                email=account, sender='', codec=ZLIB,
+                data=train_dictionary(SAMPLES, 4096, ZLIB),
+            )
+            for account in (self.first, self.second)
+        ]
+
+    def test_shared_body_has_no_dictionary(self):
+        recompress_account(self.first)
+        stats = recompress_account(self.second)
+        own = MessageBody.objects.get(id=self.own.id)
+        shared = MessageBody.objects.get(id=self.shared.id)
+        self.assertEqual(own.dictionary, self.dictionaries[0])
+        self.assertIsNotNone(shared.compressed_text)
+        self.assertIsNone(shared.dictionary)
+        self.assertEqual(shared.text, make_text(2))
+        self.assertEqual(own.text, make_text(1))
+        self.assertEqual(stats['shared'], 1)
@@ -0,0 +1,66 @@
+from copy import copy
+
+from channels.testing import WebsocketCommunicator
+from django.test import TestCase, override_settings
+
+from messages.consumers import MyConsumer
+from msg.models import Email
+from msg.services import save_data_in_db, send_email_by_websocket
+
+from .test_services import make_data_msg
+
+
+@override_settings(CHANNEL_LAYERS={
+    'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'},
+})
+class ReplayTest(TestCase):
+
+    def setUp(self):
+        self.account = Email.objects.create(
+            email='replay@yandex.ru', password='secret', provider='YANDEX',
+        )
+        self.other = Email.objects.create(
+            email='other@yandex.ru', password='secret', provider='YANDEX',
+        )
+        self.messages = [
+            save_data_in_db(
+                make_data_msg(self.account, str(uid), text=f'Текст {uid}'),
+                [],
+            )
+            for uid in range(1, 4)
+        ]
+
+    async def connect(self, since):
+        communicator = WebsocketCommunicator(
+            MyConsumer.as_asgi(),
+            f'/ws/msg/?email={self.account.email}&since={since}',
+        )
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        established = await communicator.receive_json_from()
+        self.assertEqual(established['type'], 'connection_established')
+        return communicator
+
+    async def test_replay_and_live_events(self):
+        communicator = await self.connect(self.messages[0].id)
+        replayed = [
+            (await communicator.receive_json_from())['email_data']['id']
+            for _ in range(2)
+        ]
+        self.assertEqual(
+            replayed, [message.id for message in self.messages[1:]],
+        )
+
+        # Уже досланное письмо и письмо другого ящика не повторяются
+        await send_email_by_websocket(self.messages[2])
+        other = copy(self.messages[2])
+        other.email_id = self.other.id
+        await send_email_by_websocket(other)
+        self.assertTrue(await communicator.receive_nothing(timeout=0.2))
+
+        new = copy(self.messages[2])
+        new.id = self.messages[2].id + 1
+        await send_email_by_websocket(new)
+        event = await communicator.receive_json_from()
+        self.assertEqual(event['email_data']['id'], new.id)
+        await communicator.disconnect()
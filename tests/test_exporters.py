@@ -0,0 +1,57 @@
+import mailbox
+from datetime import datetime
+from email import policy
+from email.parser import BytesParser
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from django.test import TestCase
+
+from msg.exporters import export_mbox, get_export_queryset
+from msg.models import Email
+from msg.services import save_data_in_db
+
+FOLDED_SUBJECT = (
+    'Very long plain ASCII subject that the mail server folded\n'
+    ' onto a second line'
+)
+
+
+class ExportMboxTest(TestCase):
+
+    def setUp(self):
+        self.account = Email.objects.create(
+            email='export@yandex.ru', password='secret', provider='YANDEX',
+        )
+        save_data_in_db({
+            'email': self.account,
+            'email_from': 'Shop\r\n <shop@mail.ru>',
+            'title': FOLDED_SUBJECT,
+            'dispatch_date': datetime(2024, 5, 1, 12, 0),
+            'receipt_date': datetime(2024, 5, 1, 12, 5),
+            'msg_read': True,
+            'files': [],
+            'text': 'Текст письма\nFrom the shop',
+            'message_id': '<order@shop.ru>',
+            'in_reply_to': '',
+            'references': '',
+            'uid': '1',
+            'uid_validity': 1,
+        }, [])
+
+    def test_folded_headers(self):
+        content = b''.join(export_mbox(get_export_queryset(self.account)))
+        with TemporaryDirectory() as directory:
+            path = Path(directory) / 'export.mbox'
+            path.write_bytes(content)
+            messages = list(mailbox.mbox(
+                path, BytesParser(policy=policy.default).parse
+            ))
+        self.assertEqual(len(messages), 1)
+        self.assertEqual(
+            messages[0]['Subject'].strip(),
+            'Very long plain ASCII subject that the mail server folded '
+            'onto a second line',
+        )
+        self.assertEqual(messages[0]['From'], 'Shop <shop@mail.ru>')
+        self.assertIn(b'>From the shop', content)
@@ -0,0 +1,65 @@
+import mailbox
+from email.message import EmailMessage
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from django.test import TransactionTestCase
+
+from msg.constants import IMPORT_UID_VALIDITY
+from msg.importers import import_mailbox
+from msg.models import Email, MessageData
+
+
+def make_message(number):
+    """Письмо архива."""
+    message = EmailMessage()
+    message['From'] = 'shop@mail.ru'
+    message['Subject'] = f'Order {number}'
+    message['Date'] = f'Wed, 0{number} May 2024 12:00:00 +0300'
+    message['Message-ID'] = f'<order-{number}@shop.ru>'
+    message.set_content(f'Заказ {number} передан в доставку.')
+    return message
+
+
+class ImportMailboxTest(TransactionTestCase):
+    # Импорт закрывает соединения с БД перед запуском процессов разбора,
+    # поэтому тест не может идти внутри транзакции
+
+    def setUp(self):
+        self.first = Email.objects.create(
+            email='first@yandex.ru', password='secret', provider='YANDEX',
+        )
+        self.second = Email.objects.create(
+            email='second@yandex.ru', password='secret', provider='YANDEX',
+        )
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = Path(directory.name) / 'archive.mbox'
+        archive = mailbox.mbox(self.path)
+        for number in (1, 2, 1):
+            archive.add(make_message(number))
+        archive.close()
+
+    def test_reimport_and_other_account(self):
+        stats = import_mailbox(self.first, [self.path], workers=2)
+        self.assertEqual(
+            (stats['read'], stats['imported'], stats['skipped']), (3, 2, 1),
+        )
+        stats = import_mailbox(self.first, [self.path], workers=2)
+        self.assertEqual((stats['imported'], stats['skipped']), (0, 3))
+        stats = import_mailbox(self.second, [self.path], workers=2)
+        self.assertEqual(stats['imported'], 2)
+
+        messages = MessageData.objects.filter(email=self.first)
+        self.assertEqual(
+            set(messages.values_list('uid_validity', flat=True)),
+            {IMPORT_UID_VALIDITY},
+        )
+        self.assertTrue(all(
+            uid.startswith(f'import-{self.first.id}-')
+            for uid in messages.values_list('uid', flat=True)
+        ))
+        self.assertEqual(
+            sorted(messages.values_list('title', flat=True)),
+            ['Order 1', 'Order 2'],
+        )
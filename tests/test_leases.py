@@ -0,0 +1,74 @@
+from datetime import timedelta
+
+from django.test import TestCase
+from django.utils import timezone
+
+from msg.leases import (
+    acquire_leases, get_due_accounts, get_owned_accounts, heartbeat,
+    holds_lease, mark_synced, rebalance, release_all, release_excess,
+    request_sync,
+)
+from msg.models import Email, SyncNode, SyncState
+
+
+class LeaseTest(TestCase):
+
+    def setUp(self):
+        self.accounts = [
+            Email.objects.create(
+                email=f'lease{number}@yandex.ru', password='secret',
+                provider='YANDEX',
+            ).id
+            for number in range(5)
+        ]
+
+    def test_rebalance_splits_accounts_between_live_nodes(self):
+        self.assertEqual(len(rebalance('node-a')), 5)
+
+        heartbeat('node-b')
+        self.assertEqual(len(rebalance('node-a')), 3)
+        self.assertEqual(len(rebalance('node-b')), 2)
+        owned = set(get_owned_accounts('node-a'))
+        self.assertFalse(owned & set(get_owned_accounts('node-b')))
+
+    def test_acquire_skips_live_leases_and_takes_expired(self):
+        rebalance('node-a')
+        self.assertEqual(acquire_leases('node-b', 5), [])
+
+        SyncState.objects.filter(email_id=self.accounts[0]).update(
+            lease_expires_at=timezone.now() - timedelta(seconds=1),
+        )
+        self.assertEqual(acquire_leases('node-b', 5), [self.accounts[0]])
+        self.assertTrue(holds_lease('node-b', self.accounts[0]))
+        self.assertFalse(holds_lease('node-a', self.accounts[0]))
+
+    def test_release_excess_keeps_busy_accounts(self):
+        rebalance('node-a')
+        busy = self.accounts[-2:]
+        self.assertEqual(release_excess('node-a', 1, busy), 3)
+        self.assertEqual(sorted(get_owned_accounts('node-a')), busy)
+
+    def test_release_all(self):
+        rebalance('node-a')
+        release_all('node-a')
+        self.assertEqual(get_owned_accounts('node-a'), [])
+        self.assertFalse(SyncNode.objects.filter(name='node-a').exists())
+        self.assertEqual(
+            len(acquire_leases('node-b', 5)), len(self.accounts),
+        )
+
+    def test_requested_sync_is_due_until_synced(self):
+        rebalance('node-a')
+        started_at = timezone.now()
+        for email_id in self.accounts:
+            mark_synced(email_id, started_at)
+        self.assertEqual(get_due_accounts('node-a'), [])
+
+        request_sync(self.accounts[0])
+        self.assertEqual(get_due_accounts('node-a'), [self.accounts[0]])
+
+        # Запрос, поступивший во время синхронизации, не снимается
+        mark_synced(self.accounts[0], started_at)
+        self.assertEqual(get_due_accounts('node-a'), [self.accounts[0]])
+        mark_synced(self.accounts[0], timezone.now())
+        self.assertEqual(get_due_accounts('node-a'), [])
@@ -0,0 +1,89 @@
+import json
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+
+from msg.models import Email
+from msg.onboarding import (CREATED, EXISTS, INVALID, LOGIN_FAILED, VERIFIED,
+                            onboard_accounts, parse_accounts)
+
+
+class OnboardAccountsTest(TestCase):
+
+    def test_parse_csv(self):
+        self.assertEqual(
+            parse_accounts('email,password\n a@yandex.ru ,secret\n', 'csv'),
+            [{'email': 'a@yandex.ru', 'password': 'secret', 'provider': ''}],
+        )
+
+    def test_parse_rejects_non_list(self):
+        with self.assertRaises(ValueError):
+            parse_accounts('{"accounts": "a@yandex.ru"}', 'json')
+
+    @mock.patch('msg.onboarding.verify_login')
+    def test_statuses(self, verify_login):
+        Email.objects.create(
+            email='old@yandex.ru', password='secret', provider='YANDEX',
+        )
+        verify_login.side_effect = lambda account: (
+            'Ошибка входа' if account['email'] == 'bad@mail.ru' else None
+        )
+        results = onboard_accounts([
+            {'email': 'new@yandex.ru', 'password': 'secret', 'provider': ''},
+            {'email': 'new@yandex.ru', 'password': 'secret', 'provider': ''},
+            {'email': 'old@yandex.ru', 'password': 'secret', 'provider': ''},
+            {'email': 'bad@mail.ru', 'password': 'secret', 'provider': ''},
+            {'email': 'a@other.ru', 'password': 'secret', 'provider': ''},
+            {'email': 'b@gmail.com', 'password': 'secret',
+             'provider': 'YANDEX'},
+        ])
+        self.assertEqual(
+            [result['status'] for result in results],
+            [CREATED, INVALID, EXISTS, LOGIN_FAILED, INVALID, INVALID],
+        )
+        account = Email.objects.get(email='new@yandex.ru')
+        self.assertEqual(account.provider, 'YANDEX')
+        self.assertNotEqual(account.password, 'secret')
+
+    @mock.patch('msg.onboarding.verify_login', return_value=None)
+    def test_dry_run_saves_nothing(self, verify_login):
+        results = onboard_accounts([
+            {'email': 'new@yandex.ru', 'password': 'secret', 'provider': ''},
+        ], save=False)
+        self.assertEqual(results[0]['status'], VERIFIED)
+        self.assertFalse(Email.objects.exists())
+
+
+@mock.patch('msg.onboarding.verify_login', return_value=None)
+class OnboardViewTest(TransactionTestCase):
+    # Проверка входа идет в отдельном потоке со своим соединением с БД,
+    # поэтому данные теста должны быть сохранены
+
+    body = json.dumps([{'email': 'new@yandex.ru', 'password': 'secret'}])
+
+    def post(self, query=''):
+        return self.client.post(
+            reverse('msg:onboard') + query, self.body,
+            content_type='application/json',
+        )
+
+    def test_anonymous_forbidden(self, verify_login):
+        response = self.post('?dry_run=1')
+        self.assertEqual(response.status_code, 403)
+        verify_login.assert_not_called()
+
+    def test_non_staff_forbidden(self, verify_login):
+        self.client.force_login(User.objects.create_user('user'))
+        self.assertEqual(self.post('?dry_run=1').status_code, 403)
+        verify_login.assert_not_called()
+
+    def test_staff(self, verify_login):
+        self.client.force_login(
+            User.objects.create_user('admin', is_staff=True)
+        )
+        response = self.post()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][0]['status'], CREATED)
+        self.assertTrue(Email.objects.filter(email='new@yandex.ru').exists())
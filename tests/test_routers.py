@@ -0,0 +1,90 @@
+import time
+from unittest import mock
+
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from msg import routers
+from msg.middleware import REPLICA_PIN_COOKIE, ReplicaRoutingMiddleware
+from msg.models import Email
+from msg.routers import (ReplicaRouter, require_fresh, routing_state,
+                         start_request, untracked_writes)
+
+
+@override_settings(
+    DATABASE_REPLICAS=['replica_1'], REPLICA_MAX_LAG=5,
+    REPLICA_LAG_CHECK_INTERVAL=5,
+)
+class ReplicaRouterTest(SimpleTestCase):
+
+    def setUp(self):
+        routers._lag_checks.clear()
+        self.addCleanup(routers._lag_checks.clear)
+        self.addCleanup(routing_state.set, None)
+        patcher = mock.patch('msg.routers.measure_lag', return_value=1.0)
+        self.measure_lag = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.router = ReplicaRouter()
+
+    def test_reads_outside_request_use_primary(self):
+        routing_state.set(None)
+        self.assertEqual(self.router.db_for_read(Email), 'default')
+
+    def test_read_after_write_uses_primary(self):
+        start_request(use_replicas=True)
+        self.assertEqual(self.router.db_for_read(Email), 'replica_1')
+        self.router.db_for_write(Email)
+        self.assertEqual(self.router.db_for_read(Email), 'default')
+
+    def test_untracked_writes_keep_replicas(self):
+        start_request(use_replicas=True)
+        with untracked_writes():
+            self.router.db_for_write(Email)
+        self.assertEqual(self.router.db_for_read(Email), 'replica_1')
+
+    def test_lagging_replica_is_skipped(self):
+        self.measure_lag.return_value = 10.0
+        start_request(use_replicas=True)
+        self.assertEqual(self.router.db_for_read(Email), 'default')
+
+    def test_require_fresh(self):
+        start_request(use_replicas=True)
+        require_fresh(time.time() - 10)
+        self.assertEqual(self.router.db_for_read(Email), 'replica_1')
+
+        # Реплика отстает на секунду и еще не получила новую версию
+        require_fresh(time.time())
+        self.assertEqual(self.router.db_for_read(Email), 'default')
+
+    def test_lag_is_checked_once_per_interval(self):
+        start_request(use_replicas=True)
+        for _ in range(3):
+            self.router.db_for_read(Email)
+        self.assertEqual(self.measure_lag.call_count, 1)
+
+
+@override_settings(DATABASE_REPLICAS=['replica_1'], REPLICA_PIN_SECONDS=15)
+class ReplicaRoutingMiddlewareTest(SimpleTestCase):
+
+    def setUp(self):
+        self.addCleanup(routing_state.set, None)
+        self.factory = RequestFactory()
+
+    def get_response(self, request):
+        if request.method == 'POST':
+            ReplicaRouter().db_for_write(Email)
+        return HttpResponse()
+
+    def test_write_pins_client_to_primary(self):
+        middleware = ReplicaRoutingMiddleware(self.get_response)
+        response = middleware(self.factory.post('/'))
+        self.assertEqual(response.cookies[REPLICA_PIN_COOKIE]['max-age'], 15)
+
+        middleware(self.factory.get('/'))
+        self.assertTrue(routing_state.get().use_replicas)
+
+        request = self.factory.get('/')
+        request.COOKIES[REPLICA_PIN_COOKIE] = '1'
+        response = middleware(request)
+        self.assertFalse(routing_state.get().use_replicas)
+        self.assertNotIn(REPLICA_PIN_COOKIE, response.cookies)
@@ -0,0 +1,114 @@
+from datetime import date, timedelta
+from types import SimpleNamespace
+from unittest import TestCase
+
+from msg.constants import (BEFORE, EXCLUDE, INCLUDE, LARGER, SENDER, SINCE,
+                           SMALLER, SUBJECT)
+from msg.rules import compile_rules, format_imap_date, matches_rules
+
+
+def make_rule(kind, value, action=INCLUDE, is_regex=False):
+    """Правило загрузки без базы данных."""
+    return SimpleNamespace(
+        kind=kind, value=value, action=action, is_regex=is_regex,
+    )
+
+
+class CompileRulesTest(TestCase):
+
+    def test_no_rules(self):
+        self.assertEqual(compile_rules([]), (['UNSEEN'], []))
+
+    def test_includes_of_one_kind_are_joined_with_or(self):
+        criteria, local_rules = compile_rules([
+            make_rule(SENDER, 'a@shop.ru'),
+            make_rule(SENDER, '@bank.ru'),
+            make_rule(SUBJECT, 'Заказ'),
+        ])
+        self.assertEqual(
+            criteria, ['UNSEEN', 'OR FROM "a@shop.ru" FROM "@bank.ru"'],
+        )
+        self.assertEqual(len(local_rules), 1)
+        self.assertEqual(local_rules[0].kind, SUBJECT)
+
+    def test_exclude_text_rule(self):
+        criteria, local_rules = compile_rules([
+            make_rule(SUBJECT, 'say "hi"', EXCLUDE),
+        ])
+        self.assertEqual(criteria, ['UNSEEN', 'NOT SUBJECT "say \\"hi\\""'])
+        self.assertEqual(local_rules, [])
+
+    def test_regex_include_moves_kind_to_headers(self):
+        rules = [
+            make_rule(SENDER, 'a@shop.ru'),
+            make_rule(SENDER, r'@(shop|bank)\.ru$', is_regex=True),
+        ]
+        criteria, local_rules = compile_rules(rules)
+        self.assertEqual(criteria, ['UNSEEN'])
+        self.assertEqual(local_rules, rules)
+
+    def test_size_and_date_rules(self):
+        criteria, _ = compile_rules([
+            make_rule(LARGER, '1000'),
+            make_rule(SMALLER, '5000'),
+            make_rule(SINCE, '2024-01-05'),
+            make_rule(BEFORE, '2024-12-31'),
+        ])
+        self.assertEqual(criteria, [
+            'UNSEEN', 'LARGER 1000', 'SMALLER 5000',
+            'SINCE 05-Jan-2024', 'BEFORE 31-Dec-2024',
+        ])
+
+    def test_exclude_size_and_date_rules_are_negated(self):
+        criteria, _ = compile_rules([
+            make_rule(LARGER, '1000', EXCLUDE),
+            make_rule(SINCE, '7', EXCLUDE),
+        ])
+        since = format_imap_date(date.today() - timedelta(days=7))
+        self.assertEqual(criteria, [
+            'UNSEEN', 'NOT LARGER 1000', f'NOT SINCE {since}',
+        ])
+
+
+class MatchesRulesTest(TestCase):
+
+    headers = {'From': 'Shop <news@shop.ru>', 'Subject': 'Скидки недели'}
+
+    def test_no_rules(self):
+        self.assertTrue(matches_rules([], self.headers))
+
+    def test_include_needs_one_match_per_kind(self):
+        rules = [
+            make_rule(SENDER, '@bank.ru'),
+            make_rule(SENDER, '@shop.ru'),
+            make_rule(SUBJECT, 'скидки'),
+        ]
+        self.assertTrue(matches_rules(rules, self.headers))
+        self.assertFalse(matches_rules(rules[:1], self.headers))
+        self.assertFalse(matches_rules(
+            rules[1:2] + [make_rule(SUBJECT, 'заказ')], self.headers,
+        ))
+
+    def test_exclude_wins(self):
+        rules = [
+            make_rule(SENDER, '@shop.ru'),
+            make_rule(SUBJECT, 'СКИДКИ', EXCLUDE),
+        ]
+        self.assertFalse(matches_rules(rules, self.headers))
+
+    def test_regex(self):
+        self.assertTrue(matches_rules(
+            [make_rule(SENDER, r'@(shop|bank)\.ru>$', is_regex=True)],
+            self.headers,
+        ))
+        self.assertFalse(matches_rules(
+            [make_rule(SUBJECT, r'^недели', is_regex=True)], self.headers,
+        ))
+
+    def test_missing_header(self):
+        self.assertFalse(matches_rules(
+            [make_rule(SUBJECT, 'скидки')], {'From': 'news@shop.ru'},
+        ))
+        self.assertTrue(matches_rules(
+            [make_rule(SUBJECT, 'скидки', EXCLUDE)], {},
+        ))
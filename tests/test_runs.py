@@ -0,0 +1,68 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.test import TestCase
+from django.utils import timezone
+
+from msg.constants import INTERACTIVE
+from msg.models import Email, SyncRun
+from msg.runs import SyncRunRecorder, get_throughput_trends
+
+
+class SyncRunTest(TestCase):
+
+    def setUp(self):
+        self.account = Email.objects.create(
+            email='runs@yandex.ru', password='secret', provider='YANDEX',
+        )
+        started_at = timezone.now() - timedelta(hours=1)
+        for throughput in (90, 100, 110):
+            SyncRun.objects.create(
+                email=self.account, kind=INTERACTIVE, started_at=started_at,
+                finished_at=started_at, duration=1, messages_new=throughput,
+                throughput=throughput,
+            )
+
+    def record(self, duration, messages_new=10):
+        clock = iter([0.0, float(duration)])
+        with mock.patch(
+            'msg.runs.time.perf_counter', side_effect=lambda: next(clock),
+        ):
+            with SyncRunRecorder(self.account, INTERACTIVE) as recorder:
+                recorder.run.messages_new = messages_new
+        recorder.run.refresh_from_db()
+        return recorder.run
+
+    def test_slow_run_is_flagged_against_median(self):
+        run = self.record(duration=1)
+        self.assertEqual(run.baseline, 100)
+        self.assertEqual(run.throughput, 10)
+        self.assertTrue(run.is_slow)
+
+    def test_normal_run_is_not_flagged(self):
+        run = self.record(duration=0.2)
+        self.assertEqual(run.throughput, 50)
+        self.assertFalse(run.is_slow)
+
+    def test_failed_run_keeps_error_and_is_excluded_from_baseline(self):
+        with self.assertRaises(ConnectionError):
+            with SyncRunRecorder(self.account, INTERACTIVE) as recorder:
+                recorder.run.messages_new = 1
+                recorder.run.throughput = 1
+                raise ConnectionError('timeout')
+        recorder.run.refresh_from_db()
+        self.assertEqual(recorder.run.error_class, 'ConnectionError')
+        self.assertIsNotNone(recorder.run.finished_at)
+
+        self.assertEqual(self.record(duration=1).baseline, 100)
+
+    def test_throughput_trends(self):
+        self.record(duration=1)
+        trends = get_throughput_trends(days=1)
+        [row] = trends['accounts']
+        self.assertEqual(row['email__email'], self.account.email)
+        self.assertEqual(row['runs'], 4)
+        self.assertEqual(row['slow_runs'], 1)
+        self.assertEqual(row['messages_new'], 310)
+        self.assertEqual(row['messages_per_second'], 77.5)
+        self.assertEqual(trends['providers'][0]['email__provider'], 'YANDEX')
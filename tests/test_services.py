@@ -0,0 +1,108 @@
+from datetime import datetime
+
+from django.test import TestCase
+
+from msg.constants import IMPORT_UID_VALIDITY
+from msg.models import Email, MessageData
+from msg.services import (claim_unknown_validity, save_data_in_db,
+                          save_messages_in_db_bulk)
+
+
+def make_data_msg(email_account, uid, uid_validity=1, text='Текст'):
+    """Данные письма в формате `get_mail_data`."""
+    return {
+        'email': email_account,
+        'email_from': 'shop@mail.ru',
+        'title': 'Заказ',
+        'dispatch_date': datetime(2024, 5, 1, 12, 0),
+        'receipt_date': datetime(2024, 5, 1, 12, 5),
+        'msg_read': True,
+        'files': [],
+        'text': text,
+        'message_id': '<order@shop.ru>',
+        'in_reply_to': '',
+        'references': '',
+        'uid': uid,
+        'uid_validity': uid_validity,
+    }
+
+
+class MessageUidTest(TestCase):
+
+    def setUp(self):
+        self.first = Email.objects.create(
+            email='first@yandex.ru', password='secret', provider='YANDEX',
+        )
+        self.second = Email.objects.create(
+            email='second@yandex.ru', password='secret', provider='YANDEX',
+        )
+
+    def test_same_uid_on_two_accounts(self):
+        first = save_data_in_db(make_data_msg(self.first, '1'), [])
+        second = save_data_in_db(make_data_msg(self.second, '1'), [])
+        self.assertIsNotNone(first)
+        self.assertIsNotNone(second)
+        self.assertEqual(
+            MessageData.objects.filter(uid='1').count(), 2,
+        )
+        self.assertEqual(first.body_id, second.body_id)
+
+    def test_same_uid_after_uid_validity_change(self):
+        save_data_in_db(make_data_msg(self.first, '1', 1), [])
+        save_data_in_db(make_data_msg(self.first, '1', 2, 'Другой'), [])
+        self.assertEqual(
+            MessageData.objects.filter(email=self.first, uid='1').count(), 2,
+        )
+
+    def test_bulk_skips_only_same_account_uids(self):
+        save_data_in_db(make_data_msg(self.first, '1'), [])
+        created = save_messages_in_db_bulk([
+            (make_data_msg(self.first, '1'), []),
+            (make_data_msg(self.second, '1'), []),
+            (make_data_msg(self.second, '1'), []),
+            (make_data_msg(self.second, '2', IMPORT_UID_VALIDITY), []),
+        ])
+        self.assertEqual(
+            [(message.email_id, message.uid) for message in created],
+            [(self.second.id, '1'), (self.second.id, '2')],
+        )
+
+    def test_claim_unknown_validity(self):
+        save_data_in_db(make_data_msg(self.first, '1', None), [])
+        save_data_in_db(make_data_msg(self.second, '1', None), [])
+        claim_unknown_validity(self.first, 7)
+        self.assertEqual(
+            list(MessageData.objects.order_by('email_id').values_list(
+                'uid_validity', flat=True
+            )),
+            [7, None],
+        )
+
+
+class SaveDataTest(TestCase):
+
+    def setUp(self):
+        self.account = Email.objects.create(
+            email='save@yandex.ru', password='secret', provider='YANDEX',
+        )
+
+    def test_copies_share_body(self):
+        other = Email.objects.create(
+            email='copy@yandex.ru', password='secret', provider='YANDEX',
+        )
+        first = save_data_in_db(make_data_msg(self.account, '1'), [])
+        copy = save_data_in_db(make_data_msg(other, '5'), [])
+        changed = save_data_in_db(
+            make_data_msg(other, '6', text='Другой текст'), []
+        )
+        self.assertEqual(first.body_id, copy.body_id)
+        self.assertNotEqual(first.body_id, changed.body_id)
+        self.assertEqual(copy.text, 'Текст')
+
+    def test_failed_save_returns_none(self):
+        save_data_in_db(make_data_msg(self.account, '1'), [])
+        duplicate = save_data_in_db(make_data_msg(self.account, '1'), [])
+        self.assertIsNone(duplicate)
+        self.assertEqual(
+            MessageData.objects.filter(email=self.account).count(), 1,
+        )
@@ -0,0 +1,77 @@
+from datetime import date, datetime, timedelta
+
+from django.test import TestCase
+
+from msg.models import DailyStat, Email, SenderStat
+from msg.services import save_data_in_db
+from msg.stats import get_account_stats, rebuild_stats, update_stats
+
+from .test_services import make_data_msg
+
+
+class StatsTest(TestCase):
+
+    def setUp(self):
+        self.account = Email.objects.create(
+            email='stats@yandex.ru', password='secret', provider='YANDEX',
+        )
+        today = datetime.combine(date.today(), datetime.min.time())
+        self.messages = []
+        for uid, email_from, days_ago in (
+            ('1', 'shop@mail.ru', 1),
+            ('2', 'Магазин <SHOP@mail.ru>', 0),
+            ('3', 'news@mail.ru', 0),
+        ):
+            data_msg = make_data_msg(self.account, uid)
+            data_msg['email_from'] = email_from
+            data_msg['receipt_date'] = today - timedelta(days=days_ago)
+            self.messages.append(save_data_in_db(data_msg, []))
+
+    def get_senders(self):
+        return dict(
+            SenderStat.objects.filter(email=self.account).values_list(
+                'sender', 'message_count'
+            )
+        )
+
+    def test_saved_messages_are_counted(self):
+        self.assertEqual(
+            self.get_senders(), {'shop@mail.ru': 2, 'news@mail.ru': 1},
+        )
+        self.assertEqual(
+            SenderStat.objects.get(sender='shop@mail.ru').last_receipt_date,
+            date.today(),
+        )
+        self.assertEqual(
+            DailyStat.objects.get(day=date.today()).message_count, 2,
+        )
+
+    def test_subtract_removes_empty_rows(self):
+        update_stats(self.messages[1:], sign=-1)
+        self.assertEqual(self.get_senders(), {'shop@mail.ru': 1})
+        self.assertFalse(DailyStat.objects.filter(day=date.today()).exists())
+
+    def test_repeated_add_accumulates(self):
+        update_stats(self.messages[:1])
+        self.assertEqual(self.get_senders()['shop@mail.ru'], 3)
+
+    def test_rebuild_matches_messages(self):
+        update_stats(self.messages)
+        self.assertEqual(
+            rebuild_stats(self.account),
+            {'messages': 3, 'senders': 2, 'days': 2},
+        )
+        self.assertEqual(
+            self.get_senders(), {'shop@mail.ru': 2, 'news@mail.ru': 1},
+        )
+
+    def test_account_stats(self):
+        stats = get_account_stats(self.account, top=1, days=3)
+        self.assertEqual(
+            [sender['sender'] for sender in stats['top_senders']],
+            ['shop@mail.ru'],
+        )
+        self.assertEqual(
+            [day['messages'] for day in stats['daily']], [0, 1, 2],
+        )
+        self.assertEqual(stats['period_total'], 3)
@@ -0,0 +1,41 @@
+from unittest import mock
+
+from django.test import TestCase
+
+from msg.models import Email, MessageThread
+from msg.services import save_data_in_db
+from msg.threads import rebuild_threads
+
+from .test_services import make_data_msg
+
+
+class RebuildThreadsTest(TestCase):
+
+    def setUp(self):
+        self.account = Email.objects.create(
+            email='threads@yandex.ru', password='secret', provider='YANDEX',
+        )
+        for uid, message_id, reply_to in (
+                ('1', '<a@shop.ru>', ''),
+                ('2', '<b@shop.ru>', '<a@shop.ru>'),
+                ('3', '<c@shop.ru>', '<b@shop.ru>')):
+            data_msg = make_data_msg(self.account, uid, text=f'Текст {uid}')
+            data_msg.update(message_id=message_id, in_reply_to=reply_to)
+            save_data_in_db(data_msg, [])
+
+    def get_threads(self):
+        return list(MessageThread.objects.filter(
+            email=self.account
+        ).values_list('message_count', flat=True))
+
+    def test_rebuild_keeps_threads(self):
+        self.assertEqual(self.get_threads(), [3])
+        self.assertEqual(rebuild_threads(self.account, batch_size=2), 3)
+        self.assertEqual(self.get_threads(), [3])
+
+    def test_failed_rebuild_keeps_old_threads(self):
+        with mock.patch(
+                'msg.threads.assign_threads', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                rebuild_threads(self.account)
+        self.assertEqual(self.get_threads(), [3])
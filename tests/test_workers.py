@@ -0,0 +1,55 @@
+import threading
+from unittest import TestCase
+
+from msg.workers import BACKFILL_PRIORITY, EmbeddedWorker
+
+
+class EmbeddedWorkerTest(TestCase):
+
+    def setUp(self):
+        self.worker = EmbeddedWorker(threads=2, queue_size=10)
+        self.addCleanup(self.worker.shutdown, 5)
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.calls = []
+        self.calls_lock = threading.Lock()
+
+    def task(self, value):
+        with self.calls_lock:
+            self.calls.append(value)
+        self.started.set()
+        self.release.wait(5)
+
+    def test_queued_key_is_not_duplicated(self):
+        blocker = EmbeddedWorker(threads=1, queue_size=10)
+        self.addCleanup(blocker.shutdown, 5)
+        blocker.submit('block', self.task, 'block')
+        self.assertTrue(self.started.wait(5))
+        self.assertTrue(blocker.submit(('sync', 1), self.task, 1))
+        self.assertTrue(blocker.submit(('sync', 1), self.task, 1))
+        self.assertEqual(blocker.stats()['queued'], 1)
+        self.release.set()
+        blocker.shutdown(5)
+        self.assertEqual(self.calls, ['block', 1])
+
+    def test_active_key_runs_again_after_finishing(self):
+        self.assertTrue(self.worker.submit(('sync', 1), self.task, 1))
+        self.assertTrue(self.started.wait(5))
+        # Пока синхронизация идет, второй поток свободен, но повтор
+        # не должен выполняться параллельно
+        self.assertTrue(self.worker.submit(('sync', 1), self.task, 2))
+        self.assertTrue(self.worker.submit(('sync', 1), self.task, 3))
+        stats = self.worker.stats()
+        self.assertEqual((stats['running'], stats['pending']), (1, 1))
+        self.assertEqual(self.calls, [1])
+        self.release.set()
+        self.worker.shutdown(5)
+        self.assertEqual(self.calls, [1, 3])
+
+    def test_rejects_after_shutdown(self):
+        self.worker.shutdown(5)
+        self.assertFalse(self.worker.submit(
+            ('backfill', 1), self.task, 1, priority=BACKFILL_PRIORITY,
+        ))
+        self.assertEqual(self.worker.stats()['rejected'], 1)
+        self.assertEqual(self.calls, [])